@@ -1,21 +1,53 @@
+import datetime
+import hashlib
+import json
+import re
+import threading
+from concurrent import futures
+
 from pyatlan.cache.role_cache import RoleCache
 from pyatlan.client.atlan import AtlanClient
-from pyatlan.errors import NotFoundError
+from pyatlan.errors import AtlanError
 from pyatlan.model.assets import (
+    Asset,
     Connection,
     S3Bucket,
     S3Object,
     Process,
     Table,
+    Database,
+    Schema,
 )
-from pyatlan.model.enums import AtlanConnectorType
+from pyatlan.model.enums import AtlanConnectorType, EntityStatus
 from pyatlan.model.fluent_search import FluentSearch, CompoundQuery
 
-from constants import ASSET_TYPES
+from constants import DEFAULT_BATCH_SIZE, SEARCH_PAGE_SIZE, logger
+from execution import call_with_retry, run_concurrently
+from metrics import METRICS
+
+
+ASSET_TYPES = {
+    "Connection": Connection,
+    "S3Bucket": S3Bucket,
+    "S3Object": S3Object,
+    "Process": Process,
+    "Database": Database,
+    "Schema": Schema,
+    "Table": Table,
+}
+
+# role guids resolved once per lambda container
+ROLE_GUIDS = {}
+
+
+def get_role_guid(role_name):
+    if role_name not in ROLE_GUIDS:
+        ROLE_GUIDS[role_name] = RoleCache.get_id_for_name(role_name)
+    return ROLE_GUIDS[role_name]
 
 
 def create_or_update_atlan_s3_connection(atlan_client: AtlanClient, name, qualified_name):
-    admin_role_guid = RoleCache.get_id_for_name("$admin")
+    admin_role_guid = get_role_guid("$admin")
     s3_connection = Connection.creator(
         name=name,
         connector_type=AtlanConnectorType.S3,
@@ -42,22 +74,29 @@ def create_or_update_atlan_s3_bucket(
         aws_arn=bucket_aws_arn,
     )
     s3bucket.qualified_name = bucket_qualified_name
-    s3bucket.s3_object_count = bucket_object_count
+    if bucket_object_count is not None:
+        s3bucket.s3_object_count = bucket_object_count
     s3bucket.owner_users = asset_owners
     response = atlan_client.asset.save(s3bucket)
     bucket_guid = list(response.guid_assignments.values())[0]
     return bucket_guid
 
 
-def create_or_update_atlan_s3_object(
-    atlan_client,
+def build_atlan_s3_object(
     connection_qualified_name,
     bucket_qualified_name,
     s3_object_qualified_name,
     s3_object_name,
     s3_object_aws_arn,
-    asset_owners=None
+    asset_owners=None,
+    size=None,
+    last_modified=None,
+    storage_class=None,
+    e_tag=None,
+    csv_headers=None,
 ):
+    # size, last_modified (iso format), storage_class and e_tag come from the
+    # s3 listing, csv_headers from the sampled header line of the file
     s3_object = S3Object.creator(
         name=s3_object_name,
         connection_qualified_name=connection_qualified_name,
@@ -66,37 +105,196 @@ def create_or_update_atlan_s3_object(
     )
     s3_object.qualified_name = s3_object_qualified_name
     s3_object.owner_users = asset_owners
-    response = atlan_client.asset.save(s3_object)
-    object_guid = list(response.guid_assignments.values())[0]
-    return object_guid
+    s3_object.s3_object_key = s3_object_name
+    s3_object.s3_object_size = size
+    if last_modified:
+        s3_object.s3_object_last_modified_time = datetime.datetime.fromisoformat(
+            last_modified.replace("Z", "+00:00")
+        )
+    s3_object.s3_object_storage_class = storage_class
+    s3_object.s3_e_tag = e_tag
+    if csv_headers:
+        s3_object.description = f"columns: {', '.join(csv_headers)}"
+    return s3_object
 
 
-def retrieve_atlan_asset_by_qn(atlan_client, qualified_name, asset_type):
-    try:
-        return atlan_client.asset.get_by_qualified_name(
-            asset_type=ASSET_TYPES[asset_type], qualified_name=qualified_name
-        )
-    except NotFoundError:
-        return None
+# attributes of an s3 object compared with the existing atlan asset to decide
+# whether it needs to be saved again
+S3_OBJECT_COMPARED_FIELDS = {
+    "name": S3Object.NAME,
+    "aws_arn": S3Object.AWS_ARN,
+    "owner_users": S3Object.OWNER_USERS,
+    "s3_object_key": S3Object.S3OBJECT_KEY,
+    "s3_object_size": S3Object.S3OBJECT_SIZE,
+    "s3_object_last_modified_time": S3Object.S3OBJECT_LAST_MODIFIED_TIME,
+    "s3_object_storage_class": S3Object.S3OBJECT_STORAGE_CLASS,
+    "s3_e_tag": S3Object.S3E_TAG,
+    "description": S3Object.DESCRIPTION,
+}
+
 
+def active_or_updated_since(request, updated_since=None):
+    # active assets, or the assets updated after updated_since (epoch ms),
+    # archived ones included, to refresh an atlan state snapshot
+    if updated_since is None:
+        return request.where(CompoundQuery.active_assets())
+    return request.where(Asset.UPDATE_TIME.gt(updated_since))
 
-def retrieve_atlan_asset_by_guid(atlan_client, guid, asset_type):
-    try:
-        return atlan_client.asset.get_by_guid(
-            asset_type=ASSET_TYPES[asset_type], guid=str(guid)
+
+def fetch_s3_objects_in_bucket(
+    atlan_client, bucket_qualified_name, key_prefix=None, updated_since=None
+):
+    request = active_or_updated_since(
+        FluentSearch()
+        .where(CompoundQuery.asset_type(S3Object))
+        .where(S3Object.S3BUCKET_QUALIFIED_NAME.eq(bucket_qualified_name)),
+        updated_since,
+    )
+    if key_prefix:
+        request = request.where(
+            S3Object.QUALIFIED_NAME.startswith(f"{bucket_qualified_name}/{key_prefix}")
         )
-    except NotFoundError:
-        return None
+    for field in S3_OBJECT_COMPARED_FIELDS.values():
+        request = request.include_on_results(field)
+    request = request.page_size(SEARCH_PAGE_SIZE).to_request()
+
+    return {
+        result.qualified_name: result
+        for result in atlan_client.asset.search(request)
+        if isinstance(result, S3Object)
+    }
+
+
+def fetch_s3_objects_by_qualified_names(atlan_client, qualified_names):
+    # guids of the active s3 objects among the given qualified names
+    request = (
+        FluentSearch()
+        .where(CompoundQuery.asset_type(S3Object))
+        .where(CompoundQuery.active_assets())
+        .where(S3Object.QUALIFIED_NAME.within(qualified_names))
+        .page_size(min(len(qualified_names), SEARCH_PAGE_SIZE))
+        .to_request()
+    )
+    return {
+        result.qualified_name: result.guid
+        for result in atlan_client.asset.search(request)
+        if isinstance(result, S3Object)
+    }
+
+
+def s3_object_has_changed(existing_s3_object, s3_object):
+    for attribute_name in S3_OBJECT_COMPARED_FIELDS:
+        existing_value = getattr(existing_s3_object, attribute_name)
+        value = getattr(s3_object, attribute_name)
+        if value is None and attribute_name != "owner_users":
+            # not known by this run, e.g. headers not sampled, and left as is
+            # in atlan by the save
+            continue
+        if isinstance(existing_value, set) or isinstance(value, (set, list)):
+            existing_value, value = set(existing_value or []), set(value or [])
+        if existing_value != value:
+            return True
+    return False
+
+
+# attributes returned by the get_by_guid and get_by_qn operations
+ASSET_INFO_FIELDS = [
+    Asset.QUALIFIED_NAME,
+    Asset.OWNER_USERS,
+    Asset.OWNER_GROUPS,
+    Asset.ASSET_TAGS,
+]
+
 
+def search_assets_by_guid_or_qn(
+    atlan_client, asset_type, guids=None, qualified_names=None
+):
+    request = FluentSearch().where(CompoundQuery.asset_type(ASSET_TYPES[asset_type]))
+    if guids:
+        request = request.where(Asset.GUID.within([str(guid) for guid in guids]))
+    else:
+        request = request.where(Asset.QUALIFIED_NAME.within(qualified_names))
+    for field in ASSET_INFO_FIELDS:
+        request = request.include_on_results(field)
+    request = request.page_size(
+        min(len(guids or qualified_names), SEARCH_PAGE_SIZE)
+    ).to_request()
+
+    # an archived asset can share its qualified name with the active one,
+    # which is the one returned
+    assets = {}
+    for asset in atlan_client.asset.search(request):
+        key = asset.guid if guids else asset.qualified_name
+        if key not in assets or assets[key].status != EntityStatus.ACTIVE:
+            assets[key] = asset
+    return list(assets.values())
+
+
+def purge_atlan_assets(
+    atlan_client, assets_guids, batch_size=DEFAULT_BATCH_SIZE, concurrency=1
+):
+    # a failed batch is purged again guid by guid, so that only the guids
+    # that really fail are reported as failures
+    def purge_batch(batch):
+        try:
+            call_with_retry(atlan_client.asset.purge_by_guid, batch)
+            return batch, []
+        except AtlanError as err:
+            if len(batch) == 1:
+                logger.error(f"failed to purge {batch[0]}: {err}")
+                return [], [{"guid": batch[0], "error": str(err)}]
+        purged_guids, failures = [], []
+        for guid in batch:
+            guid_purged, guid_failures = purge_batch([guid])
+            purged_guids.extend(guid_purged)
+            failures.extend(guid_failures)
+        return purged_guids, failures
+
+    batches = [
+        [str(guid) for guid in assets_guids[start:start + batch_size]]
+        for start in range(0, len(assets_guids), batch_size)
+    ]
+    purged_guids = []
+    failures = []
+    for batch_purged_guids, batch_failures in run_concurrently(
+        purge_batch, batches, concurrency
+    ):
+        purged_guids.extend(batch_purged_guids)
+        failures.extend(batch_failures)
+    return purged_guids, failures
 
-def purge_atlan_assets(atlan_client, assets_guids):
-    for asset_guid in assets_guids:
-        atlan_client.asset.purge_by_guid(str(asset_guid))
 
+def fetch_s3_assets_to_purge(atlan_client, qualified_name):
+    # returns the guids of the lineage processes, s3 objects and s3 buckets
+    # under a bucket or a connection qualified name, in the order in which
+    # they should be purged
+    request = (
+        FluentSearch()
+        .where(CompoundQuery.asset_types([S3Bucket, S3Object]))
+        .where_some(S3Object.QUALIFIED_NAME.eq(qualified_name))
+        .where_some(S3Object.QUALIFIED_NAME.startswith(f"{qualified_name}/"))
+        .min_somes(1)
+        .include_on_results(S3Object.INPUT_TO_PROCESSES)
+        .include_on_results(S3Object.OUTPUT_FROM_PROCESSES)
+        .page_size(SEARCH_PAGE_SIZE)
+    ).to_request()
 
-def create_or_update_lineage(
-    atlan_client, process_name, process_id, connection_qualified_name, inputs, outputs, asset_owners=[]
-):    
+    processes_guids, s3_objects_guids, s3_buckets_guids = {}, [], []
+    for result in atlan_client.asset.search(request):
+        if isinstance(result, S3Bucket):
+            s3_buckets_guids.append(result.guid)
+        elif isinstance(result, S3Object):
+            s3_objects_guids.append(result.guid)
+            for process in (result.input_to_processes or []) + (
+                result.output_from_processes or []
+            ):
+                processes_guids[process.guid] = None
+    return list(processes_guids), s3_objects_guids, s3_buckets_guids
+
+
+def build_lineage_process(
+    process_name, process_id, connection_qualified_name, inputs, outputs, asset_owners=[]
+):
     atlan_process = Process.creator(
         name=process_name,
         connection_qualified_name=connection_qualified_name,
@@ -105,22 +303,463 @@ def create_or_update_lineage(
         outputs=outputs,
     )
     atlan_process.owner_users = asset_owners
-    response = atlan_client.asset.save(atlan_process)
-    process_guid = list(response.guid_assignments.values())[0]
-    return process_guid
+    return atlan_process
+
+
+def reference_qualified_name(asset):
+    # assets built locally carry their qualified name, references returned by
+    # a search or built with ref_by_qualified_name carry it in their unique
+    # attributes
+    return asset.qualified_name or (asset.unique_attributes or {}).get(
+        "qualifiedName"
+    )
+
+
+def process_fingerprint(process):
+    # digest of what a lineage process save would change in atlan
+    def references(assets):
+        return sorted(
+            [asset.type_name, reference_qualified_name(asset)] for asset in assets or []
+        )
+
+    return hashlib.sha1(
+        json.dumps(
+            [
+                process.name,
+                references(process.inputs),
+                references(process.outputs),
+                sorted(process.owner_users or []),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def search_lineage_processes(atlan_client, qualified_name_wildcards, updated_since=None):
+    # the processes matching any of the qualified name wildcards, with their
+    # inputs and outputs, in a single paged search
+    request = active_or_updated_since(
+        FluentSearch().where(CompoundQuery.asset_type(Process)), updated_since
+    )
+    for wildcard in qualified_name_wildcards:
+        request = request.where_some(Process.QUALIFIED_NAME.wildcard(wildcard))
+    request = (
+        request.min_somes(1)
+        .include_on_results(Process.NAME)
+        .include_on_results(Process.OWNER_USERS)
+        .include_on_results("inputs")
+        .include_on_results("outputs")
+        .include_on_relations(Asset.QUALIFIED_NAME)
+        .page_size(SEARCH_PAGE_SIZE)
+    ).to_request()
+
+    return [
+        result
+        for result in atlan_client.asset.search(request)
+        if isinstance(result, Process)
+    ]
 
 
-def search_table_in_schema(atlan_client, schema_qn, table_name_regex):
+def search_lineage_processes_by_qualified_names(atlan_client, qualified_names):
+    # the active processes among the given qualified names, with their inputs
+    # and outputs
     request = (
         FluentSearch()
-        .where(CompoundQuery.asset_type(Table))
+        .where(CompoundQuery.asset_type(Process))
         .where(CompoundQuery.active_assets())
-        .where(Table.QUALIFIED_NAME.startswith(schema_qn))
-        .where(Table.NAME.regexp(table_name_regex, case_insensitive=True))
+        .where(Process.QUALIFIED_NAME.within(qualified_names))
+        .include_on_results(Process.NAME)
+        .include_on_results(Process.OWNER_USERS)
+        .include_on_results("inputs")
+        .include_on_results("outputs")
+        .include_on_relations(Asset.QUALIFIED_NAME)
+        .page_size(min(len(qualified_names), SEARCH_PAGE_SIZE))
     ).to_request()
 
-    tables = []
-    for result in atlan_client.asset.search(request):
-        if isinstance(result, Table):
-            tables.append(result)
-    return tables
+    return [
+        result
+        for result in atlan_client.asset.search(request)
+        if isinstance(result, Process)
+    ]
+
+
+def fetch_lineage_processes(atlan_client, qualified_name_wildcards):
+    # returns the guid and fingerprint of the active processes matching any of
+    # the qualified name wildcards, by qualified name
+    return {
+        process.qualified_name: (process.guid, process_fingerprint(process))
+        for process in search_lineage_processes(atlan_client, qualified_name_wildcards)
+    }
+
+
+def fetch_tables_in_schema(atlan_client, schema_qn, updated_since=None):
+    request = (
+        active_or_updated_since(
+            FluentSearch()
+            .where(CompoundQuery.asset_type(Table))
+            .where(Table.QUALIFIED_NAME.startswith(schema_qn)),
+            updated_since,
+        )
+        .include_on_results(Table.NAME)
+        .page_size(SEARCH_PAGE_SIZE)
+    ).to_request()
+
+    return [
+        result
+        for result in atlan_client.asset.search(request)
+        if isinstance(result, Table)
+    ]
+
+
+REGEX_SPECIAL_CHARACTERS = set("\\.^$*+?{}[]|()")
+
+
+class SchemaTableIndex:
+    # tables of a schema matched by name: all the tables of the schema are
+    # fetched once, then names are matched locally. patterns without regex
+    # characters are resolved with a case insensitive name lookup, the
+    # others with a cached case insensitive full match regex,
+    # like the atlan regexp query.
+
+    def __init__(self, tables, build_table=None):
+        # with build_table, tables are the (name, entry) pairs of a snapshot
+        # and the Table assets are only built for the names that are matched
+        self.build_table = build_table
+        if build_table is None:
+            tables = [(table.name, table) for table in tables]
+        self._tables_by_name = {}
+        for name, table in tables:
+            self._tables_by_name.setdefault(name.lower(), []).append(table)
+        self._built_names = set()
+        self._build_lock = threading.Lock()
+        self._compiled_patterns = {}
+
+    def _tables_named(self, name):
+        tables = self._tables_by_name.get(name, [])
+        if self.build_table is None or not tables:
+            return list(tables)
+        # the index is shared by the buckets synced concurrently
+        with self._build_lock:
+            if name not in self._built_names:
+                tables[:] = [self.build_table(table) for table in tables]
+                self._built_names.add(name)
+            return list(tables)
+
+    def search(self, table_name_regex):
+        if REGEX_SPECIAL_CHARACTERS.isdisjoint(table_name_regex):
+            return self._tables_named(table_name_regex.lower())
+
+        pattern = self._compiled_patterns.get(table_name_regex)
+        if pattern is None:
+            pattern = re.compile(table_name_regex, re.IGNORECASE)
+            self._compiled_patterns[table_name_regex] = pattern
+        return [
+            table
+            for name in self._tables_by_name
+            if pattern.fullmatch(name)
+            for table in self._tables_named(name)
+        ]
+
+
+def build_schema_table_index(atlan_client, schema_qn, atlan_snapshot=None):
+    if atlan_snapshot is not None:
+        return atlan_snapshot.schema_table_index(atlan_client, schema_qn)
+    return SchemaTableIndex(
+        call_with_retry(fetch_tables_in_schema, atlan_client, schema_qn)
+    )
+
+
+class SchemaTableIndexCache:
+    # schema table indexes shared by the buckets synced in the same
+    # invocation. a schema requested by several buckets at the same time is
+    # fetched once, the other buckets wait for its index. with an
+    # atlan_snapshot, only the tables updated since the last run are fetched.
+    # with warm_indexes, a TTLCache, the indexes are kept across invocations
+
+    def __init__(self, atlan_client, atlan_snapshot=None, warm_indexes=None):
+        self.atlan_client = atlan_client
+        self.atlan_snapshot = atlan_snapshot
+        self.warm_indexes = warm_indexes
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, schema_qn):
+        if self.warm_indexes is not None:
+            warm_index = self.warm_indexes.get(schema_qn)
+            if warm_index is not None:
+                return warm_index
+        with self._lock:
+            index_future = self._indexes.get(schema_qn)
+            fetch = index_future is None
+            if fetch:
+                index_future = self._indexes[schema_qn] = futures.Future()
+        if fetch:
+            try:
+                index = build_schema_table_index(
+                    self.atlan_client, schema_qn, self.atlan_snapshot
+                )
+                if self.warm_indexes is not None:
+                    self.warm_indexes.set(schema_qn, index)
+                index_future.set_result(index)
+            except Exception as err:
+                index_future.set_exception(err)
+        return index_future.result()
+
+
+class AssetBatchWriter:
+    # saves assets in bulk requests of `batch_size` assets and merges the guid
+    # assignments of all the batches. a failed batch is saved again asset by
+    # asset, the failed assets are recorded in `failures` and the next batches
+    # are still sent.
+    # `flush_first` is a writer whose batches must be saved before the batches
+    # of this one, e.g. the s3 objects referenced by the lineage processes.
+    # the full batches of this writer are then sent after each batch of
+    # `flush_first`, so that its batches are not sent partially filled.
+    # with an `executor`, batches are saved concurrently, at most
+    # `max_in_flight` at a time, and `wait()` must be called at the end.
+    # the batch saves, retries included, are timed under `metric_name`.
+
+    def __init__(
+        self,
+        atlan_client,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_first=None,
+        executor=None,
+        max_in_flight=1,
+        metric_name="asset_batches",
+    ):
+        self.atlan_client = atlan_client
+        self.metric_name = metric_name
+        self.batch_size = batch_size
+        self.flush_first = flush_first
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.guid_assignments = {}
+        self.failures = []
+        self._failed_guids = set()
+        self._failed_qualified_names = set()
+        self._pending = []
+        self._in_flight = []
+        self._dependents = []
+        self._lock = threading.Lock()
+        if flush_first:
+            flush_first._dependents.append(self)
+
+    def add(self, asset):
+        self._pending.append(asset)
+        # the assets pending in flush_first may be referenced by this batch,
+        # it is sent with the next batch of flush_first instead
+        if len(self._pending) >= self.batch_size and not (
+            self.flush_first and self.flush_first._pending
+        ):
+            self._flush_full_batches()
+        return asset.guid
+
+    def flush(self):
+        if self.flush_first:
+            self.flush_first.flush()
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._send_batch(batch)
+        for dependent in self._dependents:
+            dependent._flush_full_batches()
+
+    def _flush_full_batches(self):
+        while len(self._pending) >= self.batch_size:
+            batch = self._pending[: self.batch_size]
+            self._pending = self._pending[self.batch_size :]
+            self._send_batch(batch)
+        for dependent in self._dependents:
+            dependent._flush_full_batches()
+
+    def _send_batch(self, batch):
+        if self.executor is None:
+            self._save_batch(batch)
+            return
+        dependencies = []
+        if self.flush_first:
+            dependencies = list(self.flush_first._in_flight)
+        # the dependencies were submitted earlier, so they are already running
+        # or done when this batch is picked up by a worker
+        self._collect_done_batches()
+        while len(self._in_flight) >= self.max_in_flight:
+            futures.wait(self._in_flight, return_when=futures.FIRST_COMPLETED)
+            self._collect_done_batches()
+        self._in_flight.append(
+            self.executor.submit(self._save_batch, batch, dependencies)
+        )
+
+    def wait(self):
+        self.flush()
+        futures.wait(self._in_flight)
+        self._collect_done_batches()
+
+    def _collect_done_batches(self):
+        # re-raises the unexpected errors of the batches saved by the workers
+        for future in self._in_flight:
+            if future.done():
+                future.result()
+        self._in_flight = [future for future in self._in_flight if not future.done()]
+
+    def _save_batch(self, batch, dependencies=()):
+        futures.wait(dependencies)
+        if self.flush_first:
+            batch = self._without_failed_references(batch)
+            if not batch:
+                return
+        try:
+            with METRICS.timer(self.metric_name, items=len(batch)):
+                response = call_with_retry(self.atlan_client.asset.save, batch)
+        except AtlanError as err:
+            # a failed batch is saved again asset by asset, so that only the
+            # assets that really fail are reported as failures
+            if len(batch) > 1:
+                logger.warning(
+                    f"failed to save a batch of {len(batch)} assets, saving them "
+                    f"one by one: {err}"
+                )
+                for asset in batch:
+                    self._save_batch([asset])
+                return
+            logger.error(f"failed to save {batch[0].qualified_name}: {err}")
+            self._record_failures(batch, str(err))
+            return
+        with self._lock:
+            self.guid_assignments.update(response.guid_assignments or {})
+
+    def _without_failed_references(self, batch):
+        # the assets referencing an asset of flush_first that failed would
+        # fail with it, they are not sent
+        with self.flush_first._lock:
+            failed_qualified_names = set(self.flush_first._failed_qualified_names)
+        if not failed_qualified_names:
+            return batch
+        kept_assets, dropped_assets = [], []
+        for asset in batch:
+            references = (getattr(asset, "inputs", None) or []) + (
+                getattr(asset, "outputs", None) or []
+            )
+            if any(
+                reference_qualified_name(reference) in failed_qualified_names
+                for reference in references
+            ):
+                dropped_assets.append(asset)
+            else:
+                kept_assets.append(asset)
+        if dropped_assets:
+            logger.error(
+                f"not saving {len(dropped_assets)} assets referencing assets that "
+                f"failed to be saved"
+            )
+            self._record_failures(
+                dropped_assets, "references an asset that failed to be saved"
+            )
+        return kept_assets
+
+    def _record_failures(self, assets, error):
+        with self._lock:
+            self.failures.extend(
+                {"qualified_name": asset.qualified_name, "error": error}
+                for asset in assets
+            )
+            self._failed_guids.update(asset.guid for asset in assets)
+            self._failed_qualified_names.update(asset.qualified_name for asset in assets)
+
+    def is_saved_or_failed(self, temporary_guid):
+        with self._lock:
+            return (
+                temporary_guid in self.guid_assignments
+                or temporary_guid in self._failed_guids
+            )
+
+    def forget(self, temporary_guid):
+        # drops the guid assignment of an asset whose result was consumed
+        with self._lock:
+            self.guid_assignments.pop(temporary_guid, None)
+            self._failed_guids.discard(temporary_guid)
+
+    def resolve_guids(self, temporary_guids):
+        return [
+            self.guid_assignments[guid]
+            for guid in temporary_guids
+            if guid in self.guid_assignments
+        ]
+
+
+class PlannedAssetWriter:
+    # stand-in of AssetBatchWriter for the dry runs: the assets are counted in
+    # the batches they would be saved in, flush_first included, and nothing
+    # is sent to atlan
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, flush_first=None):
+        self.batch_size = batch_size
+        self.flush_first = flush_first
+        self.assets_count = 0
+        self.batches_count = 0
+        self.guid_assignments = {}
+        self.failures = []
+        self._pending_count = 0
+        self._dependents = []
+        if flush_first:
+            flush_first._dependents.append(self)
+
+    def add(self, asset):
+        self.assets_count += 1
+        self._pending_count += 1
+        if self._pending_count >= self.batch_size and not (
+            self.flush_first and self.flush_first._pending_count
+        ):
+            self._flush_full_batches()
+        return asset.guid
+
+    def flush(self):
+        if self.flush_first:
+            self.flush_first.flush()
+        if self._pending_count:
+            self.batches_count += 1
+            self._pending_count = 0
+        for dependent in self._dependents:
+            dependent._flush_full_batches()
+
+    def _flush_full_batches(self):
+        full_batches_count = self._pending_count // self.batch_size
+        self.batches_count += full_batches_count
+        self._pending_count -= full_batches_count * self.batch_size
+        for dependent in self._dependents:
+            dependent._flush_full_batches()
+
+    def wait(self):
+        self.flush()
+
+    def is_saved_or_failed(self, temporary_guid):
+        return True
+
+    def forget(self, temporary_guid):
+        pass
+
+    def resolve_guids(self, temporary_guids):
+        return []
+
+
+def archive_atlan_assets(
+    atlan_client, assets_guids, batch_size=DEFAULT_BATCH_SIZE, concurrency=1
+):
+    def archive_batch(batch):
+        try:
+            call_with_retry(atlan_client.asset.delete_by_guid, batch)
+        except AtlanError as err:
+            logger.error(f"failed to archive a batch of {len(batch)} assets: {err}")
+            return [], [{"guid": guid, "error": str(err)} for guid in batch]
+        return batch, []
+
+    batches = [
+        [str(guid) for guid in assets_guids[start:start + batch_size]]
+        for start in range(0, len(assets_guids), batch_size)
+    ]
+    archived_guids = []
+    failures = []
+    for batch_archived_guids, batch_failures in run_concurrently(
+        archive_batch, batches, concurrency
+    ):
+        archived_guids.extend(batch_archived_guids)
+        failures.extend(batch_failures)
+    return archived_guids, failures
@@ -0,0 +1,211 @@
+import datetime
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping
+from contextlib import contextmanager
+from functools import partial
+
+from pyatlan.model.assets import S3Object, Table
+from pyatlan.model.enums import EntityStatus
+
+from atlan_operations import (
+    S3_OBJECT_COMPARED_FIELDS,
+    SchemaTableIndex,
+    fetch_s3_objects_in_bucket,
+    fetch_tables_in_schema,
+    process_fingerprint,
+    search_lineage_processes,
+)
+from constants import (
+    ATLAN_SNAPSHOT_MAX_AGE_SECONDS,
+    ATLAN_SNAPSHOT_OVERLAP_SECONDS,
+    logger,
+)
+from execution import call_with_retry
+from metrics import METRICS
+from state_manifest import build_manifest_store
+
+
+ATLAN_SNAPSHOT_VERSION = 2
+
+# the snapshot entries are lists of the values of these fields, only the
+# fields compared or used by the sync are kept
+TABLE_ENTRY_FIELDS = ("guid", "qualified_name", "name")
+S3_OBJECT_ENTRY_FIELDS = ("guid", "qualified_name", *S3_OBJECT_COMPARED_FIELDS)
+
+
+def asset_entry(asset, fields):
+    # in the atlan json format: sets as lists and datetimes as epoch ms
+    entry = []
+    for field in fields:
+        value = getattr(asset, field)
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        elif isinstance(value, datetime.datetime):
+            value = int(value.timestamp() * 1000)
+        entry.append(value)
+    return entry
+
+
+def asset_from_entry(asset_type, fields, entry):
+    asset = asset_type()
+    for field, value in zip(fields, entry):
+        if value is not None:
+            setattr(asset, field, value)
+    return asset
+
+
+def process_entry(process):
+    return [process.guid, process_fingerprint(process)]
+
+
+class SnapshotAssets(Mapping):
+    # snapshot entries by qualified name, the assets are only built when
+    # they are looked up
+    def __init__(self, entries, asset_type, fields):
+        self.entries = entries
+        self.asset_type = asset_type
+        self.fields = fields
+
+    def __getitem__(self, qualified_name):
+        return asset_from_entry(self.asset_type, self.fields, self.entries[qualified_name])
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class AtlanStateSnapshot:
+    # atlan assets fetched by the previous runs, by section: the tables of a
+    # schema, the lineage processes of a set of qualified name wildcards and
+    # the s3 objects under a bucket prefix. a section is refreshed with the
+    # assets updated since its watermark, archived ones being removed, and
+    # fetched in full when it is missing, too old or full_refresh is set.
+    # purged assets are not seen by the refreshes, full_refresh rebuilds the
+    # sections after a purge
+
+    def __init__(self, store, sections=None, full_refresh=False):
+        self.store = store
+        self.sections = sections or {}
+        self.full_refresh = full_refresh
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def refresh(self, section_name, search, to_entry):
+        # search(updated_since) returns the assets of the section, the active
+        # ones when updated_since is None. returns the entries by qualified name
+        with self._lock:
+            section = self.sections.get(section_name)
+        refreshed_at = int(time.time() * 1000)
+        if (
+            section is None
+            or self.full_refresh
+            or refreshed_at - section["watermark"] > ATLAN_SNAPSHOT_MAX_AGE_SECONDS * 1000
+        ):
+            entries = {asset.qualified_name: to_entry(asset) for asset in search(None)}
+            logger.info(f"atlan snapshot {section_name}: {len(entries)} assets fetched")
+            self.counts["full_refreshes"] += 1
+            self.counts["fetched_assets"] += len(entries)
+        else:
+            entries = dict(section["entries"])
+            updated_assets = list(
+                search(section["watermark"] - ATLAN_SNAPSHOT_OVERLAP_SECONDS * 1000)
+            )
+            for asset in updated_assets:
+                if asset.status == EntityStatus.DELETED:
+                    entries.pop(asset.qualified_name, None)
+                else:
+                    entries[asset.qualified_name] = to_entry(asset)
+            logger.info(
+                f"atlan snapshot {section_name}: {len(updated_assets)} assets "
+                f"updated since the last run"
+            )
+            self.counts["delta_refreshes"] += 1
+            self.counts["fetched_assets"] += len(updated_assets)
+        with self._lock:
+            self.sections[section_name] = {"watermark": refreshed_at, "entries": entries}
+        return entries
+
+    def schema_table_index(self, atlan_client, schema_qualified_name):
+        entries = self.refresh(
+            f"tables:{schema_qualified_name}",
+            lambda updated_since: call_with_retry(
+                fetch_tables_in_schema, atlan_client, schema_qualified_name, updated_since
+            ),
+            lambda table: asset_entry(table, TABLE_ENTRY_FIELDS),
+        )
+        name_index = TABLE_ENTRY_FIELDS.index("name")
+        return SchemaTableIndex(
+            [(entry[name_index], entry) for entry in entries.values()],
+            build_table=partial(asset_from_entry, Table, TABLE_ENTRY_FIELDS),
+        )
+
+    def lineage_processes(self, atlan_client, qualified_name_wildcards):
+        # guid and fingerprint of the processes, like fetch_lineage_processes
+        entries = self.refresh(
+            f"processes:{'|'.join(sorted(qualified_name_wildcards))}",
+            lambda updated_since: call_with_retry(
+                search_lineage_processes,
+                atlan_client,
+                qualified_name_wildcards,
+                updated_since,
+            ),
+            process_entry,
+        )
+        return {
+            qualified_name: tuple(entry) for qualified_name, entry in entries.items()
+        }
+
+    def s3_objects_in_bucket(self, atlan_client, bucket_qualified_name, key_prefix=None):
+        entries = self.refresh(
+            f"s3_objects:{bucket_qualified_name}/{key_prefix or ''}",
+            lambda updated_since: call_with_retry(
+                fetch_s3_objects_in_bucket,
+                atlan_client,
+                bucket_qualified_name,
+                key_prefix,
+                updated_since,
+            ).values(),
+            lambda s3_object: asset_entry(s3_object, S3_OBJECT_ENTRY_FIELDS),
+        )
+        return SnapshotAssets(entries, S3Object, S3_OBJECT_ENTRY_FIELDS)
+
+    def save(self):
+        with self._lock:
+            snapshot = {"version": ATLAN_SNAPSHOT_VERSION, "sections": self.sections}
+            self.store.save(snapshot)
+
+
+def load_atlan_snapshot(aws_session, location, full_refresh=False):
+    store = build_manifest_store(aws_session, location)
+    snapshot = store.load()
+    if snapshot is None:
+        logger.info("no atlan snapshot found, fetching the atlan state in full")
+        return AtlanStateSnapshot(store, full_refresh=full_refresh)
+    if snapshot.get("version") != ATLAN_SNAPSHOT_VERSION:
+        logger.info("atlan snapshot of another version, fetching the atlan state in full")
+        return AtlanStateSnapshot(store, full_refresh=full_refresh)
+    return AtlanStateSnapshot(store, snapshot["sections"], full_refresh)
+
+
+@contextmanager
+def open_atlan_snapshot(
+    aws_session, location, full_refresh=False, dry_run=False, save_delta_refreshes=True
+):
+    # yields the snapshot stored at location, saved back once the sync is
+    # over, or None without a location. a dry run leaves it as it is, and
+    # without save_delta_refreshes it is only saved when a section was
+    # fetched in full
+    if not location:
+        yield None
+        return
+    with METRICS.phase("snapshot_load"):
+        snapshot = load_atlan_snapshot(aws_session, location, full_refresh)
+    yield snapshot
+    if dry_run or not (save_delta_refreshes or snapshot.counts["full_refreshes"]):
+        return
+    with METRICS.phase("snapshot_save"):
+        snapshot.save()
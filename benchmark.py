@@ -0,0 +1,787 @@
+import argparse
+import bisect
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+from typing import List
+
+from botocore.exceptions import ClientError
+from pydantic.v1 import parse_obj_as
+from pyatlan.cache.role_cache import RoleCache
+from pyatlan.client.atlan import AtlanClient
+from pyatlan.errors import ErrorCode
+from pyatlan.model.assets import Asset, Process, Table
+from pyatlan.model.enums import EntityStatus
+from pyatlan.model.response import AssetMutationResponse
+
+import atlan_operations
+import atlan_snapshot
+import lambda_function
+from constants import S3_EVENTS_CONFIG_ENV_VAR, logger
+
+
+# offline benchmark of the lambda operations: lambda_handler is driven end to
+# end against in-memory stand-ins of s3 and atlan which simulate the api
+# latency, the paging and the rate limits. usage:
+#   python benchmark.py --sizes 1000 10000 100000 --latency-ms 10
+
+S3_CONNECTION_QUALIFIED_NAME = "default/s3/1700000000"
+SOURCE_CONNECTION_QUALIFIED_NAME = "default/postgres/1700000001"
+SOURCE_SCHEMA_QUALIFIED_NAME = f"{SOURCE_CONNECTION_QUALIFIED_NAME}/BENCH_DB/SOURCE"
+TARGET_CONNECTION_QUALIFIED_NAME = "default/snowflake/1700000002"
+TARGET_SCHEMA_QUALIFIED_NAME = f"{TARGET_CONNECTION_QUALIFIED_NAME}/BENCH_DB/TARGET"
+BUCKET_NAME = "atlan-benchmark"
+QUALIFIER_SUFFIX = "bench"
+BUCKET_QUALIFIED_NAME = (
+    f"{S3_CONNECTION_QUALIFIED_NAME}/arn:aws:s3:::{BUCKET_NAME}-{QUALIFIER_SUFFIX}"
+)
+# second bucket of the batch of buckets, with a tenth of the objects
+SECOND_BUCKET_NAME = "atlan-benchmark-second"
+MANIFEST_LOCATION = f"s3://{BUCKET_NAME}/_atlan/manifest.json"
+REPORT_LOCATION = f"s3://{BUCKET_NAME}/_atlan/report.ndjson"
+ATLAN_SNAPSHOT_LOCATION = f"s3://{BUCKET_NAME}/_atlan/atlan_snapshot.json.gz"
+INVENTORY_BUCKET_NAME = "atlan-benchmark-inventory"
+INVENTORY_LOCATION = f"s3://{INVENTORY_BUCKET_NAME}/{BUCKET_NAME}/daily/"
+
+# keys per data file of the csv s3 inventory
+INVENTORY_FILE_ROWS = 50000
+
+# s3 returns at most 1000 keys per list_objects_v2 page
+S3_MAX_PAGE_SIZE = 1000
+
+
+class ApiStats:
+    # counts the calls made to the stand-ins, sleeps latency_seconds per call
+    # plus per_item_latency_seconds per asset or key, and rejects the calls
+    # above rate_limit per second with a 429
+    def __init__(self, latency_seconds=0.0, per_item_latency_seconds=0.0, rate_limit=None):
+        self.latency_seconds = latency_seconds
+        self.per_item_latency_seconds = per_item_latency_seconds
+        self.rate_limit = rate_limit
+        self.calls = Counter()
+        self._recent_calls = deque()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self._recent_calls.clear()
+
+    def call(self, name, item_count=0, throttled=True):
+        with self._lock:
+            self.calls[name] += 1
+            if throttled and self.rate_limit:
+                now = time.monotonic()
+                while self._recent_calls and self._recent_calls[0] <= now - 1:
+                    self._recent_calls.popleft()
+                if len(self._recent_calls) >= self.rate_limit:
+                    self.calls["throttled"] += 1
+                    raise ErrorCode.RATE_LIMIT_PASSTHROUGH.exception_with_parameters(
+                        429, "rate limit exceeded"
+                    )
+                self._recent_calls.append(now)
+        delay = self.latency_seconds + self.per_item_latency_seconds * item_count
+        if delay:
+            time.sleep(delay)
+
+
+class FakeListObjectsV2Paginator:
+    def __init__(self, s3_client):
+        self.s3_client = s3_client
+
+    def paginate(self, Bucket, Prefix="", PaginationConfig=None, Delimiter=None, StartAfter=None):
+        page_size = min((PaginationConfig or {}).get("PageSize", S3_MAX_PAGE_SIZE), S3_MAX_PAGE_SIZE)
+        keys = self.s3_client.sorted_keys(Bucket)
+        position = bisect.bisect_left(keys, Prefix)
+        if StartAfter:
+            position = max(position, bisect.bisect_right(keys, StartAfter))
+
+        while True:
+            self.s3_client.stats.call("s3.list_objects_v2", throttled=False)
+            contents, common_prefixes = [], []
+            while position < len(keys) and len(contents) + len(common_prefixes) < page_size:
+                key = keys[position]
+                if not key.startswith(Prefix):
+                    position = len(keys)
+                    break
+                delimiter_index = key.find(Delimiter, len(Prefix)) if Delimiter else -1
+                if delimiter_index >= 0:
+                    common_prefix = key[:delimiter_index + len(Delimiter)]
+                    common_prefixes.append({"Prefix": common_prefix})
+                    # skips the other keys of the common prefix
+                    position = bisect.bisect_left(keys, common_prefix + "\U0010ffff")
+                    continue
+                contents.append(self.s3_client.object_summary(Bucket, key))
+                position += 1
+            page = {"KeyCount": len(contents) + len(common_prefixes)}
+            if contents:
+                page["Contents"] = contents
+            if common_prefixes:
+                page["CommonPrefixes"] = common_prefixes
+            yield page
+            if position >= len(keys) or not keys[position].startswith(Prefix):
+                return
+
+
+class FakeS3Client:
+    def __init__(self, stats):
+        self.stats = stats
+        self.buckets = {}
+        self.uploads = {}
+        self._sorted_keys = {}
+        self._lock = threading.Lock()
+
+    def put(self, bucket_name, key, body=b"", last_modified=None):
+        with self._lock:
+            self.buckets.setdefault(bucket_name, {})[key] = {
+                "Body": body,
+                "ETag": f'"{hashlib.md5(body).hexdigest()}"',
+                "LastModified": last_modified or datetime.datetime.now(datetime.timezone.utc),
+                "StorageClass": "STANDARD",
+            }
+            self._sorted_keys.pop(bucket_name, None)
+
+    def sorted_keys(self, bucket_name):
+        with self._lock:
+            if bucket_name not in self._sorted_keys:
+                self._sorted_keys[bucket_name] = sorted(self.buckets.get(bucket_name, {}))
+            return self._sorted_keys[bucket_name]
+
+    def object_summary(self, bucket_name, key):
+        s3_object = self.buckets[bucket_name][key]
+        return {
+            "Key": key,
+            "ETag": s3_object["ETag"],
+            "LastModified": s3_object["LastModified"],
+            "Size": len(s3_object["Body"]),
+            "StorageClass": s3_object["StorageClass"],
+        }
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise NotImplementedError(operation_name)
+        return FakeListObjectsV2Paginator(self)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.stats.call("s3.get_object", throttled=False)
+        s3_object = self.buckets.get(Bucket, {}).get(Key)
+        if s3_object is None:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject"
+            )
+        return {
+            **self.object_summary(Bucket, Key),
+            "ContentLength": len(s3_object["Body"]),
+            "Body": FakeStreamingBody(s3_object["Body"]),
+        }
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.stats.call("s3.put_object", throttled=False)
+        self.put(Bucket, Key, Body if isinstance(Body, bytes) else Body.encode("utf-8"))
+        return {"ETag": self.buckets[Bucket][Key]["ETag"]}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.stats.call("s3.create_multipart_upload", throttled=False)
+        upload_id = str(uuid.uuid4())
+        with self._lock:
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self.stats.call("s3.upload_part", throttled=False)
+        with self._lock:
+            self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self.stats.call("s3.complete_multipart_upload", throttled=False)
+        with self._lock:
+            parts = self.uploads.pop(UploadId)
+        self.put(Bucket, Key, b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"]))
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+
+class FakeStreamingBody:
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, amount=None):
+        body, self.body = (self.body, b"") if amount is None else (self.body[:amount], self.body[amount:])
+        return body
+
+
+class FakeAwsSession:
+    def __init__(self, s3_client):
+        self.s3_client = s3_client
+
+    def client(self, service_name, **kwargs):
+        if service_name != "s3":
+            raise NotImplementedError(service_name)
+        return self.s3_client
+
+
+def asset_document(asset, state):
+    # fields of an asset as seen by the search queries of atlan_operations
+    return {
+        "__typeName.keyword": asset.type_name,
+        "__guid": asset.guid,
+        "__state": state,
+        "__modificationTimestamp": asset.update_time,
+        "qualifiedName": asset.qualified_name,
+        "name.keyword": asset.name,
+        "s3BucketQualifiedName": getattr(asset, "s3_bucket_qualified_name", None),
+    }
+
+
+def query_matches(query, document):
+    # evaluates the elasticsearch queries built by FluentSearch
+    (query_type, body), = query.items()
+    if query_type == "bool":
+        required = body.get("must", []) + body.get("filter", [])
+        if not all(query_matches(sub_query, document) for sub_query in required):
+            return False
+        if any(query_matches(sub_query, document) for sub_query in body.get("must_not", [])):
+            return False
+        should = body.get("should", [])
+        minimum_should_match = body.get("minimum_should_match", 0 if required else 1)
+        if should and minimum_should_match:
+            return sum(query_matches(sub_query, document) for sub_query in should) >= minimum_should_match
+        return True
+    if query_type == "exists":
+        return document.get(body["field"]) is not None
+
+    (field_name, condition), = body.items()
+    value = document.get(field_name)
+    if value is None:
+        return False
+    if query_type == "terms":
+        return value in condition
+    case_insensitive = condition.get("case_insensitive", False)
+    if query_type == "range":
+        return all(
+            {"gt": value > bound, "gte": value >= bound, "lt": value < bound, "lte": value <= bound}[operator]
+            for operator, bound in condition.items()
+            if operator in ("gt", "gte", "lt", "lte")
+        )
+    expected = condition["value"]
+    if case_insensitive:
+        value, expected = value.lower(), expected.lower()
+    if query_type == "term":
+        return value == expected
+    if query_type == "prefix":
+        return value.startswith(expected)
+    if query_type == "regexp":
+        return re.fullmatch(expected, value) is not None
+    if query_type == "wildcard":
+        wildcard_regex = "".join(
+            ".*" if part == "*" else "." if part == "?" else re.escape(part[-1] if part.startswith("\\") else part)
+            for part in re.findall(r"\\.|\*|\?|[^\\*?]+", expected)
+        )
+        return re.fullmatch(wildcard_regex, value, re.DOTALL) is not None
+    raise NotImplementedError(query_type)
+
+
+class FakeAssetClient:
+    # in-memory atlan: assets are upserted by type and qualified name, and the
+    # processes are linked to their inputs and outputs like atlan does
+    def __init__(self, stats):
+        self.stats = stats
+        self.assets = {}
+        self.documents = {}
+        self.guids_by_qualified_name = {}
+        self._lock = threading.RLock()
+
+    def seed(self, assets):
+        # seeded a day before the benchmark runs
+        update_time = int(time.time() * 1000) - 24 * 3600 * 1000
+        with self._lock:
+            for asset in assets:
+                self._store(asset, update_time)
+
+    def _store(self, asset, update_time=None):
+        key = (asset.type_name, asset.qualified_name)
+        stored = asset.copy()
+        stored.attributes = asset.attributes.copy()
+        stored.guid = self.guids_by_qualified_name.get(key) or str(uuid.uuid4())
+        stored.update_time = update_time or int(time.time() * 1000)
+        existing = self.assets.get(stored.guid)
+        if existing is not None:
+            # relationships are kept when an asset is saved again
+            for attribute_name in ("input_to_processes", "output_from_processes"):
+                if hasattr(existing, attribute_name):
+                    setattr(stored, attribute_name, getattr(existing, attribute_name))
+        self.assets[stored.guid] = stored
+        self.documents[stored.guid] = asset_document(stored, "ACTIVE")
+        self.guids_by_qualified_name[key] = stored.guid
+        if isinstance(stored, Process):
+            self._link_process(stored)
+        return stored.guid
+
+    def _resolve_reference(self, reference):
+        if reference.guid and not reference.guid.startswith("-"):
+            return self.assets.get(reference.guid)
+        qualified_name = (reference.unique_attributes or {}).get("qualifiedName")
+        guid = self.guids_by_qualified_name.get((reference.type_name, qualified_name))
+        return self.assets.get(guid)
+
+    def _link_process(self, process):
+        for references, attribute_name in (
+            (process.inputs, "input_to_processes"),
+            (process.outputs, "output_from_processes"),
+        ):
+            for reference in references or []:
+                asset = self._resolve_reference(reference)
+                if asset is None or not hasattr(asset, attribute_name):
+                    continue
+                linked_processes = getattr(asset, attribute_name) or []
+                if all(linked.guid != process.guid for linked in linked_processes):
+                    setattr(asset, attribute_name, linked_processes + [Process.ref_by_guid(process.guid)])
+
+    def save(self, entity, **kwargs):
+        assets = entity if isinstance(entity, list) else [entity]
+        self.stats.call("atlan.save", item_count=len(assets))
+        with self._lock:
+            guid_assignments = {asset.guid: self._store(asset) for asset in assets}
+        return AssetMutationResponse(guid_assignments=guid_assignments)
+
+    def search(self, criteria, **kwargs):
+        self.stats.call("atlan.search")
+        query = criteria.dsl.query.to_dict()
+        with self._lock:
+            guids = [
+                guid
+                for guid, document in self.documents.items()
+                if query_matches(query, document)
+            ]
+        page_size = criteria.dsl.size or len(guids) or 1
+        return self._iter_search_results(
+            guids, page_size, criteria.attributes or [], criteria.relation_attributes or []
+        )
+
+    def _iter_search_results(self, guids, page_size, attributes, relation_attributes):
+        # the pages after the first are fetched by pyatlan while iterating,
+        # outside of the retries of the callers, so they are not throttled
+        for start in range(0, len(guids), page_size):
+            if start:
+                self.stats.call("atlan.search_page", throttled=False)
+            with self._lock:
+                entities = [
+                    self._search_result_entity(guid, attributes, relation_attributes)
+                    for guid in guids[start:start + page_size]
+                    if guid in self.assets
+                ]
+            # parsed like pyatlan parses the pages of the search api
+            yield from parse_obj_as(List[Asset], entities)
+
+    def _search_result_entity(self, guid, attributes, relation_attributes):
+        # json of an asset as returned by the search api: its timestamps in
+        # epoch milliseconds, only the name, the qualified name and the
+        # requested attributes, and its relations as references with the
+        # requested relation attributes
+        asset = self.assets[guid]
+        entity = json.loads(asset.json(by_alias=True, exclude_unset=True))
+        entity["status"] = self.documents[guid]["__state"]
+        entity["attributes"] = {
+            attribute_name: (
+                self._search_result_reference(value, relation_attributes)
+                if attribute_name in attributes
+                else value
+            )
+            for attribute_name, value in entity["attributes"].items()
+            if attribute_name in attributes or attribute_name in ("qualifiedName", "name")
+        }
+        return entity
+
+    def _search_result_reference(self, value, relation_attributes):
+        if isinstance(value, list):
+            return [self._search_result_reference(item, relation_attributes) for item in value]
+        if not isinstance(value, dict) or "typeName" not in value:
+            return value
+        guid = value.get("guid")
+        if guid is None or guid.startswith("-"):
+            qualified_name = (value.get("uniqueAttributes") or value.get("attributes") or {}).get("qualifiedName")
+            guid = self.guids_by_qualified_name.get((value["typeName"], qualified_name))
+        if guid not in self.assets:
+            return value
+        related_attributes = json.loads(self.assets[guid].json(by_alias=True, exclude_unset=True))["attributes"]
+        return {
+            "typeName": value["typeName"],
+            "guid": guid,
+            "uniqueAttributes": {"qualifiedName": related_attributes["qualifiedName"]},
+            "attributes": {
+                attribute_name: related_attributes[attribute_name]
+                for attribute_name in relation_attributes
+                if attribute_name in related_attributes
+            },
+        }
+
+    def _remove(self, guids, archive):
+        with self._lock:
+            for guid in guids:
+                if guid not in self.assets:
+                    raise ErrorCode.ASSET_NOT_FOUND_BY_GUID.exception_with_parameters(guid)
+            for guid in guids:
+                if archive:
+                    asset = self.assets[guid]
+                    asset.status = EntityStatus.DELETED
+                    asset.update_time = int(time.time() * 1000)
+                    self.documents[guid] = asset_document(asset, "DELETED")
+                else:
+                    asset = self.assets.pop(guid)
+                    del self.documents[guid]
+                    self.guids_by_qualified_name.pop((asset.type_name, asset.qualified_name), None)
+
+    def purge_by_guid(self, guid, **kwargs):
+        guids = guid if isinstance(guid, list) else [guid]
+        self.stats.call("atlan.purge", item_count=len(guids))
+        self._remove(guids, archive=False)
+
+    def delete_by_guid(self, guid, **kwargs):
+        guids = guid if isinstance(guid, list) else [guid]
+        self.stats.call("atlan.archive", item_count=len(guids))
+        self._remove(guids, archive=True)
+
+    def get_by_guid(self, guid, asset_type=None, **kwargs):
+        self.stats.call("atlan.get_by_guid")
+        asset = self.assets.get(guid)
+        if asset is None:
+            raise ErrorCode.ASSET_NOT_FOUND_BY_GUID.exception_with_parameters(guid)
+        return asset
+
+    def get_by_qualified_name(self, qualified_name, asset_type, **kwargs):
+        self.stats.call("atlan.get_by_qualified_name")
+        guid = self.guids_by_qualified_name.get((asset_type.__name__, qualified_name))
+        if guid is None:
+            raise ErrorCode.ASSET_NOT_FOUND_BY_QN.exception_with_parameters(
+                qualified_name, asset_type.__name__
+            )
+        return self.assets[guid]
+
+
+class FakeAtlanClient:
+    def __init__(self, stats):
+        self.asset = FakeAssetClient(stats)
+
+
+def seed_pyatlan_caches(admin_role_guid):
+    # Connection.creator validates the admin roles with the role cache of the
+    # default client. a client that is never called is registered as default
+    # and its role cache is seeded, so that no request leaves the process
+    default_client = AtlanClient(base_url="http://atlan.benchmark.invalid", api_key="benchmark")
+    role_cache = RoleCache(role_client=default_client.role)
+    role_cache.map_id_to_name[admin_role_guid] = "$admin"
+    role_cache.map_name_to_id["$admin"] = admin_role_guid
+    RoleCache.caches[default_client.cache_key] = role_cache
+    atlan_operations.ROLE_GUIDS["$admin"] = admin_role_guid
+
+
+def build_fixture(object_count, table_count, stats):
+    # tables named table_0000... in the source and target schemas, and s3
+    # keys exports/<partition>/table_<n>.csv, several partitions per table.
+    # the second bucket holds a tenth of the keys
+    atlan_client = FakeAtlanClient(stats)
+    atlan_client.asset.seed(
+        Table.creator(name=f"TABLE_{table_number:04d}", schema_qualified_name=schema_qualified_name)
+        for schema_qualified_name in (SOURCE_SCHEMA_QUALIFIED_NAME, TARGET_SCHEMA_QUALIFIED_NAME)
+        for table_number in range(table_count)
+    )
+
+    s3_client = FakeS3Client(stats)
+    last_modified = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    for bucket_name, bucket_object_count in (
+        (BUCKET_NAME, object_count),
+        (SECOND_BUCKET_NAME, max(1, object_count // 10)),
+    ):
+        for object_number in range(bucket_object_count):
+            partition, table_number = divmod(object_number, table_count)
+            s3_client.put(
+                bucket_name,
+                f"exports/{partition:05d}/table_{table_number:04d}.csv",
+                body=f"id,value\n{object_number},x\n".encode("utf-8"),
+                last_modified=last_modified,
+            )
+    return atlan_client, FakeAwsSession(s3_client)
+
+
+def put_s3_inventory(s3_client, bucket_name, report_date="2024-01-02T01-00Z"):
+    # csv s3 inventory of the bucket in the layout written by s3, the keys
+    # are sorted since the daily report is not
+    keys = s3_client.sorted_keys(bucket_name)
+    files = []
+    for start in range(0, len(keys), INVENTORY_FILE_ROWS):
+        rows = []
+        for key in reversed(keys[start:start + INVENTORY_FILE_ROWS]):
+            summary = s3_client.object_summary(bucket_name, key)
+            rows.append(
+                f'"{bucket_name}","{key}","{summary["Size"]}",'
+                f'"{summary["LastModified"].strftime("%Y-%m-%dT%H:%M:%S.000Z")}",'
+                f'"{summary["ETag"].strip(chr(34))}"'
+            )
+        data_file_key = f"{bucket_name}/daily/data/{uuid.uuid4()}.csv.gz"
+        s3_client.put(
+            INVENTORY_BUCKET_NAME,
+            data_file_key,
+            gzip.compress(("\n".join(rows) + "\n").encode("utf-8")),
+        )
+        files.append({"key": data_file_key})
+    manifest = {
+        "sourceBucket": bucket_name,
+        "destinationBucket": f"arn:aws:s3:::{INVENTORY_BUCKET_NAME}",
+        "version": "2016-11-30",
+        "fileFormat": "CSV",
+        "fileSchema": "Bucket, Key, Size, LastModifiedDate, ETag",
+        "files": files,
+    }
+    s3_client.put(
+        INVENTORY_BUCKET_NAME,
+        f"{bucket_name}/daily/{report_date}/manifest.json",
+        json.dumps(manifest).encode("utf-8"),
+    )
+
+
+def upsert_request(**params):
+    return {
+        "operation": "upsert_s3_assets_and_lineage",
+        "params": {
+            "s3_connection_qualified_name": S3_CONNECTION_QUALIFIED_NAME,
+            "asset_owners": ["benchmark"],
+            "source_connection_qualified_name": SOURCE_CONNECTION_QUALIFIED_NAME,
+            "source_database_schema_qualified_name": SOURCE_SCHEMA_QUALIFIED_NAME,
+            "target_connection_qualified_name": TARGET_CONNECTION_QUALIFIED_NAME,
+            "target_database_schema_qualified_name": TARGET_SCHEMA_QUALIFIED_NAME,
+            "source_extraction_process_name_suffix": "pg to s3 process",
+            "source_extraction_process_id_suffix": "pg_to_s3_process",
+            "target_import_process_name_suffix": "s3 to snflk process",
+            "target_import_process_id_suffix": "s3_to_snflk_process",
+            "s3_bucket_name": BUCKET_NAME,
+            "s3_bucket_arn": f"arn:aws:s3:::{BUCKET_NAME}",
+            "qualifier_suffix": QUALIFIER_SUFFIX,
+            "s3_bucket_prefix": "exports/",
+            "s3_file_name_pattern": None,
+            "source_table_pattern": "{table_name}",
+            "target_table_pattern": "{table_name}",
+            **params,
+        },
+    }
+
+
+def buckets_request(**params):
+    # the bucket of upsert_request and the second bucket, with the same params
+    return {
+        "operation": "upsert_s3_buckets_and_lineage",
+        "params": {
+            "defaults": upsert_request(**params)["params"],
+            "buckets": [
+                {"s3_bucket_name": BUCKET_NAME},
+                {
+                    "s3_bucket_name": SECOND_BUCKET_NAME,
+                    "s3_bucket_arn": f"arn:aws:s3:::{SECOND_BUCKET_NAME}",
+                },
+            ],
+            "bucket_concurrency": 2,
+        },
+    }
+
+
+def s3_event_record(event_name, key, sequencer):
+    return {
+        "eventSource": "aws:s3",
+        "eventName": event_name,
+        "eventTime": "2024-01-02T00:00:00.000Z",
+        "s3": {
+            "bucket": {"name": BUCKET_NAME},
+            "object": {"key": key, "size": 16, "eTag": "0" * 32, "sequencer": sequencer},
+        },
+    }
+
+
+def sqs_events_request(created_keys, removed_keys):
+    # a batch of sqs messages holding an s3 event notification each, the
+    # params of the bucket being read from the environment like in the lambda
+    records = [
+        s3_event_record("ObjectCreated:Put", key, f"{index:016X}")
+        for index, key in enumerate(created_keys)
+    ] + [
+        s3_event_record("ObjectRemoved:Delete", key, f"{len(created_keys) + index:016X}")
+        for index, key in enumerate(removed_keys)
+    ]
+    return {
+        "Records": [
+            {
+                "eventSource": "aws:sqs",
+                "messageId": str(uuid.uuid4()),
+                "body": json.dumps({"Records": [record]}),
+            }
+            for record in records
+        ]
+    }
+
+
+def run_scenario(name, request, stats):
+    lambda_function.ASSET_INFO_CACHE.clear()
+    lambda_function.SCHEMA_TABLE_INDEX_CACHE.clear()
+    stats.reset()
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    response = lambda_function.lambda_handler(request, None)
+    wall_seconds = time.perf_counter() - started_at
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # the sqs invocations only return the failed messages
+    body = response.get("body", {})
+    upserted_assets = body.get("upserted_assets", {})
+    failed_assets = (
+        body.get("failed_assets")
+        or upserted_assets.get("failed_assets")
+        or response.get("batchItemFailures")
+        or []
+    )
+    return {
+        "scenario": name,
+        "wall_seconds": round(wall_seconds, 3),
+        "peak_memory_mb": round(peak_memory / 1024 / 1024, 1),
+        "api_calls": dict(sorted(stats.calls.items())),
+        "failed_assets": upserted_assets.get("failed_assets_count", len(failed_assets)),
+    }, body
+
+
+def run_benchmark(object_count, table_count, stats, batch_size, concurrency, sample_size):
+    atlan_client, aws_session = build_fixture(object_count, table_count, stats)
+    lambda_function.WARM_CLIENTS["atlan"] = atlan_client
+    lambda_function.WARM_CLIENTS["aws"] = aws_session
+    seed_pyatlan_caches(str(uuid.uuid4()))
+    # the stand-ins share the clock of the benchmark, the refreshes of the
+    # atlan snapshots need no margin
+    atlan_snapshot.ATLAN_SNAPSHOT_OVERLAP_SECONDS = 0
+    put_s3_inventory(aws_session.s3_client, BUCKET_NAME)
+    tuning = {"batch_size": batch_size, "concurrency": concurrency}
+    os.environ[S3_EVENTS_CONFIG_ENV_VAR] = json.dumps(
+        {"defaults": upsert_request(**tuning)["params"], "buckets": [{"s3_bucket_name": BUCKET_NAME}]}
+    )
+
+    sorted_keys = aws_session.s3_client.sorted_keys(BUCKET_NAME)
+    sample_keys = sorted_keys[:sample_size]
+    # removed by the s3 events, out of the sampled keys
+    removed_keys = sorted_keys[sample_size:][-max(1, sample_size // 10):]
+    scenarios = [
+        ("upsert_s3_connection", lambda: {
+            "operation": "upsert_s3_connection",
+            "params": {
+                "connection_qn": S3_CONNECTION_QUALIFIED_NAME,
+                "connection_name": "aws-s3-connection-benchmark",
+                "asset_owners": ["benchmark"],
+            },
+        }),
+        ("upsert_full_sync", lambda: upsert_request(**tuning, state_manifest_location=MANIFEST_LOCATION)),
+        ("upsert_incremental_sync", lambda: upsert_request(**tuning, state_manifest_location=MANIFEST_LOCATION)),
+        ("upsert_reconcile_with_atlan", lambda: upsert_request(**tuning, reconcile_with_atlan=True)),
+        ("upsert_parallel_listing", lambda: upsert_request(**tuning, parallel_s3_listing=True)),
+        ("upsert_ndjson_report", lambda: upsert_request(**tuning, report_location=REPORT_LOCATION)),
+        ("upsert_csv_headers", lambda: upsert_request(**tuning, sample_csv_headers=True)),
+        ("upsert_inventory_listing", lambda: upsert_request(
+            **tuning, s3_inventory_manifest_location=INVENTORY_LOCATION
+        )),
+        # the first run fetches the atlan state in full, the second only the
+        # assets updated since the first
+        ("upsert_dry_run", lambda: upsert_request(**tuning, reconcile_with_atlan=True, dry_run=True)),
+        ("upsert_atlan_snapshot_cold", lambda: upsert_request(
+            **tuning, reconcile_with_atlan=True, atlan_snapshot_location=ATLAN_SNAPSHOT_LOCATION
+        )),
+        ("upsert_atlan_snapshot_warm", lambda: upsert_request(
+            **tuning, reconcile_with_atlan=True, atlan_snapshot_location=ATLAN_SNAPSHOT_LOCATION
+        )),
+        ("upsert_buckets_batch", lambda: buckets_request(**tuning, reconcile_with_atlan=True)),
+        ("get_by_guid", lambda: {
+            "operation": "get_by_guid",
+            "params": {"guids": sampled_guids, "asset_type": "S3Object"},
+        }),
+        ("get_by_qn", lambda: {
+            "operation": "get_by_qn",
+            "params": {
+                "qualified_names": [f"{BUCKET_QUALIFIED_NAME}/{key}" for key in sample_keys],
+                "asset_type": "S3Object",
+            },
+        }),
+        # the sampled keys are overwritten and a few other keys removed
+        ("sqs_s3_events", lambda: sqs_events_request(sample_keys, removed_keys)),
+        ("purge_cascade", lambda: {
+            "operation": "purge",
+            "params": {"cascade_qualified_name": BUCKET_QUALIFIED_NAME, **tuning},
+        }),
+    ]
+
+    results = []
+    sampled_guids = []
+    for name, build_request in scenarios:
+        result, body = run_scenario(name, build_request(), stats)
+        result["objects"] = object_count
+        results.append(result)
+        if name == "upsert_full_sync":
+            sampled_guids = body["upserted_assets"]["s3_objects_guids"][:sample_size]
+        print_result(result)
+    return results
+
+
+def print_result(result):
+    api_calls = " ".join(f"{name}={count}" for name, count in result["api_calls"].items())
+    print(
+        f"{result['objects']:>8} {result['scenario']:<28} {result['wall_seconds']:>9.3f}s "
+        f"{result['peak_memory_mb']:>8.1f}MB failed={result['failed_assets']} {api_calls}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline benchmark of the lambda operations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--tables", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--per-item-latency-ms", type=float, default=0.5)
+    parser.add_argument("--rate-limit", type=int, default=None, help="atlan calls per second")
+    parser.add_argument("--batch-size", type=int, default=lambda_function.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=lambda_function.DEFAULT_CONCURRENCY)
+    parser.add_argument("--sample-size", type=int, default=100)
+    parser.add_argument("--output", help="json file receiving the results")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logger.setLevel(getattr(logging, args.log_level.upper()))
+    stats = ApiStats(
+        latency_seconds=args.latency_ms / 1000,
+        per_item_latency_seconds=args.per_item_latency_ms / 1000,
+        rate_limit=args.rate_limit,
+    )
+    results = []
+    for object_count in args.sizes:
+        results.extend(
+            run_benchmark(
+                object_count,
+                min(args.tables, object_count),
+                stats,
+                args.batch_size,
+                args.concurrency,
+                args.sample_size,
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,79 @@
 import logging
 
-from pyatlan.model.assets import (
-    Connection,
-    S3Bucket,
-    S3Object,
-    Process,
-    Table,
-    Database,
-    Schema,
-)
 
+# number of assets sent to atlan in a single bulk save request
+DEFAULT_BATCH_SIZE = 20
+
+# number of assets fetched per page by the atlan searches
+SEARCH_PAGE_SIZE = 300
+
+# number of keys per s3 list_objects_v2 page
+LISTING_PAGE_SIZE = 1000
+
+# number of s3 listing pages buffered between the listing threads and the
+# consumer of a parallel listing
+LISTING_QUEUE_SIZE = 8
+
+# bytes read from the start of a csv file to sample its header line
+HEADER_SAMPLE_BYTES = 4096
+
+# storage classes whose objects must be restored before being read, their
+# headers are not sampled
+ARCHIVE_STORAGE_CLASSES = ("GLACIER", "DEEP_ARCHIVE")
+
+# sampled csv headers by s3 key and etag, kept across warm invocations
+CSV_HEADERS_CACHE_MAX_SIZE = 100000
+CSV_HEADERS_CACHE_TTL_SECONDS = 24 * 3600
+
+# size of the parts of the ndjson run reports uploaded to s3, at least 5MB
+REPORT_PART_SIZE = 8 * 1024 * 1024
+
+# number of rows read at a time from the parquet s3 inventory files
+INVENTORY_BATCH_ROWS = 10000
+
+# atlan state snapshots: the assets updated since the last refresh of a
+# section are fetched again with a margin for the clock skew and the search
+# index delay, a section older than the max age is fetched in full
+ATLAN_SNAPSHOT_OVERLAP_SECONDS = 300
+ATLAN_SNAPSHOT_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# latency assumed by the dry runs for a bulk save or archive request when
+# the container has not measured one yet, and number of planned changes
+# listed in their response, the others being only counted
+DRY_RUN_WRITE_LATENCY_SECONDS = 1.0
+DRY_RUN_MAX_LISTED_CHANGES = 1000
+
+# number of atlan api calls running at the same time
+DEFAULT_CONCURRENCY = 4
+
+# number of buckets synced at the same time by upsert_s3_buckets_and_lineage
+DEFAULT_BUCKET_CONCURRENCY = 4
+
+# retries of the atlan api calls failing with a 429 or 5xx error
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 20
+
+# time kept before the lambda deadline by the resumable runs to finish the
+# pending writes and return the continuation
+DEFAULT_DEADLINE_MARGIN_SECONDS = 60
+
+# environment variable holding the sync params of the buckets sending s3 event
+# notifications, in the format of the upsert_s3_buckets_and_lineage params, as
+# json or as the s3://bucket/key or local path of a json file
+S3_EVENTS_CONFIG_ENV_VAR = "S3_EVENTS_CONFIG"
+
+# cache of the get_by_guid and get_by_qn results kept across warm invocations
+ASSET_INFO_CACHE_MAX_SIZE = 10000
+ASSET_INFO_CACHE_TTL_SECONDS = 300
+
+# schema table indexes of the s3 event syncs kept across warm invocations, a
+# batch of events is too small to fetch every table of its schemas each time
+SCHEMA_TABLE_INDEX_CACHE_MAX_SIZE = 100
+SCHEMA_TABLE_INDEX_CACHE_TTL_SECONDS = 300
+
+# cloudwatch namespace of the metrics logged in embedded metric format
+METRICS_NAMESPACE = "AtlanS3Lineage"
 
 logger = logging.getLogger()
 if len(logging.getLogger().handlers) > 0:
@@ -19,12 +83,14 @@ else:
     # if code is executed locally
     logging.basicConfig(level=logging.INFO)
 
-ASSET_TYPES = {
-    "Connection": Connection,
-    "S3Bucket": S3Bucket,
-    "S3Object": S3Object,
-    "Process": Process,
-    "Database": Database,
-    "Schema": Schema,
-    "Table": Table,
-}
+# atlan asset types supported by the get operations, the asset classes are
+# only imported by atlan_operations to keep the lambda cold start short
+ASSET_TYPE_NAMES = [
+    "Connection",
+    "S3Bucket",
+    "S3Object",
+    "Process",
+    "Database",
+    "Schema",
+    "Table",
+]
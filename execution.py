@@ -0,0 +1,59 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import (
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY_SECONDS,
+    logger,
+)
+from metrics import METRICS
+
+
+def is_retryable_error(err):
+    # imported on the first failure, pyatlan is slow to import and not needed
+    # by the s3 only code paths
+    from pyatlan.errors import ApiConnectionError, AtlanError, RateLimitError
+
+    if isinstance(err, (RateLimitError, ApiConnectionError)):
+        return True
+    if isinstance(err, AtlanError):
+        http_error_code = getattr(err.error_code, "http_error_code", None)
+        return http_error_code == 429 or (http_error_code or 0) >= 500
+    return False
+
+
+def call_with_retry(
+    func,
+    *args,
+    max_attempts=RETRY_MAX_ATTEMPTS,
+    base_delay=RETRY_BASE_DELAY_SECONDS,
+    max_delay=RETRY_MAX_DELAY_SECONDS,
+    **kwargs,
+):
+    # exponential backoff with full jitter so that concurrent workers hitting
+    # the rate limit at the same time do not retry at the same time
+    attempt = 1
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as err:
+            if attempt >= max_attempts or not is_retryable_error(err):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            METRICS.record_retry(getattr(func, "metric_name", func.__name__))
+            logger.warning(
+                f"attempt {attempt} of {func.__name__} failed ({err}), "
+                f"retrying in {delay:.2f}s"
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+def run_concurrently(func, items, concurrency):
+    # results are returned in the order of the items
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+        return list(executor.map(func, items))
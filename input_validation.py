@@ -1,8 +1,15 @@
-from pydantic import BaseModel, constr, conlist, field_validator
+from pydantic import BaseModel, conint, constr, conlist, field_validator, model_validator
+import re
 from typing import Optional, Union
 from uuid import UUID
 
-from constants import ASSET_TYPES
+from constants import (
+    ASSET_TYPE_NAMES,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BUCKET_CONCURRENCY,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_DEADLINE_MARGIN_SECONDS,
+)
 
 
 class UpsertS3ConnectionParams(BaseModel):
@@ -17,13 +24,20 @@ class UpsertS3ConnectionRequest(BaseModel):
 
 
 class GetByGuidParams(BaseModel):
-    guid: UUID
+    guid: Optional[UUID] = None
+    guids: Optional[conlist(UUID, min_length=1)] = None  # type:ignore
     asset_type: constr(min_length=1)  # type:ignore
 
+    @model_validator(mode="after")
+    def check_guids(self):
+        if (self.guid is None) == (self.guids is None):
+            raise ValueError("exactly one of guid or guids must be provided")
+        return self
+
     @field_validator("asset_type")
     @classmethod
     def check_asset_type(cls, asset_type):
-        if asset_type not in ASSET_TYPES:
+        if asset_type not in ASSET_TYPE_NAMES:
             raise ValueError("asset_type must be a valid atlan asset type")
         return asset_type
 
@@ -34,13 +48,22 @@ class GetByGuidRequest(BaseModel):
 
 
 class GetByQnParams(BaseModel):
-    qualified_name: constr(min_length=1)  # type:ignore
+    qualified_name: Optional[constr(min_length=1)] = None  # type:ignore
+    qualified_names: Optional[conlist(constr(min_length=1), min_length=1)] = None  # type:ignore
     asset_type: constr(min_length=1)  # type:ignore
 
+    @model_validator(mode="after")
+    def check_qualified_names(self):
+        if (self.qualified_name is None) == (self.qualified_names is None):
+            raise ValueError(
+                "exactly one of qualified_name or qualified_names must be provided"
+            )
+        return self
+
     @field_validator("asset_type")
     @classmethod
     def check_asset_type(cls, asset_type):
-        if asset_type not in ASSET_TYPES:
+        if asset_type not in ASSET_TYPE_NAMES:
             raise ValueError("asset_type must be a valid atlan asset type")
         return asset_type
 
@@ -51,7 +74,20 @@ class GetByQnRequest(BaseModel):
 
 
 class PurgeParams(BaseModel):
-    assets_guids: conlist(UUID, min_length=1)  # type:ignore
+    assets_guids: Optional[conlist(UUID, min_length=1)] = None  # type:ignore
+    # bucket or connection qualified name whose bucket(s), s3 objects and
+    # lineage processes are purged
+    cascade_qualified_name: Optional[constr(min_length=1)] = None  # type:ignore
+    batch_size: conint(ge=1) = DEFAULT_BATCH_SIZE  # type:ignore
+    concurrency: conint(ge=1) = DEFAULT_CONCURRENCY  # type:ignore
+
+    @model_validator(mode="after")
+    def check_assets_to_purge(self):
+        if not self.assets_guids and not self.cascade_qualified_name:
+            raise ValueError(
+                "assets_guids or cascade_qualified_name must be provided"
+            )
+        return self
 
 
 class PurgeRequest(BaseModel):
@@ -59,6 +95,45 @@ class PurgeRequest(BaseModel):
     params: PurgeParams
 
 
+class UpsertContinuation(BaseModel):
+    start_after: Optional[str] = None
+    s3_bucket_guid: Optional[str] = None
+    s3_object_count: int = 0
+    failed_assets_count: int = 0
+    saved_processes_count: int = 0
+    skipped_processes_count: int = 0
+    # parts of the report written by the previous invocations
+    report_parts_count: int = 0
+
+
+class S3FileNamePattern(BaseModel):
+    # regex matched against the whole s3 key, with an optional {table_name}
+    # placeholder. the other fields override the lineage params of the
+    # request for the keys routed to this pattern
+    pattern: constr(min_length=1)  # type:ignore
+    source_connection_qualified_name: Optional[constr(min_length=1)] = None  # type:ignore
+    source_database_schema_qualified_name: Optional[constr(min_length=1)] = None  # type:ignore
+    source_table_pattern: Optional[str] = None
+    target_connection_qualified_name: Optional[constr(min_length=1)] = None  # type:ignore
+    target_database_schema_qualified_name: Optional[constr(min_length=1)] = None  # type:ignore
+    target_table_pattern: Optional[str] = None
+
+    @field_validator("pattern")
+    @classmethod
+    def check_pattern(cls, pattern):
+        # the patterns are combined into a single regex, their own named
+        # groups would clash with each other
+        if "(?P" in pattern or pattern.count("{table_name}") > 1:
+            raise ValueError(
+                "pattern must not define named groups or more than one {table_name}"
+            )
+        try:
+            re.compile(pattern.replace("{table_name}", "(.+)"))
+        except re.error as err:
+            raise ValueError(f"pattern is not a valid regex: {err}")
+        return pattern
+
+
 class UpsertS3AssetsAndLineageParams(BaseModel):
     s3_connection_qualified_name: constr(min_length=1)  # type:ignore
     asset_owners: Optional[list[str]]
@@ -75,8 +150,110 @@ class UpsertS3AssetsAndLineageParams(BaseModel):
     qualifier_suffix: constr(min_length=1)  # type:ignore
     s3_bucket_prefix: Optional[str]
     s3_file_name_pattern: Optional[str]
+    # several key layouts routed in a single listing, the first matching
+    # pattern wins. replaces s3_file_name_pattern
+    s3_file_name_patterns: Optional[conlist(S3FileNamePattern, min_length=1)] = None  # type:ignore
     source_table_pattern: Optional[str]
     target_table_pattern: Optional[str]
+    batch_size: conint(ge=1) = DEFAULT_BATCH_SIZE  # type:ignore
+    state_manifest_location: Optional[str] = None
+    full_resync: bool = False
+    concurrency: conint(ge=1) = DEFAULT_CONCURRENCY  # type:ignore
+    parallel_s3_listing: bool = False
+    s3_listing_shard_prefixes: Optional[list[str]] = None
+    # s3://bucket/key or local path of the manifest.json of an s3 inventory
+    # report read instead of listing the bucket, or of the folder of the
+    # inventory configuration to read its latest report
+    s3_inventory_manifest_location: Optional[constr(min_length=1)] = None  # type:ignore
+    reconcile_with_atlan: bool = False
+    resumable: bool = False
+    continuation: Optional[UpsertContinuation] = None
+    deadline_margin_seconds: conint(ge=0) = DEFAULT_DEADLINE_MARGIN_SECONDS  # type:ignore
+    # lineage processes identical to the ones in atlan are not saved again
+    skip_unchanged_processes: bool = True
+    # column names of the csv and tsv files read from their first bytes
+    sample_csv_headers: bool = False
+    # s3://bucket/key or local path of an ndjson report of the results of
+    # each s3 object, the response then only holds the counts
+    report_location: Optional[constr(min_length=1)] = None  # type:ignore
+    # s3://bucket/key or local path of a snapshot of the atlan tables,
+    # processes and s3 objects, only the assets updated since the last run
+    # are fetched. gzipped when ending with .gz
+    atlan_snapshot_location: Optional[constr(min_length=1)] = None  # type:ignore
+    # plans the writes of the sync, with the api calls and the duration it
+    # would take, without saving anything
+    dry_run: bool = False
+
+    @model_validator(mode="after")
+    def check_resumable(self):
+        if self.resumable and (
+            self.state_manifest_location
+            or self.reconcile_with_atlan
+            or self.parallel_s3_listing
+            or self.s3_listing_shard_prefixes
+            or self.s3_inventory_manifest_location
+        ):
+            raise ValueError(
+                "resumable runs list the bucket in key order and do not support "
+                "state_manifest_location, reconcile_with_atlan, parallel listings "
+                "or s3 inventories"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def check_dry_run(self):
+        if self.dry_run and (self.resumable or self.report_location):
+            raise ValueError(
+                "dry runs return their plan and do not support resumable runs "
+                "or report_location"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def check_inventory(self):
+        if self.s3_inventory_manifest_location and (
+            self.parallel_s3_listing or self.s3_listing_shard_prefixes
+        ):
+            raise ValueError(
+                "s3_inventory_manifest_location replaces the listing of the bucket "
+                "and does not support parallel listings"
+            )
+        # an inventory is a daily snapshot, the objects created since its
+        # report would be archived as missing from the listing
+        if self.s3_inventory_manifest_location and (
+            self.reconcile_with_atlan or self.state_manifest_location
+        ):
+            raise ValueError(
+                "s3_inventory_manifest_location does not support "
+                "reconcile_with_atlan or state_manifest_location"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def check_shard_prefixes(self):
+        # the shards are listed as they are, a shard outside of the bucket
+        # prefix or inside another shard would sync its objects twice
+        shard_prefixes = self.s3_listing_shard_prefixes or []
+        for shard_prefix in shard_prefixes:
+            if not shard_prefix.startswith(self.s3_bucket_prefix or ""):
+                raise ValueError(
+                    f"shard prefix {shard_prefix} is not under s3_bucket_prefix"
+                )
+        for index, shard_prefix in enumerate(shard_prefixes):
+            for other_index, other_prefix in enumerate(shard_prefixes):
+                if other_index != index and other_prefix.startswith(shard_prefix):
+                    raise ValueError(
+                        f"shard prefixes {shard_prefix} and {other_prefix} overlap"
+                    )
+        return self
+
+    @model_validator(mode="after")
+    def check_file_name_patterns(self):
+        if self.s3_file_name_pattern and self.s3_file_name_patterns:
+            raise ValueError(
+                "s3_file_name_pattern and s3_file_name_patterns are mutually exclusive"
+            )
+        return self
 
 
 class UpsertS3AssetsAndLineageRequest(BaseModel):
@@ -84,6 +261,47 @@ class UpsertS3AssetsAndLineageRequest(BaseModel):
     params: UpsertS3AssetsAndLineageParams
 
 
+class UpsertS3BucketsAndLineageParams(BaseModel):
+    # params common to all the buckets, each bucket overriding them
+    defaults: dict = {}
+    buckets: conlist(UpsertS3AssetsAndLineageParams, min_length=1)  # type:ignore
+    bucket_concurrency: conint(ge=1) = DEFAULT_BUCKET_CONCURRENCY  # type:ignore
+
+    @model_validator(mode="before")
+    @classmethod
+    def merge_defaults(cls, params):
+        if isinstance(params, dict) and params.get("defaults"):
+            params = {
+                **params,
+                "buckets": [
+                    {**params["defaults"], **bucket}
+                    for bucket in params.get("buckets") or []
+                ],
+            }
+        return params
+
+    @model_validator(mode="after")
+    def check_buckets(self):
+        if any(bucket.resumable for bucket in self.buckets):
+            raise ValueError("resumable runs are not supported in a batch of buckets")
+        for location_name in ("state_manifest_location", "report_location"):
+            locations = [
+                getattr(bucket, location_name)
+                for bucket in self.buckets
+                if getattr(bucket, location_name)
+            ]
+            if len(locations) != len(set(locations)):
+                raise ValueError(f"each bucket must have its own {location_name}")
+        if len({bucket.atlan_snapshot_location for bucket in self.buckets}) > 1:
+            raise ValueError("the buckets must share the same atlan_snapshot_location")
+        return self
+
+
+class UpsertS3BucketsAndLineageRequest(BaseModel):
+    operation: constr(pattern="^upsert_s3_buckets_and_lineage$")  # type:ignore
+    params: UpsertS3BucketsAndLineageParams
+
+
 class RequestSchema(BaseModel):
     request: Union[
         UpsertS3ConnectionRequest,
@@ -91,6 +309,7 @@ class RequestSchema(BaseModel):
         GetByQnRequest,
         PurgeRequest,
         UpsertS3AssetsAndLineageRequest,
+        UpsertS3BucketsAndLineageRequest,
     ]
 
 
@@ -99,6 +318,13 @@ def validate_input(req):
     return RequestSchema(**request).request
 
 
+def validate_s3_events_config(config):
+    config = UpsertS3BucketsAndLineageParams(**config)
+    if any(bucket.dry_run for bucket in config.buckets):
+        raise ValueError("s3 event notifications cannot be synced in dry runs")
+    return config
+
+
 if __name__ == "__main__":
     upsert_s3_connection_request = {
         "operation": "upsert_s3_connection",
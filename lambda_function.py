@@ -1,13 +1,90 @@
-import boto3
-from pyatlan.client.atlan import AtlanClient
-from pyatlan.model.assets import (
-    S3Object,
+import json
+import os
+import time
+from collections import Counter
+
+MODULE_IMPORT_STARTED_AT = time.perf_counter()
+
+from asset_cache import TTLCache
+from constants import (
+    ASSET_INFO_CACHE_MAX_SIZE,
+    ASSET_INFO_CACHE_TTL_SECONDS,
+    CSV_HEADERS_CACHE_MAX_SIZE,
+    CSV_HEADERS_CACHE_TTL_SECONDS,
+    SCHEMA_TABLE_INDEX_CACHE_MAX_SIZE,
+    SCHEMA_TABLE_INDEX_CACHE_TTL_SECONDS,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_BUCKET_CONCURRENCY,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_DEADLINE_MARGIN_SECONDS,
+    DRY_RUN_MAX_LISTED_CHANGES,
+    DRY_RUN_WRITE_LATENCY_SECONDS,
+    S3_EVENTS_CONFIG_ENV_VAR,
+    logger,
+)
+from execution import call_with_retry, run_concurrently
+from input_validation import validate_input, validate_s3_events_config
+from metrics import (
+    METRICS,
+    InstrumentedAtlanClient,
+    InstrumentedAwsSession,
+    emit_emf_records,
+)
+from run_report import build_report_writer, report_part_location
+from s3_events import is_s3_event, latest_event_by_key, parse_s3_event_records
+from s3_operations import (
+    S3ListedObject,
+    SharedClientsSession,
+    build_listing_scope,
+    build_s3_key_router,
+    iter_in_background,
+    iter_s3_bucket_objects_and_table_names,
+    iter_with_csv_headers,
 )
+from state_manifest import (
+    build_manifest_store,
+    load_manifest_objects,
+    manifest_entry,
+    manifest_status,
+    save_manifest_objects,
+)
+
 
-from atlan_operations import *
-from constants import logger
-from input_validation import validate_input
-from s3_operations import get_s3_bucket_objects_and_table_names
+ASSET_INFO_CACHE = TTLCache(ASSET_INFO_CACHE_MAX_SIZE, ASSET_INFO_CACHE_TTL_SECONDS)
+CSV_HEADERS_CACHE = TTLCache(CSV_HEADERS_CACHE_MAX_SIZE, CSV_HEADERS_CACHE_TTL_SECONDS)
+SCHEMA_TABLE_INDEX_CACHE = TTLCache(
+    SCHEMA_TABLE_INDEX_CACHE_MAX_SIZE, SCHEMA_TABLE_INDEX_CACHE_TTL_SECONDS
+)
+
+# pyatlan and boto3 are imported on first use by the operations that need
+# them, and their clients are kept across the warm invocations of the lambda
+WARM_CLIENTS = {}
+STARTUP = {"cold_start": True}
+# validated s3 events config, by value of the environment variable
+S3_EVENTS_CONFIG = {}
+
+
+def file_name_regex_of(s3_file_name_pattern=None, s3_file_name_patterns=None):
+    # a single regex, or the regexes of the patterns tried in order
+    if s3_file_name_patterns:
+        return [
+            file_name_pattern["pattern"] for file_name_pattern in s3_file_name_patterns
+        ]
+    return s3_file_name_pattern
+
+
+def settled_object_record(queued, s3_object_guid, processes_guids):
+    # report record of a written s3 object
+    failed = s3_object_guid is None or len(processes_guids) != len(
+        queued.processes_guids
+    )
+    return {
+        "key": queued.listed_object.key,
+        "table_name": queued.listed_object.table_name,
+        "action": "failed" if failed else queued.action,
+        "guid": s3_object_guid,
+        "processes_guids": processes_guids,
+    }
 
 
 def upsert_s3_assets_and_lineage(
@@ -28,115 +105,1124 @@ def upsert_s3_assets_and_lineage(
     qualifier_suffix,
     s3_bucket_prefix=None,
     s3_file_name_pattern=None,
+    s3_file_name_patterns=None,
     source_table_pattern=None,
     target_table_pattern=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    state_manifest_location=None,
+    full_resync=False,
+    concurrency=DEFAULT_CONCURRENCY,
+    parallel_s3_listing=False,
+    s3_listing_shard_prefixes=None,
+    s3_inventory_manifest_location=None,
+    reconcile_with_atlan=False,
+    resumable=False,
+    continuation=None,
+    deadline_margin_seconds=DEFAULT_DEADLINE_MARGIN_SECONDS,
+    lambda_context=None,
+    schema_table_indexes=None,
+    skip_unchanged_processes=True,
+    sample_csv_headers=False,
+    report_location=None,
+    atlan_snapshot=None,
+    dry_run=False,
 ):
-    s3_bucket_atlan_arn = f"{s3_bucket_arn}-{qualifier_suffix}"
-    bucket_qualified_name = f"{s3_connection_qualified_name}/{s3_bucket_atlan_arn}"
+    from atlan_operations import archive_atlan_assets
+    from s3_lineage_sync import S3LineageSync
 
-    logger.info("fetching s3 object names")
-    s3_objects_and_tablenames = get_s3_bucket_objects_and_table_names(
-        aws_session,
-        s3_bucket_name,
-        s3_prefix=s3_bucket_prefix,
-        file_name_regex=s3_file_name_pattern,
+    sync_params = dict(
+        s3_connection_qualified_name=s3_connection_qualified_name,
+        asset_owners=asset_owners,
+        source_connection_qualified_name=source_connection_qualified_name,
+        source_database_schema_qualified_name=source_database_schema_qualified_name,
+        target_connection_qualified_name=target_connection_qualified_name,
+        target_database_schema_qualified_name=target_database_schema_qualified_name,
+        source_extraction_process_name_suffix=source_extraction_process_name_suffix,
+        source_extraction_process_id_suffix=source_extraction_process_id_suffix,
+        target_import_process_name_suffix=target_import_process_name_suffix,
+        target_import_process_id_suffix=target_import_process_id_suffix,
+        s3_bucket_name=s3_bucket_name,
+        s3_bucket_arn=s3_bucket_arn,
+        qualifier_suffix=qualifier_suffix,
+        s3_bucket_prefix=s3_bucket_prefix,
+        source_table_pattern=source_table_pattern,
+        target_table_pattern=target_table_pattern,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        file_name_patterns=s3_file_name_patterns,
+        schema_table_indexes=schema_table_indexes,
+        skip_unchanged_processes=skip_unchanged_processes,
+        atlan_snapshot=atlan_snapshot,
     )
+    file_name_regex = file_name_regex_of(s3_file_name_pattern, s3_file_name_patterns)
+
+    if resumable:
+        return upsert_s3_assets_and_lineage_resumable(
+            atlan_client,
+            aws_session,
+            S3LineageSync(atlan_client, **sync_params),
+            file_name_regex=file_name_regex,
+            continuation=continuation,
+            deadline_margin_seconds=deadline_margin_seconds,
+            lambda_context=lambda_context,
+            sample_csv_headers=sample_csv_headers,
+            report_location=report_location,
+        )
+
+    if dry_run:
+        return plan_s3_assets_and_lineage(
+            atlan_client,
+            aws_session,
+            S3LineageSync(atlan_client, **sync_params, dry_run=True),
+            file_name_regex=file_name_regex,
+            state_manifest_location=state_manifest_location,
+            full_resync=full_resync,
+            reconcile_with_atlan=reconcile_with_atlan,
+            sample_csv_headers=sample_csv_headers,
+            lambda_context=lambda_context,
+            parallel=parallel_s3_listing,
+            shard_prefixes=s3_listing_shard_prefixes,
+            concurrency=concurrency,
+            inventory_manifest_location=s3_inventory_manifest_location,
+        )
+
+    sync = S3LineageSync(atlan_client, **sync_params)
+    bucket_qualified_name = sync.bucket_qualified_name
 
     upserted_assets = {
         "s3_bucket_guid": None,
         "s3_objects_guids": [],
         "processes_guids": [],
+        "failed_assets": [],
     }
 
-    logger.info("creating or updating the s3 bucket asset")
-    upserted_assets["s3_bucket_guid"] = create_or_update_atlan_s3_bucket(
-        atlan_client=atlan_client,
-        connection_qualified_name=s3_connection_qualified_name,
-        bucket_qualified_name=bucket_qualified_name,
-        bucket_name=s3_bucket_name,
-        bucket_aws_arn=s3_bucket_atlan_arn,
-        bucket_object_count=len(s3_objects_and_tablenames),
-        asset_owners=asset_owners
+    manifest_store = None
+    manifest_objects = {}
+    if state_manifest_location:
+        manifest_store = build_manifest_store(aws_session, state_manifest_location)
+        with METRICS.phase("manifest_load"):
+            manifest_objects = load_manifest_objects(
+                manifest_store, bucket_qualified_name
+            )
+        if sample_csv_headers:
+            # the headers recorded in the manifest are not sampled again
+            for key, entry in manifest_objects.items():
+                if entry.get("csv_headers"):
+                    CSV_HEADERS_CACHE.set(
+                        (s3_bucket_name, key, entry["e_tag"]), entry["csv_headers"]
+                    )
 
-    )
+    report = None
+    if report_location:
+        report = build_report_writer(aws_session, report_location)
 
-    logger.info("creating or updating s3 assets and their lineage...")
-    for s3_obj_name, table_name in s3_objects_and_tablenames:
-        s3_object_qualified_name = f"{bucket_qualified_name}/{s3_obj_name}"
-        logger.info(f"creating or updating {s3_obj_name} s3 asset...")
-        upserted_assets["s3_objects_guids"].append(
-            create_or_update_atlan_s3_object(
-                atlan_client=atlan_client,
-                connection_qualified_name=s3_connection_qualified_name,
-                bucket_qualified_name=bucket_qualified_name,
-                s3_object_qualified_name=s3_object_qualified_name,
-                s3_object_name=s3_obj_name,
-                s3_object_aws_arn=f"{s3_bucket_atlan_arn}/{s3_obj_name}",
-                asset_owners=asset_owners
-            )
-        )
-        search_pattern = table_name
-        if source_table_pattern and "{table_name}" in source_table_pattern:
-            search_pattern = source_table_pattern.format(table_name=table_name)
-        source_tables = search_table_in_schema(
-            atlan_client, source_database_schema_qualified_name, search_pattern
-        )
-        if source_tables:
-            logger.info(
-                f"creating or updating source to staging lineage for {table_name}..."
-            )
-            upserted_assets["processes_guids"].append(
-                create_or_update_lineage(
-                    atlan_client=atlan_client,
-                    process_name=f"{table_name} {source_extraction_process_name_suffix}",
-                    process_id=f"{table_name}_{source_extraction_process_id_suffix}",
-                    connection_qualified_name=source_connection_qualified_name,
-                    inputs=source_tables,
-                    outputs=[
-                        S3Object.ref_by_qualified_name(
-                            qualified_name=s3_object_qualified_name
-                        )
-                    ],
-                    asset_owners=asset_owners
+    def record_settled_objects(settled_objects):
+        # manifest entries and report records of the written s3 objects
+        for queued, s3_object_guid, processes_guids in settled_objects:
+            record = settled_object_record(queued, s3_object_guid, processes_guids)
+            if manifest_store is not None:
+                if record["action"] == "failed":
+                    # not recorded so that the object is retried on the next run
+                    manifest_objects.pop(record["key"], None)
+                else:
+                    manifest_objects[record["key"]] = manifest_entry(
+                        queued.listed_object, s3_object_guid, processes_guids
+                    )
+            if report is not None:
+                report.write(record)
+
+    def list_s3_objects():
+        # the phase includes the time the listing waits for the writes
+        with METRICS.phase("s3_listing"):
+            yield from iter_s3_bucket_objects_and_table_names(
+                aws_session,
+                s3_bucket_name,
+                s3_prefix=s3_bucket_prefix,
+                file_name_regex=file_name_regex,
+                parallel=parallel_s3_listing,
+                shard_prefixes=s3_listing_shard_prefixes,
+                concurrency=concurrency,
+                inventory_manifest_location=s3_inventory_manifest_location,
+            )
+
+    # keys listed, needed to find the removed objects
+    listed_keys = set()
+    listed_counts = {"listed": 0, "added": 0, "changed": 0, "unchanged": 0}
+
+    def s3_objects_to_write(listed_objects):
+        for listed_object in listed_objects:
+            listed_counts["listed"] += 1
+            if manifest_store is None and not reconcile_with_atlan:
+                yield listed_object
+                continue
+            listed_keys.add(listed_object.key)
+            if manifest_store is None:
+                yield listed_object
+                continue
+            entry = manifest_objects.get(listed_object.key)
+            status = manifest_status(listed_object, entry)
+            listed_counts[status] += 1
+            if status != "unchanged" or full_resync:
+                yield listed_object
+            elif report is not None:
+                report.write(
+                    {
+                        "key": listed_object.key,
+                        "table_name": listed_object.table_name,
+                        "action": "unchanged",
+                        "guid": entry["guid"],
+                        "processes_guids": entry["processes_guids"],
+                    }
+                )
+
+    try:
+        # the bucket is listed in a background thread, a bounded number of
+        # pages ahead of the writes: the s3 objects are saved while the next
+        # pages are listed
+        logger.info("fetching s3 object names")
+        listed_objects = iter_in_background(list_s3_objects())
+
+        prepared = False
+        try:
+            logger.info("creating or updating s3 assets and their lineage...")
+            written_objects = s3_objects_to_write(listed_objects)
+            if sample_csv_headers:
+                written_objects = iter_with_csv_headers(
+                    aws_session,
+                    s3_bucket_name,
+                    written_objects,
+                    CSV_HEADERS_CACHE,
+                    concurrency,
                 )
+            with METRICS.phase("asset_writes"):
+                for listed_object in written_objects:
+                    if not prepared:
+                        # the bucket is saved before its s3 objects, its
+                        # object count is only known once the listing is over.
+                        # the tables are only indexed when there is something
+                        # to write
+                        with METRICS.phase("bucket_save"):
+                            sync.save_bucket(None)
+                        with METRICS.phase("table_indexing"):
+                            sync.prepare(reconcile_with_atlan=reconcile_with_atlan)
+                        prepared = True
+                    sync.queue(listed_object)
+                    if report is not None:
+                        # the report is written as the batches are saved
+                        record_settled_objects(sync.drain_settled())
+                sync.wait()
+            if reconcile_with_atlan and not prepared:
+                with METRICS.phase("table_indexing"):
+                    sync.prepare(index_tables=False, reconcile_with_atlan=True)
+        finally:
+            listed_objects.close()
+            sync.close()
+
+        with METRICS.phase("bucket_save"):
+            upserted_assets["s3_bucket_guid"] = sync.save_bucket(
+                listed_counts["listed"]
             )
 
-        search_pattern = table_name
-        if target_table_pattern and "{table_name}" in target_table_pattern:
-            search_pattern = target_table_pattern.format(table_name=table_name)
-        target_tables = search_table_in_schema(
-            atlan_client, target_database_schema_qualified_name, search_pattern
+        if report is None:
+            upserted_assets["s3_objects_guids"] = sync.s3_objects_guids()
+            upserted_assets["processes_guids"] = sync.processes_guids()
+        record_settled_objects(sync.drain_settled())
+        upserted_assets["failed_assets"] = sync.failures()
+        upserted_assets["saved_processes_count"] = sync.processes_counts["saved"]
+        upserted_assets["skipped_processes_count"] = sync.processes_counts["skipped"]
+
+        # only the objects that this listing could have returned are archived,
+        # the scope of the listing may have changed since the manifest was saved
+        in_scope = build_listing_scope(
+            s3_bucket_prefix, file_name_regex, s3_listing_shard_prefixes
         )
-        if target_tables:
+        removed_keys = []
+        if manifest_store is not None:
+            removed_keys = [
+                key
+                for key in manifest_objects
+                if key not in listed_keys and in_scope(key)
+            ]
             logger.info(
-                f"creating or updating staging to target lineage for {table_name}..."
-            )
-            upserted_assets["processes_guids"].append(
-                create_or_update_lineage(
-                    atlan_client=atlan_client,
-                    process_name=f"{table_name} {target_import_process_name_suffix}",
-                    process_id=f"{table_name} {target_import_process_id_suffix}",
-                    connection_qualified_name=target_connection_qualified_name,
-                    inputs=[
-                        S3Object.ref_by_qualified_name(
-                            qualified_name=s3_object_qualified_name
-                        )
-                    ],
-                    outputs=target_tables,
-                    asset_owners=asset_owners
-                )
+                f"{listed_counts['added']} added, {listed_counts['changed']} changed, "
+                f"{listed_counts['unchanged']} unchanged and {len(removed_keys)} "
+                f"removed s3 objects since the last run"
             )
+            upserted_assets["added_s3_objects_count"] = listed_counts["added"]
+            upserted_assets["changed_s3_objects_count"] = listed_counts["changed"]
+            upserted_assets["unchanged_s3_objects_count"] = listed_counts["unchanged"]
+
+        # keys of the s3 objects to archive, by guid
+        archived_keys = {}
+        guids_to_archive = []
+        if reconcile_with_atlan:
+            for qualified_name in sync.existing_s3_objects:
+                key = qualified_name[len(bucket_qualified_name) + 1:]
+                if key not in listed_keys and in_scope(key):
+                    guid = sync.existing_s3_objects[qualified_name].guid
+                    guids_to_archive.append(guid)
+                    archived_keys[guid] = key
+            upserted_assets["created_s3_objects_count"] = sync.s3_objects_counts["created"]
+            upserted_assets["updated_s3_objects_count"] = sync.s3_objects_counts["updated"]
+            upserted_assets["skipped_s3_objects_count"] = sync.s3_objects_counts["skipped"]
+            upserted_assets["archived_s3_objects_count"] = len(guids_to_archive)
+
+        removed_entries = {}
+        if manifest_store is not None:
+            removed_entries = {key: manifest_objects.pop(key) for key in removed_keys}
+
+            # processes are named after the table, so they can still be used by
+            # another s3 object of the same table
+            live_processes_guids = {
+                guid
+                for entry in manifest_objects.values()
+                for guid in entry["processes_guids"]
+            }
+            for key, entry in removed_entries.items():
+                if entry["guid"] not in guids_to_archive:
+                    guids_to_archive.append(entry["guid"])
+                    archived_keys[entry["guid"]] = key
+                guids_to_archive.extend(
+                    guid
+                    for guid in entry["processes_guids"]
+                    if guid not in live_processes_guids and guid not in guids_to_archive
+                )
+
+        if guids_to_archive:
+            with METRICS.phase("archive"):
+                archived_guids, failures = archive_atlan_assets(
+                    atlan_client, guids_to_archive, batch_size, concurrency
+                )
+            upserted_assets["failed_assets"].extend(failures)
+        else:
+            archived_guids, failures = [], []
+        if (manifest_store is not None or reconcile_with_atlan) and report is None:
+            upserted_assets["archived_assets_guids"] = archived_guids
+        failed_guids = {failure["guid"] for failure in failures}
+        if report is not None:
+            for guid, key in archived_keys.items():
+                report.write(
+                    {
+                        "key": key,
+                        "action": "archive_failed" if guid in failed_guids else "archived",
+                        "guid": guid,
+                    }
+                )
+
+        if manifest_store is not None:
+            # removed objects that could not be archived are retried on the next run
+            for key, entry in removed_entries.items():
+                if entry["guid"] in failed_guids:
+                    manifest_objects[key] = entry
+
+            with METRICS.phase("manifest_save"):
+                save_manifest_objects(
+                    manifest_store, bucket_qualified_name, manifest_objects
+                )
+
+        if report is not None:
+            # the response only holds the counts, the failures are reported
+            failed_assets = upserted_assets.pop("failed_assets")
+            del upserted_assets["s3_objects_guids"], upserted_assets["processes_guids"]
+            for failure in failed_assets:
+                report.write({"action": "error", **failure})
+            with METRICS.phase("report_save"):
+                report.close()
+            upserted_assets["failed_assets_count"] = len(failed_assets)
+            upserted_assets["report_location"] = report_location
+            upserted_assets["report_counts"] = dict(report.counts)
+    except Exception:
+        if report is not None:
+            report.abort()
+        raise
 
     return upserted_assets
 
 
+def upsert_s3_assets_and_lineage_resumable(
+    atlan_client,
+    aws_session,
+    sync,
+    file_name_regex=None,
+    continuation=None,
+    deadline_margin_seconds=DEFAULT_DEADLINE_MARGIN_SECONDS,
+    lambda_context=None,
+    sample_csv_headers=False,
+    report_location=None,
+):
+    # lists and writes the bucket in key order and stops before the lambda
+    # deadline. the returned continuation holds the last written key and the
+    # counts so far, and resumes the run when passed to the next invocation.
+    # each response holds the guids written by its own invocation, or with a
+    # report_location each invocation writes its own part of the report
+    progress = {
+        "start_after": None,
+        "s3_bucket_guid": None,
+        "s3_object_count": 0,
+        "failed_assets_count": 0,
+        "saved_processes_count": 0,
+        "skipped_processes_count": 0,
+        "report_parts_count": 0,
+    }
+    progress.update(continuation or {})
+
+    def deadline_is_near():
+        return (
+            lambda_context is not None
+            and lambda_context.get_remaining_time_in_millis()
+            < deadline_margin_seconds * 1000
+        )
+
+    report = None
+    if report_location:
+        # an s3 object cannot be appended to, the parts are numbered from 1
+        report_part = report_part_location(
+            report_location, progress["report_parts_count"] + 1
+        )
+        report = build_report_writer(aws_session, report_part)
+
+    def record_settled_objects():
+        for settled in sync.drain_settled():
+            report.write(settled_object_record(*settled))
+
+    try:
+        if progress["s3_bucket_guid"] is None:
+            # the object count is only known once the whole bucket is listed
+            with METRICS.phase("bucket_save"):
+                progress["s3_bucket_guid"] = sync.save_bucket(None)
+
+        interrupted = False
+        try:
+            with METRICS.phase("table_indexing"):
+                sync.prepare()
+            logger.info(
+                f"creating or updating s3 assets after {progress['start_after']}"
+            )
+            # the listing is interleaved with the writes, its own time is in
+            # the s3.list_objects_v2 call metrics
+            listed_objects = iter_s3_bucket_objects_and_table_names(
+                aws_session,
+                sync.s3_bucket_name,
+                s3_prefix=sync.s3_bucket_prefix,
+                file_name_regex=file_name_regex,
+                start_after=progress["start_after"],
+            )
+            if sample_csv_headers:
+                listed_objects = iter_with_csv_headers(
+                    aws_session,
+                    sync.s3_bucket_name,
+                    listed_objects,
+                    CSV_HEADERS_CACHE,
+                    sync.concurrency,
+                )
+            with METRICS.phase("asset_writes"):
+                for listed_object in listed_objects:
+                    sync.queue(listed_object)
+                    if report is not None:
+                        record_settled_objects()
+                    progress["start_after"] = listed_object.key
+                    progress["s3_object_count"] += 1
+                    if deadline_is_near():
+                        interrupted = True
+                        break
+                sync.wait()
+        finally:
+            sync.close()
+
+        invocation_results = {}
+        failed_assets = sync.failures()
+        if report is None:
+            invocation_results["s3_objects_guids"] = sync.s3_objects_guids()
+            invocation_results["processes_guids"] = sync.processes_guids()
+            invocation_results["failed_assets"] = failed_assets
+        else:
+            record_settled_objects()
+            for failure in failed_assets:
+                report.write({"action": "error", **failure})
+            with METRICS.phase("report_save"):
+                report.close()
+            progress["report_parts_count"] += 1
+            invocation_results["report_location"] = report_part
+            invocation_results["report_counts"] = dict(report.counts)
+        progress["failed_assets_count"] += len(failed_assets)
+        progress["saved_processes_count"] += sync.processes_counts["saved"]
+        progress["skipped_processes_count"] += sync.processes_counts["skipped"]
+
+        if interrupted:
+            logger.info(
+                f"stopping before the lambda deadline after {progress['start_after']}"
+            )
+            return {"complete": False, "continuation": progress, **invocation_results}
+
+        with METRICS.phase("bucket_save"):
+            sync.save_bucket(progress["s3_object_count"])
+    except Exception:
+        if report is not None:
+            report.abort()
+        raise
+    del progress["start_after"]
+    return {"complete": True, **progress, **invocation_results}
+
+
+def plan_s3_assets_and_lineage(
+    atlan_client,
+    aws_session,
+    sync,
+    file_name_regex=None,
+    state_manifest_location=None,
+    full_resync=False,
+    reconcile_with_atlan=False,
+    sample_csv_headers=False,
+    lambda_context=None,
+    **listing_params,
+):
+    # dry run: lists the bucket and reads the manifest and the atlan state
+    # like a sync, then plans its writes without saving anything. returns the
+    # planned changes, the api calls of the sync and its estimated duration:
+    # the time of the reads of the dry run plus the time of the planned
+    # writes at the latencies measured by the container
+    manifest_objects = {}
+    if state_manifest_location:
+        with METRICS.phase("manifest_load"):
+            manifest_objects = load_manifest_objects(
+                build_manifest_store(aws_session, state_manifest_location),
+                sync.bucket_qualified_name,
+            )
+
+    listed_keys = set()
+    planned_counts = Counter()
+    planned_changes = []
+    unlisted_changes = Counter()
+
+    def plan_change(change):
+        # the unchanged objects are only counted
+        planned_counts[change["action"]] += 1
+        if change["action"] == "unchanged":
+            return
+        if len(planned_changes) < DRY_RUN_MAX_LISTED_CHANGES:
+            planned_changes.append(change)
+        else:
+            unlisted_changes["count"] += 1
+
+    def s3_objects_to_plan(listed_objects):
+        for listed_object in listed_objects:
+            listed_keys.add(listed_object.key)
+            if state_manifest_location and not full_resync and (
+                manifest_status(listed_object, manifest_objects.get(listed_object.key))
+                == "unchanged"
+            ):
+                planned_counts["unchanged"] += 1
+                continue
+            yield listed_object
+
+    queued_count = 0
+    try:
+        with METRICS.phase("table_indexing"):
+            sync.prepare(reconcile_with_atlan=reconcile_with_atlan)
+        # the listing phase also times the planning of the listed objects,
+        # which a sync overlaps with its writes
+        with METRICS.phase("s3_listing"):
+            listed_objects = s3_objects_to_plan(
+                iter_s3_bucket_objects_and_table_names(
+                    aws_session,
+                    sync.s3_bucket_name,
+                    s3_prefix=sync.s3_bucket_prefix,
+                    file_name_regex=file_name_regex,
+                    **listing_params,
+                )
+            )
+            if sample_csv_headers:
+                listed_objects = iter_with_csv_headers(
+                    aws_session,
+                    sync.s3_bucket_name,
+                    listed_objects,
+                    CSV_HEADERS_CACHE,
+                    sync.concurrency,
+                )
+            for listed_object in listed_objects:
+                sync.queue(listed_object)
+                queued_count += 1
+                for queued, _, _ in sync.drain_settled():
+                    plan_change(
+                        {
+                            "key": queued.listed_object.key,
+                            "table_name": queued.listed_object.table_name,
+                            "action": queued.action,
+                            # no process when no table matches the name
+                            "processes_count": len(queued.processes_guids),
+                        }
+                    )
+            sync.wait()
+    finally:
+        sync.close()
+
+    in_scope = build_listing_scope(
+        sync.s3_bucket_prefix, file_name_regex, listing_params.get("shard_prefixes")
+    )
+    archived_keys = []
+    if reconcile_with_atlan:
+        for qualified_name in sync.existing_s3_objects:
+            key = qualified_name[len(sync.bucket_qualified_name) + 1:]
+            if key not in listed_keys and in_scope(key):
+                archived_keys.append(key)
+    archived_processes_guids = set()
+    if state_manifest_location:
+        removed_keys = [
+            key for key in manifest_objects if key not in listed_keys and in_scope(key)
+        ]
+        archived_keys += [key for key in removed_keys if key not in archived_keys]
+        live_processes_guids = {
+            guid
+            for key, entry in manifest_objects.items()
+            if key not in removed_keys
+            for guid in entry["processes_guids"]
+        }
+        archived_processes_guids = {
+            guid
+            for key in removed_keys
+            for guid in manifest_objects[key]["processes_guids"]
+            if guid not in live_processes_guids
+        }
+    for key in archived_keys:
+        plan_change({"key": key, "action": "archived"})
+
+    s3_object_batches = sync.s3_objects_writer.batches_count
+    process_batches = sync.processes_writer.batches_count
+    archived_assets_count = len(archived_keys) + len(archived_processes_guids)
+    archive_batches = -(-archived_assets_count // sync.batch_size)
+    # the bucket is saved before its first object and once the listing is over
+    bucket_saves = 2 if queued_count else 1
+
+    summary = METRICS.summary()
+    # the reads of the dry run are the ones of the sync
+    api_calls = Counter(
+        {name: stats["count"] for name, stats in summary["calls"].items()}
+    )
+    api_calls["atlan.save"] += bucket_saves + s3_object_batches + process_batches
+    if archive_batches:
+        api_calls["atlan.delete_by_guid"] += archive_batches
+    if state_manifest_location:
+        api_calls["s3.put_object"] += 1
+
+    latencies = {
+        name: METRICS.latency(name, DRY_RUN_WRITE_LATENCY_SECONDS)
+        for name in (
+            "atlan.save",
+            "s3_object_batches",
+            "lineage_process_batches",
+            "atlan.delete_by_guid",
+        )
+    }
+    listing_seconds = summary["phases_ms"].get("s3_listing", 0) / 1000
+    # the batches are saved concurrently while the bucket is listed
+    writes_seconds = (
+        s3_object_batches * latencies["s3_object_batches"]
+        + process_batches * latencies["lineage_process_batches"]
+    ) / sync.concurrency
+    estimated_duration_seconds = (
+        summary["duration_ms"] / 1000
+        - listing_seconds
+        + max(listing_seconds, writes_seconds)
+        + bucket_saves * latencies["atlan.save"]
+        + archive_batches * latencies["atlan.delete_by_guid"] / sync.concurrency
+    )
+
+    plan = {
+        "dry_run": True,
+        "planned_counts": dict(planned_counts),
+        "planned_changes": planned_changes,
+        "unlisted_changes_count": unlisted_changes["count"],
+        "planned_writes": {
+            "s3_objects_count": sync.s3_objects_writer.assets_count,
+            "processes_count": sync.processes_counts["saved"],
+            "skipped_processes_count": sync.processes_counts["skipped"],
+            "archived_assets_count": archived_assets_count,
+        },
+        "projected_api_calls": dict(sorted(api_calls.items())),
+        "write_latencies_ms": {
+            name: round(latency * 1000, 1) for name, latency in latencies.items()
+        },
+        "estimated_duration_seconds": round(estimated_duration_seconds, 1),
+    }
+    if lambda_context is not None:
+        # the timeout of the function, the dry run being one of its invocations
+        timeout_seconds = (
+            lambda_context.get_remaining_time_in_millis() / 1000
+            + summary["duration_ms"] / 1000
+        )
+        plan["fits_in_one_invocation"] = estimated_duration_seconds < timeout_seconds
+    return plan
+
+
+def upsert_s3_buckets_and_lineage(
+    atlan_client,
+    aws_session,
+    buckets,
+    bucket_concurrency=DEFAULT_BUCKET_CONCURRENCY,
+    lambda_context=None,
+):
+    # syncs several buckets concurrently with the same clients. the tables of
+    # a schema are fetched once for all the buckets pointing at it, and a
+    # failed bucket does not stop the others. returns the result of each
+    # bucket and the counts of the atlan snapshot shared by the buckets
+    from atlan_operations import SchemaTableIndexCache
+    from atlan_snapshot import open_atlan_snapshot
+
+    with open_atlan_snapshot(
+        aws_session,
+        buckets[0]["atlan_snapshot_location"],
+        any(bucket_params["full_resync"] for bucket_params in buckets),
+        dry_run=all(bucket_params["dry_run"] for bucket_params in buckets),
+    ) as atlan_snapshot:
+        schema_table_indexes = SchemaTableIndexCache(atlan_client, atlan_snapshot)
+
+        def upsert_bucket(bucket_params):
+            started_at = time.perf_counter()
+            bucket_result = {
+                "s3_bucket_name": bucket_params["s3_bucket_name"],
+                "s3_bucket_prefix": bucket_params["s3_bucket_prefix"],
+            }
+            try:
+                bucket_result["upserted_assets"] = upsert_s3_assets_and_lineage(
+                    atlan_client,
+                    aws_session,
+                    **{
+                        name: value
+                        for name, value in bucket_params.items()
+                        if name != "atlan_snapshot_location"
+                    },
+                    lambda_context=lambda_context,
+                    schema_table_indexes=schema_table_indexes,
+                    atlan_snapshot=atlan_snapshot,
+                )
+            except Exception as err:
+                logger.exception(f"failed to sync {bucket_params['s3_bucket_name']}")
+                bucket_result["error"] = str(err)
+            bucket_result["duration_ms"] = round(
+                (time.perf_counter() - started_at) * 1000, 1
+            )
+            return bucket_result
+
+        buckets_results = run_concurrently(upsert_bucket, buckets, bucket_concurrency)
+    return buckets_results, dict(atlan_snapshot.counts) if atlan_snapshot else None
+
+
+# params of the bucket configs passed as is to S3LineageSync
+SYNC_PARAM_NAMES = [
+    "s3_connection_qualified_name",
+    "asset_owners",
+    "source_connection_qualified_name",
+    "source_database_schema_qualified_name",
+    "target_connection_qualified_name",
+    "target_database_schema_qualified_name",
+    "source_extraction_process_name_suffix",
+    "source_extraction_process_id_suffix",
+    "target_import_process_name_suffix",
+    "target_import_process_id_suffix",
+    "s3_bucket_name",
+    "s3_bucket_arn",
+    "qualifier_suffix",
+    "s3_bucket_prefix",
+    "source_table_pattern",
+    "target_table_pattern",
+    "batch_size",
+    "concurrency",
+    "skip_unchanged_processes",
+]
+
+
+def sync_s3_bucket_events(
+    atlan_client,
+    aws_session,
+    bucket_params,
+    records,
+    schema_table_indexes,
+    atlan_snapshot=None,
+):
+    # upserts the s3 objects and the lineage of the created keys and archives
+    # the s3 objects of the removed keys. returns the results and the keys
+    # whose event failed. the processes of a removed key are archived with it
+    # unless they reference another s3 object of the same table
+    from atlan_operations import (
+        archive_atlan_assets,
+        fetch_s3_objects_by_qualified_names,
+    )
+    from s3_lineage_sync import S3LineageSync
+
+    route = build_s3_key_router(
+        file_name_regex_of(
+            bucket_params["s3_file_name_pattern"],
+            bucket_params["s3_file_name_patterns"],
+        )
+    )
+    created_objects, removed_objects = [], []
+    for record in records:
+        routed = route(record.key)
+        if routed is None:
+            continue
+        listed_object = S3ListedObject(
+            key=record.key,
+            table_name=routed[0],
+            e_tag=record.e_tag,
+            last_modified=record.event_time,
+            size=record.size,
+            pattern_index=routed[1],
+        )
+        if record.removed:
+            removed_objects.append(listed_object)
+        else:
+            created_objects.append(listed_object)
+    if bucket_params["sample_csv_headers"] and created_objects:
+        with METRICS.phase("header_sampling"):
+            created_objects = list(
+                iter_with_csv_headers(
+                    aws_session,
+                    bucket_params["s3_bucket_name"],
+                    created_objects,
+                    CSV_HEADERS_CACHE,
+                    bucket_params["concurrency"],
+                )
+            )
+
+    sync = S3LineageSync(
+        atlan_client,
+        **{name: bucket_params[name] for name in SYNC_PARAM_NAMES},
+        file_name_patterns=bucket_params["s3_file_name_patterns"],
+        schema_table_indexes=schema_table_indexes,
+        atlan_snapshot=atlan_snapshot,
+    )
+    upserted_assets = {
+        "s3_bucket_guid": None,
+        "s3_objects_guids": [],
+        "processes_guids": [],
+        "archived_assets_guids": [],
+        "failed_assets": [],
+        "ignored_keys_count": len(records) - len(created_objects) - len(removed_objects),
+    }
+    failed_keys = set()
+    try:
+        if created_objects:
+            # the object count of the bucket is left unchanged
+            with METRICS.phase("bucket_save"):
+                upserted_assets["s3_bucket_guid"] = sync.save_bucket(None)
+            # only the processes of the created keys are compared, by their
+            # qualified names
+            with METRICS.phase("table_indexing"):
+                sync.prepare(listed_objects=created_objects)
+            with METRICS.phase("asset_writes"):
+                for listed_object in created_objects:
+                    sync.queue(listed_object)
+                sync.wait()
+    finally:
+        sync.close()
+
+    for queued in sync.queued_s3_objects:
+        if sync.resolve_s3_object_guid(queued) is None or len(
+            sync.resolve_processes_guids(queued)
+        ) != len(queued.processes_guids):
+            failed_keys.add(queued.listed_object.key)
+    upserted_assets["s3_objects_guids"] = sync.s3_objects_guids()
+    upserted_assets["processes_guids"] = sync.processes_guids()
+    upserted_assets["failed_assets"] = sync.failures()
+    upserted_assets["saved_processes_count"] = sync.processes_counts["saved"]
+    upserted_assets["skipped_processes_count"] = sync.processes_counts["skipped"]
+
+    if removed_objects:
+        keys_by_qualified_name = {
+            f"{sync.bucket_qualified_name}/{removed_object.key}": removed_object.key
+            for removed_object in removed_objects
+        }
+        with METRICS.phase("archive"):
+            # keys already archived or never synced are not found
+            guids_by_qualified_name = call_with_retry(
+                fetch_s3_objects_by_qualified_names,
+                atlan_client,
+                list(keys_by_qualified_name),
+            )
+            keys_by_guid = {
+                guid: [keys_by_qualified_name[qualified_name]]
+                for qualified_name, guid in guids_by_qualified_name.items()
+            }
+            # a process failing to be archived fails the removed keys of its
+            # table
+            orphaned_processes = sync.orphaned_processes(removed_objects)
+            for guid, process_qualified_name in orphaned_processes.items():
+                keys_by_guid[guid] = [
+                    removed_object.key
+                    for removed_object in removed_objects
+                    if process_qualified_name
+                    in sync.processes_qualified_names(removed_object)
+                ]
+            archived_guids, failures = archive_atlan_assets(
+                atlan_client,
+                list(orphaned_processes) + list(guids_by_qualified_name.values()),
+                bucket_params["batch_size"],
+                bucket_params["concurrency"],
+            )
+        upserted_assets["archived_assets_guids"] = archived_guids
+        upserted_assets["failed_assets"].extend(failures)
+        for failure in failures:
+            failed_keys.update(keys_by_guid[failure["guid"]])
+
+    return upserted_assets, failed_keys
+
+
+def sync_s3_events(
+    atlan_client,
+    aws_session,
+    buckets,
+    records,
+    bucket_concurrency=DEFAULT_BUCKET_CONCURRENCY,
+):
+    # syncs the latest event of each key with the first bucket config whose
+    # name and prefix match the key, the events of keys matching no config
+    # are ignored. returns a result per bucket config and the failed
+    # (bucket name, key) pairs
+    from atlan_operations import SchemaTableIndexCache
+    from atlan_snapshot import open_atlan_snapshot
+
+    records_by_bucket = {}
+    for record in latest_event_by_key(records).values():
+        for index, bucket_params in enumerate(buckets):
+            if bucket_params["s3_bucket_name"] == record.bucket_name and (
+                record.key.startswith(bucket_params["s3_bucket_prefix"] or "")
+            ):
+                records_by_bucket.setdefault(index, []).append(record)
+                break
+        else:
+            logger.info(f"no config for s3://{record.bucket_name}/{record.key}")
+
+    def sync_bucket(index_and_records):
+        index, bucket_records = index_and_records
+        bucket_params = buckets[index]
+        started_at = time.perf_counter()
+        bucket_result = {
+            "s3_bucket_name": bucket_params["s3_bucket_name"],
+            "s3_bucket_prefix": bucket_params["s3_bucket_prefix"],
+            "events_count": len(bucket_records),
+        }
+        try:
+            bucket_result["upserted_assets"], failed_keys = sync_s3_bucket_events(
+                atlan_client,
+                aws_session,
+                bucket_params,
+                bucket_records,
+                schema_table_indexes,
+                atlan_snapshot,
+            )
+        except Exception as err:
+            logger.exception(f"failed to sync the events of {bucket_params['s3_bucket_name']}")
+            bucket_result["error"] = str(err)
+            failed_keys = {record.key for record in bucket_records}
+        bucket_result["duration_ms"] = round(
+            (time.perf_counter() - started_at) * 1000, 1
+        )
+        return bucket_result, failed_keys
+
+    # a batch of events only refreshes a few assets, saving the snapshot
+    # after each one would cost more than the refreshes it spares
+    buckets_results, failed_bucket_keys = [], set()
+    with open_atlan_snapshot(
+        aws_session, buckets[0]["atlan_snapshot_location"], save_delta_refreshes=False
+    ) as atlan_snapshot:
+        schema_table_indexes = SchemaTableIndexCache(
+            atlan_client, atlan_snapshot, SCHEMA_TABLE_INDEX_CACHE
+        )
+        for bucket_result, failed_keys in run_concurrently(
+            sync_bucket, list(records_by_bucket.items()), bucket_concurrency
+        ):
+            buckets_results.append(bucket_result)
+            failed_bucket_keys.update(
+                (bucket_result["s3_bucket_name"], key) for key in failed_keys
+            )
+    return buckets_results, failed_bucket_keys
+
+
+def load_s3_events_config():
+    # the sync params of the buckets are not part of the notifications, they
+    # are read from the environment once per warm lambda
+    config_value = os.environ.get(S3_EVENTS_CONFIG_ENV_VAR)
+    if not config_value:
+        raise ValueError(
+            f"{S3_EVENTS_CONFIG_ENV_VAR} must be set to sync s3 event notifications"
+        )
+    if config_value not in S3_EVENTS_CONFIG:
+        if config_value.lstrip().startswith("{"):
+            config = json.loads(config_value)
+        else:
+            config = build_manifest_store(get_aws_session(), config_value).load()
+            if config is None:
+                raise ValueError(f"no s3 events config found at {config_value}")
+        S3_EVENTS_CONFIG[config_value] = validate_s3_events_config(config)
+    return S3_EVENTS_CONFIG[config_value]
+
+
+def handle_s3_events(event, context):
+    # s3 event notifications, delivered directly or in sqs messages. with
+    # sqs only the messages holding a failed event are returned to be
+    # retried, a direct invocation fails as a whole to be retried by s3
+    logger.info("parsing s3 event notifications...")
+    records, invalid_message_ids = parse_s3_event_records(event)
+    config = load_s3_events_config()
+    atlan_client = InstrumentedAtlanClient(get_atlan_client())
+    # s3 is only called to sample the csv headers and for the atlan snapshot
+    aws_session = None
+    if any(
+        bucket.sample_csv_headers or bucket.atlan_snapshot_location
+        for bucket in config.buckets
+    ):
+        aws_session = InstrumentedAwsSession(get_aws_session())
+
+    buckets_results, failed_bucket_keys = sync_s3_events(
+        atlan_client,
+        aws_session,
+        [bucket.model_dump() for bucket in config.buckets],
+        records,
+        config.bucket_concurrency,
+    )
+    forget_assets_info(
+        qualified_name_prefixes=synced_qualified_name_prefixes(
+            bucket.model_dump() for bucket in config.buckets
+        )
+    )
+    failed_message_ids = list(
+        dict.fromkeys(
+            invalid_message_ids
+            + [
+                record.message_id
+                for record in records
+                if record.message_id is not None
+                and (record.bucket_name, record.key) in failed_bucket_keys
+            ]
+        )
+    )
+    result = {
+        "operation": "sync_s3_events",
+        "events_count": len(records),
+        "buckets": buckets_results,
+        "failed_message_ids": failed_message_ids,
+        "metrics": METRICS.summary(),
+    }
+    logger.info(f"s3 events synced: {json.dumps(result, default=str)}")
+    emit_emf_records(result["metrics"], "sync_s3_events")
+
+    if any(record.get("eventSource") == "aws:sqs" for record in event["Records"]):
+        return {
+            "batchItemFailures": [
+                {"itemIdentifier": message_id} for message_id in failed_message_ids
+            ]
+        }
+    if failed_bucket_keys:
+        raise RuntimeError(f"failed to sync {len(failed_bucket_keys)} s3 object events")
+    return {"statusCode": 200, "body": result}
+
+
 def set_to_list(set_):
     if set_ and isinstance(set_, set):
         return list(set_)
     return None
 
 
+def build_asset_info(asset):
+    return {
+        "guid": asset.guid,
+        "qualified_name": asset.qualified_name,
+        "owners": set_to_list(asset.owner_users),
+        "owner_groups": set_to_list(asset.owner_groups),
+        "tags": set_to_list(asset.asset_tags),
+        "update_time": asset.update_time,
+    }
+
+
+def get_assets_info(atlan_client, asset_type, guids=None, qualified_names=None):
+    # returns the info of the assets in the requested order, None for the
+    # assets not found. the assets missing from the cache are fetched with a
+    # single search
+    from atlan_operations import search_assets_by_guid_or_qn
+
+    key_name = "guid" if guids else "qualified_name"
+    keys = guids or qualified_names
+    assets_info = {}
+    for key in keys:
+        asset_info = ASSET_INFO_CACHE.get((asset_type, key_name, key))
+        if asset_info is not None:
+            assets_info[key] = asset_info
+
+    missing_keys = list(dict.fromkeys(key for key in keys if key not in assets_info))
+    if missing_keys:
+        logger.info(f"fetching {len(missing_keys)} assets missing from the cache")
+        assets = call_with_retry(
+            search_assets_by_guid_or_qn,
+            atlan_client,
+            asset_type,
+            guids=missing_keys if guids else None,
+            qualified_names=None if guids else missing_keys,
+        )
+        for asset in assets:
+            asset_info = build_asset_info(asset)
+            ASSET_INFO_CACHE.set((asset_type, "guid", asset.guid), asset_info)
+            ASSET_INFO_CACHE.set(
+                (asset_type, "qualified_name", asset.qualified_name), asset_info
+            )
+            assets_info[asset_info[key_name]] = asset_info
+
+    return [assets_info.get(key) for key in keys]
+
+
+def forget_assets_info(guids=(), qualified_name_prefixes=()):
+    # drops the cached info of the assets saved or purged by the invocation.
+    # the guid and qualified name entries of an asset share the same info
+    guids = set(guids)
+    qualified_name_prefixes = tuple(qualified_name_prefixes)
+    ASSET_INFO_CACHE.discard_where(
+        lambda asset_info: asset_info["guid"] in guids
+        or bool(
+            qualified_name_prefixes
+            and (asset_info["qualified_name"] or "").startswith(qualified_name_prefixes)
+        )
+    )
+
+
+def synced_qualified_name_prefixes(buckets_params):
+    # the buckets, s3 objects and lineage processes of the synced buckets are
+    # under their s3, source and target connections
+    prefixes = set()
+    for bucket_params in buckets_params:
+        if bucket_params.get("dry_run"):
+            continue
+        prefixes.add(f"{bucket_params['s3_connection_qualified_name']}/")
+        prefixes.add(f"{bucket_params['source_connection_qualified_name']}/")
+        prefixes.add(f"{bucket_params['target_connection_qualified_name']}/")
+        for pattern in bucket_params.get("s3_file_name_patterns") or []:
+            for connection_name in (
+                "source_connection_qualified_name",
+                "target_connection_qualified_name",
+            ):
+                if pattern.get(connection_name):
+                    prefixes.add(f"{pattern[connection_name]}/")
+    return prefixes
+
+
+def get_atlan_client():
+    if "atlan" not in WARM_CLIENTS:
+        from pyatlan.client.atlan import AtlanClient
+
+        WARM_CLIENTS["atlan"] = AtlanClient()
+    return WARM_CLIENTS["atlan"]
+
+
+def get_aws_session():
+    if "aws" not in WARM_CLIENTS:
+        import boto3
+
+        WARM_CLIENTS["aws"] = SharedClientsSession(boto3.Session())
+    return WARM_CLIENTS["aws"]
+
+
 def lambda_handler(req, context):
+    METRICS.reset()
+    if is_s3_event(req):
+        return handle_s3_events(req, context)
 
     logger.info("validating parameters...")
     input = validate_input(req)
@@ -144,51 +1230,130 @@ def lambda_handler(req, context):
     params = input.params
 
     logger.info("creating api clients...")
-    aws_session = boto3.Session()
-    atlan_client = AtlanClient()
+    init_started_at = time.perf_counter()
+    # the instrumented clients time every atlan and s3 call of the invocation
+    atlan_client = InstrumentedAtlanClient(get_atlan_client())
+    if operation in ("upsert_s3_assets_and_lineage", "upsert_s3_buckets_and_lineage"):
+        aws_session = InstrumentedAwsSession(get_aws_session())
+    if operation in ("upsert_s3_connection", "purge"):
+        from atlan_operations import (
+            create_or_update_atlan_s3_connection,
+            fetch_s3_assets_to_purge,
+            purge_atlan_assets,
+        )
+    startup = {
+        "cold_start": STARTUP.pop("cold_start", False),
+        "module_import_ms": MODULE_IMPORT_MS,
+        "init_ms": round((time.perf_counter() - init_started_at) * 1000, 1),
+    }
+    logger.info(f"startup: {startup}")
 
-    result = {"operation": operation}
+    result = {"operation": operation, "startup": startup}
 
     if operation == "upsert_s3_connection":
-        s3_connection_guid = create_or_update_atlan_s3_connection(
-            atlan_client, params.connection_name, params.connection_qn
-        )
+        with METRICS.phase("connection_save"):
+            s3_connection_guid = create_or_update_atlan_s3_connection(
+                atlan_client, params.connection_name, params.connection_qn
+            )
         result["s3_connection_guid"] = s3_connection_guid
+        forget_assets_info(guids=[s3_connection_guid])
 
     if operation == "upsert_s3_assets_and_lineage":
-        upserted_assets = upsert_s3_assets_and_lineage(
-            atlan_client, aws_session, **params.model_dump()
-        )
+        from atlan_snapshot import open_atlan_snapshot
+
+        upsert_params = params.model_dump()
+        with open_atlan_snapshot(
+            aws_session,
+            upsert_params.pop("atlan_snapshot_location"),
+            params.full_resync,
+            dry_run=params.dry_run,
+        ) as atlan_snapshot:
+            upserted_assets = upsert_s3_assets_and_lineage(
+                atlan_client,
+                aws_session,
+                **upsert_params,
+                lambda_context=context,
+                atlan_snapshot=atlan_snapshot,
+            )
         result["upserted_assets"] = upserted_assets
+        forget_assets_info(
+            qualified_name_prefixes=synced_qualified_name_prefixes([upsert_params])
+        )
+        if atlan_snapshot is not None:
+            result["atlan_snapshot"] = dict(atlan_snapshot.counts)
+
+    if operation == "upsert_s3_buckets_and_lineage":
+        result["buckets"], atlan_snapshot_counts = upsert_s3_buckets_and_lineage(
+            atlan_client,
+            aws_session,
+            [bucket.model_dump() for bucket in params.buckets],
+            params.bucket_concurrency,
+            lambda_context=context,
+        )
+        forget_assets_info(
+            qualified_name_prefixes=synced_qualified_name_prefixes(
+                bucket.model_dump() for bucket in params.buckets
+            )
+        )
+        if atlan_snapshot_counts is not None:
+            result["atlan_snapshot"] = atlan_snapshot_counts
 
     if operation == "get_by_guid":
-        asset = retrieve_atlan_asset_by_guid(
-            atlan_client, params.guid, params.asset_type
-        )
-        result["asset_info"] = {
-            "guid": asset.guid,
-            "qualified_name": asset.qualified_name,
-            "owners": set_to_list(asset.owner_users),
-            "owner_groups": set_to_list(asset.owner_groups),
-            "tags": set_to_list(asset.asset_tags),
-            "update_time": asset.update_time,
-        }
+        guids = [str(guid) for guid in params.guids or [params.guid]]
+        with METRICS.phase("asset_lookup"):
+            assets_info = get_assets_info(
+                atlan_client, params.asset_type, guids=guids
+            )
+        if params.guids:
+            result["assets_info"] = assets_info
+        else:
+            result["asset_info"] = assets_info[0]
 
     if operation == "get_by_qn":
-        asset = retrieve_atlan_asset_by_qn(
-            atlan_client, params.qualified_name, params.asset_type
-        )
-        result["asset_info"] = {
-            "guid": asset.guid,
-            "qualified_name": asset.qualified_name,
-            "owners": set_to_list(asset.owner_users),
-            "owner_groups": set_to_list(asset.owner_groups),
-            "tags": set_to_list(asset.asset_tags),
-            "update_time": asset.update_time,
-        }
+        qualified_names = params.qualified_names or [params.qualified_name]
+        with METRICS.phase("asset_lookup"):
+            assets_info = get_assets_info(
+                atlan_client, params.asset_type, qualified_names=qualified_names
+            )
+        if params.qualified_names:
+            result["assets_info"] = assets_info
+        else:
+            result["asset_info"] = assets_info[0]
 
     if operation == "purge":
-        purge_atlan_assets(atlan_client, params.assets_guids)
-        result["purged_assets"] = [str(guid) for guid in params.assets_guids]
+        result["purged_assets"] = []
+        result["failed_assets"] = []
+        guids_to_purge = []
+        if params.cascade_qualified_name:
+            with METRICS.phase("purge_search"):
+                guids_to_purge += call_with_retry(
+                    fetch_s3_assets_to_purge,
+                    atlan_client,
+                    params.cascade_qualified_name,
+                )
+        cascade_guids = {guid for assets_guids in guids_to_purge for guid in assets_guids}
+        guids_to_purge.append(
+            [
+                str(guid)
+                for guid in params.assets_guids or []
+                if str(guid) not in cascade_guids
+            ]
+        )
+        # the processes are purged before the objects, and the objects before
+        # their bucket. the assets_guids not under the cascade are purged last
+        with METRICS.phase("purge"):
+            for assets_guids in guids_to_purge:
+                purged_guids, failures = purge_atlan_assets(
+                    atlan_client, assets_guids, params.batch_size, params.concurrency
+                )
+                result["purged_assets"].extend(purged_guids)
+                result["failed_assets"].extend(failures)
+        forget_assets_info(guids=result["purged_assets"])
+
+    result["metrics"] = METRICS.summary()
+    emit_emf_records(result["metrics"], operation)
 
     return {"statusCode": 200, "body": result}
+
+
+MODULE_IMPORT_MS = round((time.perf_counter() - MODULE_IMPORT_STARTED_AT) * 1000, 1)
@@ -1,9 +1,165 @@
+import argparse
 import json
+import os
+from concurrent import futures
+
+from pydantic import ValidationError
+
+from constants import logger
+from input_validation import validate_input
 from lambda_function import lambda_handler
 
 
-if __name__ == "__main__":
+# runs the example request at the end of this file, or a jsonl file of
+# requests, one request per line, writing a jsonl file of results holding the
+# line number of each request. usage:
+#   python local_execution.py requests.jsonl --output results.jsonl --workers 4
+# the requests run in worker processes, each with its own clients and
+# metrics. an interrupted run is resumed by running the same command again:
+# the lines already in the output file are skipped
+
+
+def run_request(request):
+    return lambda_handler(request, None)
+
+
+def completed_lines(output_path, retry_failed=False):
+    # line numbers of the requests already in the output file. a line cut by
+    # a crash is ignored
+    lines = set()
+    if not os.path.exists(output_path):
+        return lines
+    with open(output_path, "r", encoding="utf-8") as output_file:
+        for output_line in output_file:
+            try:
+                result = json.loads(output_line)
+            except ValueError:
+                continue
+            if retry_failed and "error" in result:
+                continue
+            lines.add(result["line"])
+    return lines
+
+
+def truncate_partial_line(output_path, block_size=65536):
+    # drops the end of a line cut by a crash, the results appended next would
+    # otherwise be glued to it
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as output_file:
+        end = output_file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            output_file.seek(start)
+            block = output_file.read(position - start)
+            newline_index = block.rfind(b"\n")
+            if newline_index != -1:
+                position = start + newline_index + 1
+                break
+            position = start
+        if position < end:
+            logger.info(f"dropping the partial last line of {output_path}")
+            output_file.truncate(position)
+
+
+def iter_pending_requests(input_path, skipped_lines):
+    # yields the line number and the request, or the validation error, of
+    # the lines to run
+    with open(input_path, "r", encoding="utf-8") as input_file:
+        for line_number, input_line in enumerate(input_file, start=1):
+            if line_number in skipped_lines or not input_line.strip():
+                continue
+            try:
+                request = json.loads(input_line)
+                validate_input(request)
+            except (ValueError, ValidationError) as err:
+                yield line_number, None, str(err)
+                continue
+            yield line_number, request, None
+
+
+def run_requests_file(input_path, output_path, workers=1, retry_failed=False):
+    truncate_partial_line(output_path)
+    skipped_lines = completed_lines(output_path, retry_failed)
+    if skipped_lines:
+        logger.info(f"resuming, {len(skipped_lines)} lines already in {output_path}")
+    counts = {"succeeded": 0, "failed": 0}
 
+    def write_result(output_file, result):
+        counts["failed" if "error" in result else "succeeded"] += 1
+        output_file.write(json.dumps(result, default=str) + "\n")
+        # a crash loses at most the requests still running
+        output_file.flush()
+
+    executor = futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    in_flight = {}
+
+    def collect(output_file, return_when):
+        done, _ = futures.wait(in_flight, return_when=return_when)
+        for future in done:
+            line_number = in_flight.pop(future)
+            try:
+                result = {"line": line_number, "response": future.result()}
+            except Exception as err:
+                logger.error(f"line {line_number} failed: {err}")
+                result = {"line": line_number, "error": str(err)}
+            write_result(output_file, result)
+
+    with open(output_path, "a", encoding="utf-8") as output_file:
+        try:
+            for line_number, request, error in iter_pending_requests(
+                input_path, skipped_lines
+            ):
+                if error is not None:
+                    write_result(output_file, {"line": line_number, "error": error})
+                    continue
+                if executor is None:
+                    try:
+                        result = {"line": line_number, "response": run_request(request)}
+                    except Exception as err:
+                        logger.error(f"line {line_number} failed: {err}")
+                        result = {"line": line_number, "error": str(err)}
+                    write_result(output_file, result)
+                    continue
+                # the file is streamed, only a few requests are read ahead
+                while len(in_flight) >= 2 * workers:
+                    collect(output_file, futures.FIRST_COMPLETED)
+                in_flight[executor.submit(run_request, request)] = line_number
+            collect(output_file, futures.ALL_COMPLETED)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "requests_file",
+        nargs="?",
+        help="jsonl file with a request per line, the example request is run without it",
+    )
+    parser.add_argument("--output", help="jsonl file of the results")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="run again the lines whose result in the output file is an error",
+    )
+    args = parser.parse_args()
+    if args.requests_file is None:
+        run_example()
+        return
+    if args.output is None:
+        parser.error("--output is required with a requests file")
+    counts = run_requests_file(
+        args.requests_file, args.output, args.workers, args.retry_failed
+    )
+    logger.info(f"{counts['succeeded']} requests succeeded, {counts['failed']} failed")
+
+
+def run_example():
     upsert_s3_connection_request = {
         "operation": "upsert_s3_connection",
         "params": {
@@ -88,3 +244,7 @@ if __name__ == "__main__":
             indent=4,
         )
     )
+
+
+if __name__ == "__main__":
+    main()
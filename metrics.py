@@ -0,0 +1,340 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from constants import METRICS_NAMESPACE
+
+
+def percentile(sorted_values, ratio):
+    # nearest rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(int(round(ratio * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class CallStats:
+    def __init__(self):
+        self.durations = []
+        self.errors = 0
+        self.retries = 0
+        self.items = 0
+        self.bytes = 0
+
+    def summary(self):
+        durations = sorted(self.durations)
+        return {
+            "count": len(durations),
+            "errors": self.errors,
+            "retries": self.retries,
+            "items": self.items,
+            "bytes": self.bytes,
+            "p50_ms": milliseconds(percentile(durations, 0.5)),
+            "p95_ms": milliseconds(percentile(durations, 0.95)),
+            "max_ms": milliseconds(durations[-1] if durations else None),
+            "total_ms": milliseconds(sum(durations)),
+        }
+
+
+def milliseconds(seconds):
+    if seconds is None:
+        return None
+    return round(seconds * 1000, 1)
+
+
+class Metrics:
+    # phase timings and api call stats of an invocation, recorded by the
+    # instrumented clients and the worker threads. reset() is called at the
+    # start of every invocation since the collector lives at module scope.
+    # the median latency of each call is kept across the invocations of a
+    # warm container to estimate the duration of the calls of a dry run
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.observed_latencies = {}
+        self.calls = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            for name, stats in self.calls.items():
+                if stats.durations:
+                    self.observed_latencies[name] = percentile(
+                        sorted(stats.durations), 0.5
+                    )
+            self.started_at = time.perf_counter()
+            self.phases = {}
+            self.calls = {}
+
+    @contextmanager
+    def phase(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started_at
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0) + duration
+
+    def record_call(self, name, duration, error=False, items=0):
+        with self._lock:
+            stats = self._call_stats(name)
+            stats.durations.append(duration)
+            stats.errors += error
+            stats.items += items
+
+    def record_retry(self, name):
+        with self._lock:
+            self._call_stats(name).retries += 1
+
+    def record_bytes(self, name, bytes_):
+        with self._lock:
+            self._call_stats(name).bytes += bytes_
+
+    def _call_stats(self, name):
+        stats = self.calls.get(name)
+        if stats is None:
+            stats = self.calls[name] = CallStats()
+        return stats
+
+    @contextmanager
+    def timer(self, name, items=0):
+        started_at = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record_call(name, time.perf_counter() - started_at, error, items)
+
+    def latency(self, name, default=None):
+        # median latency of a call in this invocation, or else in the
+        # previous invocations of the container
+        with self._lock:
+            stats = self.calls.get(name)
+            if stats is not None and stats.durations:
+                return percentile(sorted(stats.durations), 0.5)
+            return self.observed_latencies.get(name, default)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "duration_ms": milliseconds(time.perf_counter() - self.started_at),
+                "phases_ms": {
+                    name: milliseconds(duration) for name, duration in self.phases.items()
+                },
+                "calls": {name: stats.summary() for name, stats in self.calls.items()},
+            }
+
+
+METRICS = Metrics()
+
+
+def build_emf_records(summary, operation, timestamp_ms=None):
+    # cloudwatch embedded metric format: one record for the phases and one per
+    # api call, each record staying under the limit of 100 metrics
+    timestamp_ms = timestamp_ms or int(time.time() * 1000)
+
+    def emf_record(dimensions, values):
+        return {
+            "_aws": {
+                "Timestamp": timestamp_ms,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in values.items()
+                        ],
+                    }
+                ],
+            },
+            **dimensions,
+            **{name: value for name, (value, _) in values.items()},
+        }
+
+    phases = {"duration_ms": (summary["duration_ms"], "Milliseconds")}
+    phases.update(
+        (f"{name}_ms", (duration, "Milliseconds"))
+        for name, duration in summary["phases_ms"].items()
+    )
+    records = [emf_record({"operation": operation}, phases)]
+    for name, stats in summary["calls"].items():
+        values = {
+            "count": (stats["count"], "Count"),
+            "errors": (stats["errors"], "Count"),
+            "retries": (stats["retries"], "Count"),
+            "items": (stats["items"], "Count"),
+            "bytes": (stats["bytes"], "Bytes"),
+        }
+        if stats["count"]:
+            values.update(
+                p50_ms=(stats["p50_ms"], "Milliseconds"),
+                p95_ms=(stats["p95_ms"], "Milliseconds"),
+                max_ms=(stats["max_ms"], "Milliseconds"),
+            )
+        records.append(emf_record({"operation": operation, "api_call": name}, values))
+    return records
+
+
+def emit_emf_records(summary, operation):
+    # emf records must be printed alone on their line, the lambda log handler
+    # would prefix them. nothing is printed outside of a lambda
+    if not os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        return
+    for record in build_emf_records(summary, operation):
+        print(json.dumps(record, separators=(",", ":")), flush=True)
+
+
+def instrumented(name, func, metrics=METRICS, count_items=False):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        items = 0
+        if count_items and args:
+            items = len(args[0]) if isinstance(args[0], list) else 1
+        with metrics.timer(name, items):
+            return func(*args, **kwargs)
+
+    # used by call_with_retry to attach the retries to this call
+    wrapper.metric_name = name
+    return wrapper
+
+
+class InstrumentedIterator:
+    # times the next() calls fetching a page of a paginated result. with
+    # first_page_fetched, the first page came with the call that returned
+    # the iterator and was already timed
+    def __init__(self, name, iterator, metrics=METRICS, page_size=1, first_page_fetched=False):
+        self.name = name
+        self.iterator = iter(iterator)
+        self.metrics = metrics
+        self.page_size = page_size
+        self.first_page_fetched = first_page_fetched
+        self._index = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        index, self._index = self._index, self._index + 1
+        if index % self.page_size or (index == 0 and self.first_page_fetched):
+            return next(self.iterator)
+        started_at = time.perf_counter()
+        try:
+            result = next(self.iterator)
+        except StopIteration:
+            raise
+        except Exception:
+            self.metrics.record_call(self.name, time.perf_counter() - started_at, True)
+            raise
+        self.metrics.record_call(self.name, time.perf_counter() - started_at)
+        return result
+
+
+class InstrumentedAssetClient:
+    def __init__(self, asset_client, metrics=METRICS):
+        self._asset_client = asset_client
+        self._metrics = metrics
+        for method_name in ("save", "purge_by_guid", "delete_by_guid"):
+            setattr(
+                self,
+                method_name,
+                instrumented(
+                    f"atlan.{method_name}",
+                    getattr(asset_client, method_name),
+                    metrics,
+                    count_items=True,
+                ),
+            )
+        self.search = instrumented("atlan.search", self._search, metrics)
+
+    def _search(self, criteria, *args, **kwargs):
+        results = self._asset_client.search(criteria, *args, **kwargs)
+        return InstrumentedIterator(
+            "atlan.search",
+            results,
+            self._metrics,
+            page_size=getattr(criteria.dsl, "size", None) or 1,
+            first_page_fetched=True,
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._asset_client, name)
+
+
+class InstrumentedAtlanClient:
+    def __init__(self, atlan_client, metrics=METRICS):
+        self._atlan_client = atlan_client
+        self.asset = InstrumentedAssetClient(atlan_client.asset, metrics)
+
+    def __getattr__(self, name):
+        return getattr(self._atlan_client, name)
+
+
+class InstrumentedPaginator:
+    def __init__(self, name, paginator, metrics=METRICS):
+        self._name = name
+        self._paginator = paginator
+        self._metrics = metrics
+
+    def paginate(self, **kwargs):
+        return InstrumentedIterator(
+            self._name, self._paginator.paginate(**kwargs), self._metrics
+        )
+
+
+class InstrumentedS3Client:
+    def __init__(self, s3_client, metrics=METRICS):
+        self._s3_client = s3_client
+        self._metrics = metrics
+
+    def get_paginator(self, operation_name):
+        return InstrumentedPaginator(
+            f"s3.{operation_name}",
+            self._s3_client.get_paginator(operation_name),
+            self._metrics,
+        )
+
+    def get_object(self, **kwargs):
+        with self._metrics.timer("s3.get_object"):
+            response = self._s3_client.get_object(**kwargs)
+        self._metrics.record_bytes("s3.get_object", response.get("ContentLength") or 0)
+        return response
+
+    def put_object(self, **kwargs):
+        body = kwargs.get("Body") or b""
+        with self._metrics.timer("s3.put_object"):
+            response = self._s3_client.put_object(**kwargs)
+        self._metrics.record_bytes(
+            "s3.put_object", len(body) if isinstance(body, (bytes, str)) else 0
+        )
+        return response
+
+    def upload_part(self, **kwargs):
+        with self._metrics.timer("s3.upload_part"):
+            response = self._s3_client.upload_part(**kwargs)
+        self._metrics.record_bytes("s3.upload_part", len(kwargs.get("Body") or b""))
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._s3_client, name)
+
+
+class InstrumentedAwsSession:
+    def __init__(self, aws_session, metrics=METRICS):
+        self._aws_session = aws_session
+        self._metrics = metrics
+
+    def client(self, service_name, *args, **kwargs):
+        client = self._aws_session.client(service_name, *args, **kwargs)
+        if service_name == "s3":
+            return InstrumentedS3Client(client, self._metrics)
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self._aws_session, name)
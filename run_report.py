@@ -0,0 +1,108 @@
+import io
+import json
+import os
+from collections import Counter
+
+from constants import REPORT_PART_SIZE
+
+
+def ndjson_line(record):
+    return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+
+class LocalFileReportWriter:
+    # written to a temporary file renamed on close, so that an interrupted run
+    # does not leave a partial report
+    def __init__(self, path):
+        self.path = path
+        self.counts = Counter()
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(ndjson_line(record))
+        self.counts[record["action"]] += 1
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+class S3ReportWriter:
+    # streamed with a multipart upload of REPORT_PART_SIZE parts, a report
+    # smaller than a part is written with a single put on close. the report
+    # only appears once complete
+    def __init__(self, aws_session, bucket_name, key):
+        self.bucket_name = bucket_name
+        self.key = key
+        self.counts = Counter()
+        self.s3_client = aws_session.client("s3")
+        self._buffer = io.BytesIO()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, record):
+        self._buffer.write(ndjson_line(record).encode("utf-8"))
+        self.counts[record["action"]] += 1
+        if self._buffer.tell() >= REPORT_PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                ContentType="application/x-ndjson",
+            )["UploadId"]
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=self._buffer.getvalue(),
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self._buffer = io.BytesIO()
+
+    def close(self):
+        if self._upload_id is None:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                Body=self._buffer.getvalue(),
+                ContentType="application/x-ndjson",
+            )
+            return
+        if self._buffer.tell():
+            self._upload_part()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id
+            )
+
+
+def report_part_location(location, part_number):
+    # report.ndjson -> report.00001.ndjson, the parts of a resumable run
+    root, extension = os.path.splitext(location)
+    return f"{root}.{part_number:05d}{extension}"
+
+
+def build_report_writer(aws_session, location):
+    # location is either s3://bucket/key or a local file path
+    if location.startswith("s3://"):
+        bucket_name, _, key = location[len("s3://"):].partition("/")
+        return S3ReportWriter(aws_session, bucket_name, key)
+    return LocalFileReportWriter(location)
@@ -0,0 +1,92 @@
+import json
+from collections import namedtuple
+from urllib.parse import unquote_plus
+
+from constants import logger
+
+
+S3EventRecord = namedtuple(
+    "S3EventRecord",
+    # message_id is the id of the sqs message carrying the event, None for an
+    # event delivered directly by s3
+    [
+        "message_id",
+        "bucket_name",
+        "key",
+        "removed",
+        "size",
+        "e_tag",
+        "event_time",
+        "sequencer",
+    ],
+)
+
+
+def is_s3_event(event):
+    records = event.get("Records") if isinstance(event, dict) else None
+    return bool(records) and all(
+        record.get("eventSource") in ("aws:s3", "aws:sqs") for record in records
+    )
+
+
+def parse_s3_notification(notification, message_id=None):
+    records = []
+    for record in notification.get("Records") or []:
+        if record.get("eventSource") != "aws:s3":
+            continue
+        event_name = record.get("eventName", "")
+        if not event_name.startswith(("ObjectCreated:", "ObjectRemoved:")):
+            continue
+        s3_object = record["s3"]["object"]
+        e_tag = s3_object.get("eTag")
+        records.append(
+            S3EventRecord(
+                message_id=message_id,
+                bucket_name=record["s3"]["bucket"]["name"],
+                # keys are url encoded in the notifications
+                key=unquote_plus(s3_object["key"]),
+                removed=event_name.startswith("ObjectRemoved:"),
+                size=s3_object.get("size"),
+                e_tag=f'"{e_tag}"' if e_tag else None,
+                event_time=record.get("eventTime"),
+                sequencer=s3_object.get("sequencer"),
+            )
+        )
+    return records
+
+
+def parse_s3_event_records(event):
+    # returns the s3 object events of a direct s3 notification or of a batch
+    # of sqs messages, and the ids of the sqs messages that cannot be parsed
+    records, invalid_message_ids = [], []
+    for record in event["Records"]:
+        if record.get("eventSource") != "aws:sqs":
+            records.extend(parse_s3_notification({"Records": [record]}))
+            continue
+        try:
+            notification = json.loads(record["body"])
+        except (KeyError, TypeError, ValueError):
+            logger.error(f"sqs message {record.get('messageId')} is not an s3 notification")
+            invalid_message_ids.append(record.get("messageId"))
+            continue
+        # the s3:TestEvent sent when the notification is configured has no
+        # records and is simply acknowledged
+        records.extend(parse_s3_notification(notification, record.get("messageId")))
+    return records, invalid_message_ids
+
+
+def latest_event_by_key(records):
+    # s3 does not guarantee the delivery order of the events, the sequencer of
+    # the events of a key tells which one is the latest
+    def sequencer_value(record):
+        return int(record.sequencer, 16) if record.sequencer else -1
+
+    latest_records = {}
+    for record in records:
+        record_key = (record.bucket_name, record.key)
+        latest_record = latest_records.get(record_key)
+        if latest_record is None or sequencer_value(record) >= sequencer_value(
+            latest_record
+        ):
+            latest_records[record_key] = record
+    return latest_records
@@ -0,0 +1,197 @@
+import csv
+import datetime
+import gzip
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import unquote_plus
+
+from constants import INVENTORY_BATCH_ROWS, logger
+from s3_operations import discover_s3_sub_prefixes
+from state_manifest import build_manifest_store
+
+
+# folders of the daily manifests of an inventory configuration
+INVENTORY_DATE_FOLDER_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}-\d{2}Z")
+
+# columns read from the orc and parquet inventories, the csv ones are named
+# in the manifest schema and converted to the same names
+INVENTORY_COLUMNS = [
+    "bucket",
+    "key",
+    "size",
+    "last_modified_date",
+    "e_tag",
+    "storage_class",
+    "is_latest",
+    "is_delete_marker",
+]
+
+
+def csv_column_name(schema_field):
+    # LastModifiedDate -> last_modified_date, ETag -> e_tag
+    return re.sub(r"(?<!^)(?=[A-Z][a-z])", "_", schema_field.strip()).lower()
+
+
+def latest_inventory_manifest_location(aws_session, location):
+    # location is the folder of an inventory configuration, holding a dated
+    # folder per report
+    if location.startswith("s3://"):
+        bucket_name, _, prefix = location[len("s3://"):].partition("/")
+        sub_prefixes, _ = discover_s3_sub_prefixes(
+            aws_session.client("s3"), bucket_name, prefix
+        )
+        folders = [sub_prefix[len(prefix):-1] for sub_prefix in sub_prefixes]
+    else:
+        folders = os.listdir(location) if os.path.isdir(location) else []
+    dated_folders = [
+        folder for folder in folders if INVENTORY_DATE_FOLDER_REGEX.fullmatch(folder)
+    ]
+    if not dated_folders:
+        raise ValueError(f"no s3 inventory report found in {location}")
+    if location.startswith("s3://"):
+        return f"{location}{max(dated_folders)}/manifest.json"
+    return os.path.join(location, max(dated_folders), "manifest.json")
+
+
+@contextmanager
+def open_inventory_data_file(aws_session, manifest_location, manifest, key, seekable):
+    if manifest_location.startswith("s3://"):
+        # destinationBucket is the arn of the bucket holding the reports
+        bucket_name = manifest["destinationBucket"].rpartition(":")[2]
+        response = aws_session.client("s3").get_object(Bucket=bucket_name, Key=key)
+        if not seekable:
+            yield response["Body"]
+            return
+        # orc and parquet files are read from their footer, they are copied
+        # to a temporary file rather than loaded in memory
+        with tempfile.TemporaryFile() as data_file:
+            shutil.copyfileobj(response["Body"], data_file, 1024 * 1024)
+            data_file.seek(0)
+            yield data_file
+        return
+    # local copy of the reports: the data files of a configuration are in
+    # the data folder next to the dated folders of the manifests
+    path = os.path.join(
+        os.path.dirname(os.path.dirname(manifest_location)),
+        "data",
+        os.path.basename(key),
+    )
+    with open(path, "rb") as data_file:
+        yield data_file
+
+
+def iter_csv_inventory_rows(data_file, column_names):
+    # gzipped csv read line by line, keys are url encoded
+    with gzip.open(data_file, "rt", encoding="utf-8", newline="") as csv_file:
+        for values in csv.reader(csv_file):
+            row = dict(zip(column_names, values))
+            row["key"] = unquote_plus(row["key"])
+            yield row
+
+
+def iter_columnar_inventory_rows(data_file, file_format):
+    # parquet files are read a batch of rows at a time, orc files a stripe at
+    # a time. pyarrow is only needed by these inventories
+    try:
+        if file_format == "Parquet":
+            import pyarrow.parquet
+        else:
+            import pyarrow.orc
+    except ImportError as err:
+        raise ImportError(
+            f"pyarrow is required to read {file_format} s3 inventories"
+        ) from err
+
+    if file_format == "Parquet":
+        parquet_file = pyarrow.parquet.ParquetFile(data_file)
+        columns = [
+            column for column in INVENTORY_COLUMNS
+            if column in parquet_file.schema_arrow.names
+        ]
+        batches = parquet_file.iter_batches(
+            batch_size=INVENTORY_BATCH_ROWS, columns=columns
+        )
+    else:
+        orc_file = pyarrow.orc.ORCFile(data_file)
+        columns = [
+            column for column in INVENTORY_COLUMNS if column in orc_file.schema.names
+        ]
+        batches = (
+            orc_file.read_stripe(index, columns=columns)
+            for index in range(orc_file.nstripes)
+        )
+    for batch in batches:
+        yield from batch.to_pylist()
+
+
+def inventory_row_to_s3_object(row):
+    # same fields as the contents of a list_objects_v2 page
+    last_modified = row.get("last_modified_date")
+    if isinstance(last_modified, str):
+        last_modified = datetime.datetime.fromisoformat(
+            last_modified.replace("Z", "+00:00")
+        )
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+    size = row.get("size")
+    e_tag = row.get("e_tag")
+    return {
+        "Key": row["key"],
+        "Size": int(size) if size not in (None, "") else None,
+        "LastModified": last_modified,
+        "ETag": f'"{e_tag}"' if e_tag else None,
+        "StorageClass": row.get("storage_class") or None,
+    }
+
+
+def iter_s3_inventory_objects(aws_session, bucket_name, manifest_location):
+    # yields the current objects of an s3 inventory report, one data file at
+    # a time. manifest_location is the s3://bucket/key or local path of a
+    # manifest.json, or of the folder of an inventory configuration (ending
+    # with a slash) to read its latest report
+    if manifest_location.endswith(("/", os.sep)):
+        manifest_location = latest_inventory_manifest_location(
+            aws_session, manifest_location
+        )
+    manifest = build_manifest_store(aws_session, manifest_location).load()
+    if manifest is None:
+        raise ValueError(f"no s3 inventory manifest found at {manifest_location}")
+    if manifest["sourceBucket"] != bucket_name:
+        raise ValueError(
+            f"the s3 inventory at {manifest_location} lists "
+            f"{manifest['sourceBucket']}, not {bucket_name}"
+        )
+
+    file_format = manifest["fileFormat"]
+    if file_format not in ("CSV", "ORC", "Parquet"):
+        raise ValueError(f"unsupported s3 inventory format {file_format}")
+    logger.info(
+        f"reading {len(manifest['files'])} {file_format} s3 inventory files "
+        f"from {manifest_location}"
+    )
+    for data_file_info in manifest["files"]:
+        with open_inventory_data_file(
+            aws_session,
+            manifest_location,
+            manifest,
+            data_file_info["key"],
+            seekable=file_format != "CSV",
+        ) as data_file:
+            if file_format == "CSV":
+                rows = iter_csv_inventory_rows(
+                    data_file,
+                    [csv_column_name(field) for field in manifest["fileSchema"].split(",")],
+                )
+            else:
+                rows = iter_columnar_inventory_rows(data_file, file_format)
+            for row in rows:
+                # versioned inventories also list the previous versions and
+                # the delete markers
+                if row.get("is_latest") in (False, "false") or row.get(
+                    "is_delete_marker"
+                ) in (True, "true"):
+                    continue
+                yield inventory_row_to_s3_object(row)
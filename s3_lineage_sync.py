@@ -0,0 +1,498 @@
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pyatlan.model.assets import S3Object
+
+from atlan_operations import (
+    AssetBatchWriter,
+    PlannedAssetWriter,
+    SchemaTableIndexCache,
+    build_atlan_s3_object,
+    build_lineage_process,
+    create_or_update_atlan_s3_bucket,
+    fetch_lineage_processes,
+    fetch_s3_objects_in_bucket,
+    process_fingerprint,
+    reference_qualified_name,
+    s3_object_has_changed,
+    search_lineage_processes_by_qualified_names,
+)
+from constants import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, logger
+from execution import call_with_retry, run_concurrently
+
+
+LINEAGE_RULE_FIELDS = [
+    "source_connection_qualified_name",
+    "source_database_schema_qualified_name",
+    "source_table_pattern",
+    "target_connection_qualified_name",
+    "target_database_schema_qualified_name",
+    "target_table_pattern",
+]
+
+QueuedS3Object = namedtuple(
+    "QueuedS3Object",
+    # s3_object_guid is a temporary guid when the object is saved, otherwise
+    # the guid of the unchanged atlan asset. processes_guids are the temporary
+    # guids of the saved processes and the guids of the unchanged ones.
+    # action is created, updated or unchanged when compared with the existing
+    # atlan assets, upserted otherwise
+    ["listed_object", "s3_object_guid", "saved", "processes_guids", "action"],
+)
+
+
+def escape_wildcard(value):
+    return value.replace("\\", "\\\\").replace("*", "\\*").replace("?", "\\?")
+
+
+class S3LineageSync:
+    # writes the s3 objects of a bucket and their lineage processes to atlan.
+    # listed objects are queued one by one and saved in concurrent batches,
+    # wait() must be called once every object has been queued
+
+    def __init__(
+        self,
+        atlan_client,
+        s3_connection_qualified_name,
+        asset_owners,
+        source_connection_qualified_name,
+        source_database_schema_qualified_name,
+        target_connection_qualified_name,
+        target_database_schema_qualified_name,
+        source_extraction_process_name_suffix,
+        source_extraction_process_id_suffix,
+        target_import_process_name_suffix,
+        target_import_process_id_suffix,
+        s3_bucket_name,
+        s3_bucket_arn,
+        qualifier_suffix,
+        s3_bucket_prefix=None,
+        source_table_pattern=None,
+        target_table_pattern=None,
+        batch_size=DEFAULT_BATCH_SIZE,
+        concurrency=DEFAULT_CONCURRENCY,
+        file_name_patterns=None,
+        schema_table_indexes=None,
+        skip_unchanged_processes=True,
+        atlan_snapshot=None,
+        dry_run=False,
+    ):
+        self.atlan_client = atlan_client
+        self.s3_connection_qualified_name = s3_connection_qualified_name
+        self.asset_owners = asset_owners
+        self.source_connection_qualified_name = source_connection_qualified_name
+        self.source_database_schema_qualified_name = source_database_schema_qualified_name
+        self.target_connection_qualified_name = target_connection_qualified_name
+        self.target_database_schema_qualified_name = target_database_schema_qualified_name
+        self.source_extraction_process_name_suffix = source_extraction_process_name_suffix
+        self.source_extraction_process_id_suffix = source_extraction_process_id_suffix
+        self.target_import_process_name_suffix = target_import_process_name_suffix
+        self.target_import_process_id_suffix = target_import_process_id_suffix
+        self.s3_bucket_name = s3_bucket_name
+        self.s3_bucket_prefix = s3_bucket_prefix
+        self.source_table_pattern = source_table_pattern
+        self.target_table_pattern = target_table_pattern
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.skip_unchanged_processes = skip_unchanged_processes
+        # the existing processes and s3 objects are refreshed from the
+        # snapshot of the previous runs instead of being fetched in full
+        self.atlan_snapshot = atlan_snapshot
+
+        self.s3_bucket_atlan_arn = f"{s3_bucket_arn}-{qualifier_suffix}"
+        self.bucket_qualified_name = (
+            f"{s3_connection_qualified_name}/{self.s3_bucket_atlan_arn}"
+        )
+
+        # lineage params of each file name pattern, by pattern index. the
+        # fields that a pattern does not override come from the request
+        defaults = {field: getattr(self, field) for field in LINEAGE_RULE_FIELDS}
+        self.lineage_rules = [
+            {
+                field: (file_name_pattern or {}).get(field) or defaults[field]
+                for field in LINEAGE_RULE_FIELDS
+            }
+            for file_name_pattern in file_name_patterns or [None]
+        ]
+        self.tables_indexes = {}
+        # shared with the other buckets of a batch
+        self.schema_table_indexes = schema_table_indexes or SchemaTableIndexCache(
+            atlan_client, atlan_snapshot
+        )
+        self.existing_s3_objects = {}
+        self.reconciled = False
+        self.s3_objects_counts = {"created": 0, "updated": 0, "skipped": 0}
+        self.processes_counts = {"saved": 0, "skipped": 0}
+        # guid and fingerprint of the processes in atlan and of the processes
+        # queued by this sync, by qualified name
+        self.existing_processes = {}
+        self.queued_processes = {}
+        self.queued_s3_objects = deque()
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        if dry_run:
+            # the objects and processes are planned, not saved
+            self.s3_objects_writer = PlannedAssetWriter(batch_size)
+            self.processes_writer = PlannedAssetWriter(
+                batch_size, flush_first=self.s3_objects_writer
+            )
+            return
+        self.s3_objects_writer = AssetBatchWriter(
+            atlan_client,
+            batch_size,
+            executor=self._executor,
+            max_in_flight=concurrency,
+            metric_name="s3_object_batches",
+        )
+        self.processes_writer = AssetBatchWriter(
+            atlan_client,
+            batch_size,
+            flush_first=self.s3_objects_writer,
+            executor=self._executor,
+            max_in_flight=concurrency,
+            metric_name="lineage_process_batches",
+        )
+
+    def save_bucket(self, bucket_object_count):
+        logger.info("creating or updating the s3 bucket asset")
+        return call_with_retry(
+            create_or_update_atlan_s3_bucket,
+            atlan_client=self.atlan_client,
+            connection_qualified_name=self.s3_connection_qualified_name,
+            bucket_qualified_name=self.bucket_qualified_name,
+            bucket_name=self.s3_bucket_name,
+            bucket_aws_arn=self.s3_bucket_atlan_arn,
+            bucket_object_count=bucket_object_count,
+            asset_owners=self.asset_owners
+        )
+
+    def prepare(self, index_tables=True, reconcile_with_atlan=False, listed_objects=None):
+        # fetches concurrently the schema tables and the existing s3 objects
+        # needed by queue(). with listed_objects, only the processes of these
+        # objects are fetched, by their qualified names
+        fetches = []
+        schemas_qualified_names = []
+        if index_tables:
+            logger.info("indexing the source and target schema tables")
+            schemas_qualified_names = list(
+                dict.fromkeys(
+                    rule[f"{side}_database_schema_qualified_name"]
+                    for rule in self.lineage_rules
+                    for side in ("source", "target")
+                )
+            )
+            fetches += [
+                lambda schema_qualified_name=schema_qualified_name: (
+                    self.schema_table_indexes.get(schema_qualified_name)
+                )
+                for schema_qualified_name in schemas_qualified_names
+            ]
+        fetch_processes = index_tables and self.skip_unchanged_processes
+        if fetch_processes:
+            logger.info("fetching the existing lineage processes")
+            if listed_objects is not None:
+                fetches.append(lambda: self.fetch_processes_of(listed_objects))
+            elif self.atlan_snapshot is not None:
+                fetches.append(
+                    lambda: self.atlan_snapshot.lineage_processes(
+                        self.atlan_client, self.processes_qualified_name_wildcards()
+                    )
+                )
+            else:
+                fetches.append(
+                    lambda: call_with_retry(
+                        fetch_lineage_processes,
+                        self.atlan_client,
+                        self.processes_qualified_name_wildcards(),
+                    )
+                )
+        if reconcile_with_atlan:
+            logger.info("fetching the existing s3 objects of the bucket")
+            if self.atlan_snapshot is not None:
+                fetches.append(
+                    lambda: self.atlan_snapshot.s3_objects_in_bucket(
+                        self.atlan_client,
+                        self.bucket_qualified_name,
+                        self.s3_bucket_prefix,
+                    )
+                )
+            else:
+                fetches.append(
+                    lambda: call_with_retry(
+                        fetch_s3_objects_in_bucket,
+                        self.atlan_client,
+                        self.bucket_qualified_name,
+                        self.s3_bucket_prefix,
+                    )
+                )
+        fetched = run_concurrently(lambda fetch: fetch(), fetches, self.concurrency)
+        if reconcile_with_atlan:
+            self.existing_s3_objects = fetched.pop()
+            self.reconciled = True
+        if fetch_processes:
+            self.existing_processes = fetched.pop()
+        if index_tables:
+            self.tables_indexes = dict(zip(schemas_qualified_names, fetched))
+
+    def processes_qualified_name_wildcards(self):
+        # process ids are the table name followed by the suffix of the request
+        wildcards = []
+        for rule in self.lineage_rules:
+            wildcards.append(
+                f"{escape_wildcard(rule['source_connection_qualified_name'])}/*_"
+                f"{escape_wildcard(self.source_extraction_process_id_suffix)}"
+            )
+            wildcards.append(
+                f"{escape_wildcard(rule['target_connection_qualified_name'])}/* "
+                f"{escape_wildcard(self.target_import_process_id_suffix)}"
+            )
+        return list(dict.fromkeys(wildcards))
+
+    def processes_qualified_names(self, listed_object):
+        # the qualified names of the processes of an s3 object, from the
+        # process ids built by queue()
+        rule = self.lineage_rules[listed_object.pattern_index]
+        table_name = listed_object.table_name
+        return [
+            f"{rule['source_connection_qualified_name']}/"
+            f"{table_name}_{self.source_extraction_process_id_suffix}",
+            f"{rule['target_connection_qualified_name']}/"
+            f"{table_name} {self.target_import_process_id_suffix}",
+        ]
+
+    def search_processes_of(self, listed_objects):
+        qualified_names = list(
+            dict.fromkeys(
+                qualified_name
+                for listed_object in listed_objects
+                for qualified_name in self.processes_qualified_names(listed_object)
+            )
+        )
+        if not qualified_names:
+            return []
+        return call_with_retry(
+            search_lineage_processes_by_qualified_names,
+            self.atlan_client,
+            qualified_names,
+        )
+
+    def fetch_processes_of(self, listed_objects):
+        # guid and fingerprint of the existing processes of the s3 objects, by
+        # qualified name, like fetch_lineage_processes
+        return {
+            process.qualified_name: (process.guid, process_fingerprint(process))
+            for process in self.search_processes_of(listed_objects)
+        }
+
+    def orphaned_processes(self, removed_objects):
+        # qualified names of the processes of the removed s3 objects that
+        # reference no other s3 object, by guid. the processes are named after
+        # the table, the last file of a table synced is the one they reference
+        removed_qualified_names = {
+            f"{self.bucket_qualified_name}/{removed_object.key}"
+            for removed_object in removed_objects
+        }
+        orphaned_processes = {}
+        for process in self.search_processes_of(removed_objects):
+            s3_objects_qualified_names = [
+                reference_qualified_name(asset)
+                for asset in (process.inputs or []) + (process.outputs or [])
+                if asset.type_name == "S3Object"
+            ]
+            if s3_objects_qualified_names and all(
+                qualified_name in removed_qualified_names
+                for qualified_name in s3_objects_qualified_names
+            ):
+                orphaned_processes[process.guid] = process.qualified_name
+        return orphaned_processes
+
+    def queue_process(self, process):
+        # returns the temporary guid of the saved process, or the guid of the
+        # identical process already in atlan or already queued
+        if not self.skip_unchanged_processes:
+            self.processes_counts["saved"] += 1
+            return self.processes_writer.add(process)
+        fingerprint = process_fingerprint(process)
+        known_process = self.queued_processes.get(
+            process.qualified_name
+        ) or self.existing_processes.get(process.qualified_name)
+        if known_process is not None and known_process[1] == fingerprint:
+            self.processes_counts["skipped"] += 1
+            return known_process[0]
+        self.processes_counts["saved"] += 1
+        process_guid = self.processes_writer.add(process)
+        self.queued_processes[process.qualified_name] = (process_guid, fingerprint)
+        return process_guid
+
+    def queue(self, listed_object):
+        s3_obj_name, table_name = listed_object.key, listed_object.table_name
+        s3_object_qualified_name = f"{self.bucket_qualified_name}/{s3_obj_name}"
+        s3_object = build_atlan_s3_object(
+            connection_qualified_name=self.s3_connection_qualified_name,
+            bucket_qualified_name=self.bucket_qualified_name,
+            s3_object_qualified_name=s3_object_qualified_name,
+            s3_object_name=s3_obj_name,
+            s3_object_aws_arn=f"{self.s3_bucket_atlan_arn}/{s3_obj_name}",
+            asset_owners=self.asset_owners,
+            size=listed_object.size,
+            last_modified=listed_object.last_modified,
+            storage_class=listed_object.storage_class,
+            e_tag=listed_object.e_tag,
+            csv_headers=listed_object.csv_headers,
+        )
+        existing_s3_object = self.existing_s3_objects.get(s3_object_qualified_name)
+        if existing_s3_object is None:
+            self.s3_objects_counts["created"] += 1
+            action = "created" if self.reconciled else "upserted"
+        elif s3_object_has_changed(existing_s3_object, s3_object):
+            self.s3_objects_counts["updated"] += 1
+            action = "updated"
+        else:
+            self.s3_objects_counts["skipped"] += 1
+            action = "unchanged"
+            s3_object = None
+
+        if s3_object is not None:
+            logger.info(f"creating or updating {s3_obj_name} s3 asset...")
+            s3_object_guid = self.s3_objects_writer.add(s3_object)
+        else:
+            s3_object_guid = existing_s3_object.guid
+        processes_guids = []
+        rule = self.lineage_rules[listed_object.pattern_index]
+
+        def search_tables(side):
+            table_pattern = rule[f"{side}_table_pattern"]
+            search_pattern = table_name
+            if table_pattern and "{table_name}" in table_pattern:
+                search_pattern = table_pattern.format(table_name=table_name)
+            return self.tables_indexes[
+                rule[f"{side}_database_schema_qualified_name"]
+            ].search(search_pattern)
+
+        source_tables = search_tables("source")
+        if source_tables:
+            logger.info(
+                f"creating or updating source to staging lineage for {table_name}..."
+            )
+            processes_guids.append(
+                self.queue_process(
+                    build_lineage_process(
+                        process_name=f"{table_name} {self.source_extraction_process_name_suffix}",
+                        process_id=f"{table_name}_{self.source_extraction_process_id_suffix}",
+                        connection_qualified_name=rule["source_connection_qualified_name"],
+                        inputs=source_tables,
+                        outputs=[
+                            S3Object.ref_by_qualified_name(
+                                qualified_name=s3_object_qualified_name
+                            )
+                        ],
+                        asset_owners=self.asset_owners
+                    )
+                )
+            )
+
+        target_tables = search_tables("target")
+        if target_tables:
+            logger.info(
+                f"creating or updating staging to target lineage for {table_name}..."
+            )
+            processes_guids.append(
+                self.queue_process(
+                    build_lineage_process(
+                        process_name=f"{table_name} {self.target_import_process_name_suffix}",
+                        process_id=f"{table_name} {self.target_import_process_id_suffix}",
+                        connection_qualified_name=rule["target_connection_qualified_name"],
+                        inputs=[
+                            S3Object.ref_by_qualified_name(
+                                qualified_name=s3_object_qualified_name
+                            )
+                        ],
+                        outputs=target_tables,
+                        asset_owners=self.asset_owners
+                    )
+                )
+            )
+
+        queued_s3_object = QueuedS3Object(
+            listed_object=listed_object,
+            s3_object_guid=s3_object_guid,
+            saved=s3_object is not None,
+            processes_guids=processes_guids,
+            action=action,
+        )
+        self.queued_s3_objects.append(queued_s3_object)
+        return queued_s3_object
+
+    def wait(self):
+        self.processes_writer.wait()
+        self.s3_objects_writer.wait()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def resolve_s3_object_guid(self, queued_s3_object):
+        if not queued_s3_object.saved:
+            return queued_s3_object.s3_object_guid
+        return self.s3_objects_writer.guid_assignments.get(
+            queued_s3_object.s3_object_guid
+        )
+
+    def resolve_process_guid(self, process_guid):
+        # temporary guids start with a minus, the others are the guids of
+        # unchanged processes. None for a process whose batch failed
+        if not process_guid.startswith("-"):
+            return process_guid
+        return self.processes_writer.guid_assignments.get(process_guid)
+
+    def resolve_processes_guids(self, queued_s3_object):
+        resolved_guids = (
+            self.resolve_process_guid(guid) for guid in queued_s3_object.processes_guids
+        )
+        return [guid for guid in resolved_guids if guid is not None]
+
+    def is_settled(self, queued_s3_object):
+        # whether the batches of the object and of its processes are done
+        return (
+            not queued_s3_object.saved
+            or self.s3_objects_writer.is_saved_or_failed(queued_s3_object.s3_object_guid)
+        ) and all(
+            not guid.startswith("-") or self.processes_writer.is_saved_or_failed(guid)
+            for guid in queued_s3_object.processes_guids
+        )
+
+    def drain_settled(self):
+        # yields, in queue order, the queued objects whose batches are done
+        # with their resolved s3 object guid (None when failed) and processes
+        # guids, then forgets them to bound the memory of large runs. the
+        # drained objects are not part of s3_objects_guids() and
+        # processes_guids() anymore
+        while self.queued_s3_objects and self.is_settled(self.queued_s3_objects[0]):
+            queued = self.queued_s3_objects.popleft()
+            settled = (
+                queued,
+                self.resolve_s3_object_guid(queued),
+                self.resolve_processes_guids(queued),
+            )
+            if queued.saved:
+                self.s3_objects_writer.forget(queued.s3_object_guid)
+            yield settled
+
+    def s3_objects_guids(self):
+        return self.s3_objects_writer.resolve_guids(
+            [queued.s3_object_guid for queued in self.queued_s3_objects if queued.saved]
+        )
+
+    def processes_guids(self):
+        # guids of the saved processes and of the unchanged ones, once each
+        resolved_guids = (
+            self.resolve_process_guid(guid)
+            for guid in dict.fromkeys(
+                guid
+                for queued in self.queued_s3_objects
+                for guid in queued.processes_guids
+            )
+        )
+        return list(dict.fromkeys(guid for guid in resolved_guids if guid is not None))
+
+    def failures(self):
+        return self.s3_objects_writer.failures + self.processes_writer.failures
@@ -1,42 +1,397 @@
+import csv
+import itertools
+import queue
 import re
+import threading
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+from constants import (
+    ARCHIVE_STORAGE_CLASSES,
+    HEADER_SAMPLE_BYTES,
+    LISTING_PAGE_SIZE,
+    LISTING_QUEUE_SIZE,
+    logger,
+)
 
-def get_s3_bucket_objects_and_table_names(
+
+S3ListedObject = namedtuple(
+    "S3ListedObject",
+    [
+        "key",
+        "table_name",
+        "e_tag",
+        "last_modified",
+        "size",
+        "pattern_index",
+        "storage_class",
+        "csv_headers",
+    ],
+    # pattern_index is the index of the file name pattern matching the key,
+    # csv_headers the column names sampled from a delimited file
+    defaults=[0, None, None],
+)
+
+
+def file_name_without_extension(file_full_path):
+    return file_full_path[file_full_path.rfind("/") + 1:].partition(".")[0]
+
+
+class SharedClientsSession:
+    # aws session whose clients are created once and shared by the threads:
+    # boto3 clients are thread safe, but creating them from a shared session
+    # is not, and takes tens of milliseconds
+    def __init__(self, aws_session):
+        self.aws_session = aws_session
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, service_name):
+        with self._lock:
+            if service_name not in self._clients:
+                self._clients[service_name] = self.aws_session.client(service_name)
+            return self._clients[service_name]
+
+
+def build_s3_key_router(file_name_regexes=None):
+    # returns a function giving the (table name, pattern index) of an s3 key,
+    # or None if the key matches none of the patterns. the patterns are
+    # compiled into a single regex, each one in its own named group, so a key
+    # is matched once and routed to the first pattern that matches it.
+    # a "{table_name}" placeholder captures the table name, otherwise the
+    # file name without extension is used
+    if isinstance(file_name_regexes, str):
+        file_name_regexes = [file_name_regexes]
+    if not file_name_regexes:
+        return lambda file_full_path: (file_name_without_extension(file_full_path), 0)
+
+    alternatives = []
+    for index, file_name_regex in enumerate(file_name_regexes):
+        file_name_regex_ = file_name_regex.replace("{table_name}", f"(?P<t{index}>.+)")
+        alternatives.append(f"(?P<p{index}>{file_name_regex_})")
+    pattern = re.compile("^(?:" + "|".join(alternatives) + ")$", re.IGNORECASE)
+    has_table_name_group = ["{table_name}" in regex for regex in file_name_regexes]
+
+    def route(file_full_path):
+        match = pattern.match(file_full_path)
+        if match is None:
+            return None
+        # the pattern group is the last group closed by the match
+        index = int(match.lastgroup[1:])
+        if has_table_name_group[index]:
+            return match.group(f"t{index}"), index
+        return file_name_without_extension(file_full_path), index
+
+    return route
+
+
+def build_listing_scope(s3_prefix=None, file_name_regex=None, shard_prefixes=None):
+    # returns a function telling whether a listing with these params can
+    # return an s3 key. the keys out of its scope are never archived because
+    # they are missing from the listing
+    route = build_s3_key_router(file_name_regex)
+    prefixes = tuple(shard_prefixes or [s3_prefix or ""])
+
+    def in_scope(file_full_path):
+        return file_full_path.startswith(prefixes) and route(file_full_path) is not None
+
+    return in_scope
+
+
+def iter_s3_object_pages(
+    s3_client, bucket_name, prefix, delimiter=None, start_after=None
+):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    pagination_params = {
+        "Bucket": bucket_name,
+        "Prefix": prefix,
+        "PaginationConfig": {"PageSize": LISTING_PAGE_SIZE},
+    }
+    if delimiter:
+        pagination_params["Delimiter"] = delimiter
+    if start_after:
+        pagination_params["StartAfter"] = start_after
+    yield from paginator.paginate(**pagination_params)
+
+
+def discover_s3_sub_prefixes(s3_client, bucket_name, prefix, delimiter="/"):
+    # returns the sub prefixes found under prefix and the objects listed
+    # directly under it, which are not part of any sub prefix
+    sub_prefixes = []
+    direct_objects = []
+    for page in iter_s3_object_pages(s3_client, bucket_name, prefix, delimiter):
+        sub_prefixes.extend(
+            common_prefix["Prefix"] for common_prefix in page.get("CommonPrefixes", [])
+        )
+        direct_objects.extend(page.get("Contents", []))
+    return sub_prefixes, direct_objects
+
+
+def iter_s3_objects_in_shards(
+    s3_client, bucket_name, shard_prefixes, concurrency, discovered_prefix=None
+):
+    # lists the shards concurrently and yields their objects as pages arrive.
+    # with discovered_prefix, its sub prefixes are listed as shards as soon as
+    # its delimited listing returns them, and the objects directly under it
+    # are yielded from the same pages. the bounded queue keeps the listing
+    # threads at most a few pages ahead of the consumer
+    pages = queue.Queue(maxsize=LISTING_QUEUE_SIZE)
+    stopped = threading.Event()
+    shard_done = object()
+    remaining_listings = [len(shard_prefixes) + (discovered_prefix is not None)]
+    remaining_lock = threading.Lock()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def list_shard(shard_prefix):
+        try:
+            for page in iter_s3_object_pages(s3_client, bucket_name, shard_prefix):
+                if stopped.is_set():
+                    return
+                put(page.get("Contents", []))
+        except Exception as err:
+            put(err)
+        finally:
+            put(shard_done)
+
+    def discover_shards(executor):
+        try:
+            for page in iter_s3_object_pages(
+                s3_client, bucket_name, discovered_prefix, "/"
+            ):
+                if stopped.is_set():
+                    return
+                for common_prefix in page.get("CommonPrefixes", []):
+                    # counted before being submitted, the consumer stops
+                    # once every listing is done
+                    with remaining_lock:
+                        remaining_listings[0] += 1
+                    executor.submit(list_shard, common_prefix["Prefix"])
+                put(page.get("Contents", []))
+        except Exception as err:
+            put(err)
+        finally:
+            put(shard_done)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if discovered_prefix is not None:
+            executor.submit(discover_shards, executor)
+        for shard_prefix in shard_prefixes:
+            executor.submit(list_shard, shard_prefix)
+        try:
+            while True:
+                with remaining_lock:
+                    if not remaining_listings[0]:
+                        break
+                item = pages.get()
+                if item is shard_done:
+                    with remaining_lock:
+                        remaining_listings[0] -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield from item
+        finally:
+            stopped.set()
+
+
+def iter_in_background(items, chunk_size=LISTING_PAGE_SIZE, max_chunks=LISTING_QUEUE_SIZE):
+    # consumes items, e.g. a listing, in a background thread and returns an
+    # iterator over them. they go through a bounded queue of chunks so the
+    # producer runs at most max_chunks chunks ahead of the consumer. the
+    # iterator must be closed if it is not consumed to the end
+    chunks = queue.Queue(maxsize=max_chunks)
+    stopped = threading.Event()
+    produced = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        iterator = iter(items)
+        try:
+            while not stopped.is_set():
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                put(chunk)
+        except Exception as err:
+            put(err)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            put(produced)
+
+    def consume():
+        try:
+            while True:
+                item = chunks.get()
+                if item is produced:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            stopped.set()
+
+    threading.Thread(target=produce, daemon=True).start()
+    return consume()
+
+
+def iter_s3_bucket_objects_and_table_names(
     aws_session,
     bucket_name,
     s3_prefix=None,
-    file_name_regex=None,  # another example is "(.+/)*{table_name}.csv",
+    file_name_regex=None,
+    parallel=False,
+    shard_prefixes=None,
+    concurrency=1,
+    start_after=None,
+    inventory_manifest_location=None,
 ):
-    file_name_regex_ = None
-    if file_name_regex:
-        file_name_regex_ = "^" + file_name_regex.replace("{table_name}", "(?P<table_name>.+)") + "$"
-        pattern = re.compile(file_name_regex_, re.IGNORECASE)
-
+    # start_after resumes a sequential listing after the given key, keys being
+    # listed in lexicographical order
+    # file_name_regex is a regex or a list of regexes tried in order
+    # inventory_manifest_location reads the objects from an s3 inventory
+    # report instead of listing the bucket
+    route = build_s3_key_router(file_name_regex)
     s3_prefix_ = "" if s3_prefix is None else s3_prefix
+    # local inventories are read without s3 client
+    s3_client = None if inventory_manifest_location else aws_session.client("s3")
 
-    s3 = aws_session.resource("s3")
-    bucket = s3.Bucket(bucket_name)
+    if inventory_manifest_location:
+        # imported here, s3_inventory depends on this module
+        from s3_inventory import iter_s3_inventory_objects
 
-    s3_object_paths_and_file_names = []
-    for s3_object in bucket.objects.filter(Prefix=s3_prefix_):
-        file_full_path = s3_object.key
-        if file_name_regex_ is None:
-            file_name_without_extension = file_full_path.split("/")[-1].split(".")[0]
-            s3_object_paths_and_file_names.append(
-                (file_full_path, file_name_without_extension)
+        s3_objects = (
+            s3_object
+            for s3_object in iter_s3_inventory_objects(
+                aws_session, bucket_name, inventory_manifest_location
             )
+            if s3_object["Key"].startswith(s3_prefix_)
+        )
+    elif shard_prefixes:
+        s3_objects = iter_s3_objects_in_shards(
+            s3_client, bucket_name, shard_prefixes, concurrency
+        )
+    elif parallel:
+        # the objects directly under the prefix, e.g. of a flat bucket, are
+        # streamed while the sub prefixes are listed
+        s3_objects = iter_s3_objects_in_shards(
+            s3_client, bucket_name, [], concurrency, discovered_prefix=s3_prefix_
+        )
+    else:
+        s3_objects = (
+            s3_object
+            for page in iter_s3_object_pages(
+                s3_client, bucket_name, s3_prefix_, start_after=start_after
+            )
+            for s3_object in page.get("Contents", [])
+        )
+
+    for s3_object in s3_objects:
+        file_full_path = s3_object["Key"]
+        routed = route(file_full_path)
+        if routed is not None:
+            yield S3ListedObject(
+                key=file_full_path,
+                table_name=routed[0],
+                e_tag=s3_object["ETag"],
+                last_modified=(
+                    s3_object["LastModified"].isoformat()
+                    if s3_object["LastModified"] is not None
+                    else None
+                ),
+                size=s3_object["Size"],
+                pattern_index=routed[1],
+                storage_class=s3_object.get("StorageClass"),
+            )
+
+
+def csv_delimiter(file_full_path):
+    # delimiter of the files whose header can be sampled, gzipped or not.
+    # None for the other files
+    file_name = file_full_path.lower()
+    if file_name.endswith(".gz"):
+        file_name = file_name[:-len(".gz")]
+    if file_name.endswith(".csv"):
+        return ","
+    if file_name.endswith(".tsv"):
+        return "\t"
+    return None
+
+
+def sample_csv_header(s3_client, bucket_name, listed_object, sample_bytes=HEADER_SAMPLE_BYTES):
+    # reads the header line of a delimited file from its first bytes with a
+    # ranged get. returns the column names, an empty list when the header
+    # does not fit in the sample, None when the file cannot be read
+    from botocore.exceptions import ClientError
+
+    key = listed_object.key
+    get_params = {"Bucket": bucket_name, "Key": key, "Range": f"bytes=0-{sample_bytes - 1}"}
+    if listed_object.e_tag:
+        # the header of the listed version, not of a newer one
+        get_params["IfMatch"] = listed_object.e_tag
+    try:
+        sample = s3_client.get_object(**get_params)["Body"].read(sample_bytes)
+    except ClientError as err:
+        logger.warning(f"failed to sample the header of {key}: {err}")
+        return None
+    whole_file = listed_object.size is not None and listed_object.size <= sample_bytes
+    if key.lower().endswith(".gz"):
+        # the start of a gzip stream can be decompressed on its own
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            sample = decompressor.decompress(sample)
+        except zlib.error as err:
+            logger.warning(f"failed to sample the header of {key}: {err}")
+            return None
+        whole_file = decompressor.eof
+    header_line, newline, _ = sample.partition(b"\n")
+    if not newline and not whole_file:
+        return []
+    header_line = header_line.decode("utf-8-sig", errors="replace").rstrip("\r")
+    columns = next(csv.reader([header_line], delimiter=csv_delimiter(key)), [])
+    return [column.strip() for column in columns if column.strip()]
+
+
+def iter_with_csv_headers(aws_session, bucket_name, listed_objects, headers_cache, concurrency=1):
+    # fills the csv_headers of the listed delimited files, sampled
+    # concurrently a page of keys at a time. the headers are cached by etag so
+    # an unchanged file is read once, files without a readable header too
+    s3_client = aws_session.client("s3")
+
+    def with_csv_headers(listed_object):
+        if csv_delimiter(listed_object.key) is None:
+            return listed_object
+        cache_key = (bucket_name, listed_object.key, listed_object.e_tag)
+        headers = headers_cache.get(cache_key)
+        # an archived file cannot be read, its headers are only known when
+        # sampled before its transition
+        if headers is None and listed_object.storage_class in ARCHIVE_STORAGE_CLASSES:
+            return listed_object
+        if headers is None:
+            headers = sample_csv_header(s3_client, bucket_name, listed_object)
+            if headers is not None and listed_object.e_tag:
+                headers_cache.set(cache_key, headers)
+        return listed_object._replace(csv_headers=headers or None)
 
-        elif match := pattern.match(file_full_path):
-            if "{table_name}" in file_name_regex:
-                s3_object_paths_and_file_names.append(
-                    (file_full_path, match.group("table_name"))
-                )
-            else:
-                file_name_without_extension = file_full_path.split("/")[-1].split(".")[
-                    0
-                ]
-                s3_object_paths_and_file_names.append(
-                    (file_full_path, file_name_without_extension)
-                )
-
-    return s3_object_paths_and_file_names
+    listed_objects = iter(listed_objects)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            page = list(itertools.islice(listed_objects, LISTING_PAGE_SIZE))
+            if not page:
+                return
+            yield from executor.map(with_csv_headers, page)
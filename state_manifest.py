@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+
+from constants import logger
+
+
+MANIFEST_VERSION = 1
+
+
+def encode_json(document, compressed):
+    body = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    return gzip.compress(body) if compressed else body
+
+
+def decode_json(body, compressed):
+    return json.loads(gzip.decompress(body) if compressed else body)
+
+
+class LocalFileManifestStore:
+    def __init__(self, path):
+        self.path = path
+        self.compressed = path.endswith(".gz")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as manifest_file:
+            return decode_json(manifest_file.read(), self.compressed)
+
+    def save(self, manifest):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as manifest_file:
+            manifest_file.write(encode_json(manifest, self.compressed))
+        os.replace(tmp_path, self.path)
+
+
+class S3ManifestStore:
+    def __init__(self, aws_session, bucket_name, key):
+        self.bucket_name = bucket_name
+        self.key = key
+        self.compressed = key.endswith(".gz")
+        self.s3_client = aws_session.client("s3")
+
+    def load(self):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.key)
+        except ClientError as err:
+            if err.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return decode_json(response["Body"].read(), self.compressed)
+
+    def save(self, manifest):
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            Body=encode_json(manifest, self.compressed),
+            ContentType="application/json",
+        )
+
+
+def build_manifest_store(aws_session, location):
+    # location is either s3://bucket/key or a local file path, the json is
+    # gzipped when it ends with .gz
+    if location.startswith("s3://"):
+        bucket_name, _, key = location[len("s3://"):].partition("/")
+        return S3ManifestStore(aws_session, bucket_name, key)
+    return LocalFileManifestStore(location)
+
+
+def load_manifest_objects(manifest_store, bucket_qualified_name):
+    manifest = manifest_store.load()
+    if manifest is None:
+        logger.info("no state manifest found, running a full sync")
+        return {}
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("bucket_qualified_name") != bucket_qualified_name
+    ):
+        logger.info("state manifest does not match this bucket, running a full sync")
+        return {}
+    return manifest["objects"]
+
+
+def save_manifest_objects(manifest_store, bucket_qualified_name, manifest_objects):
+    manifest_store.save(
+        {
+            "version": MANIFEST_VERSION,
+            "bucket_qualified_name": bucket_qualified_name,
+            "objects": manifest_objects,
+        }
+    )
+
+
+def manifest_entry(listed_object, s3_object_guid, processes_guids):
+    return {
+        "e_tag": listed_object.e_tag,
+        "last_modified": listed_object.last_modified,
+        "size": listed_object.size,
+        "table_name": listed_object.table_name,
+        "pattern_index": listed_object.pattern_index,
+        "csv_headers": listed_object.csv_headers,
+        "guid": s3_object_guid,
+        "processes_guids": processes_guids,
+    }
+
+
+def manifest_status(listed_object, entry):
+    # added, changed or unchanged since the manifest entry of the key
+    if entry is None:
+        return "added"
+    if (
+        entry["e_tag"] != listed_object.e_tag
+        or entry["last_modified"] != listed_object.last_modified
+        or entry["size"] != listed_object.size
+        or entry["table_name"] != listed_object.table_name
+        or entry.get("pattern_index", 0) != listed_object.pattern_index
+    ):
+        return "changed"
+    return "unchanged"
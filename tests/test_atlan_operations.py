@@ -0,0 +1,150 @@
+from pyatlan.errors import ErrorCode
+from pyatlan.model.assets import Process, S3Object, Table
+from pyatlan.model.response import AssetMutationResponse
+
+from atlan_operations import AssetBatchWriter
+
+
+S3_CONNECTION_QUALIFIED_NAME = "default/s3/1700000000"
+BUCKET_QUALIFIED_NAME = f"{S3_CONNECTION_QUALIFIED_NAME}/arn:aws:s3:::bucket"
+SCHEMA_QUALIFIED_NAME = "default/postgres/1700000001/DB/SCHEMA"
+
+
+class RecordingAssetClient:
+    # saves nothing, records the qualified names of each batch and fails the
+    # batches holding one of the failing qualified names
+    def __init__(self, failing_qualified_names=()):
+        self.batches = []
+        self.failing_qualified_names = set(failing_qualified_names)
+
+    def save(self, assets):
+        qualified_names = [asset.qualified_name for asset in assets]
+        self.batches.append(qualified_names)
+        if self.failing_qualified_names.intersection(qualified_names):
+            raise ErrorCode.ASSET_NOT_FOUND_BY_GUID.exception_with_parameters("bad")
+        return AssetMutationResponse(
+            guid_assignments={asset.guid: f"guid-{asset.name}" for asset in assets}
+        )
+
+
+class RecordingAtlanClient:
+    def __init__(self, failing_qualified_names=()):
+        self.asset = RecordingAssetClient(failing_qualified_names)
+
+
+def s3_object(key):
+    return S3Object.creator(
+        name=key,
+        connection_qualified_name=S3_CONNECTION_QUALIFIED_NAME,
+        aws_arn=f"arn:aws:s3:::bucket/{key}",
+        s3_bucket_qualified_name=BUCKET_QUALIFIED_NAME,
+    )
+
+
+def process(name, output):
+    return Process.creator(
+        name=name,
+        connection_qualified_name=S3_CONNECTION_QUALIFIED_NAME,
+        process_id=name,
+        inputs=[Table.ref_by_qualified_name(f"{SCHEMA_QUALIFIED_NAME}/{name}")],
+        outputs=[S3Object.ref_by_qualified_name(output.qualified_name)],
+    )
+
+
+def qualified_names(*assets):
+    return [asset.qualified_name for asset in assets]
+
+
+def test_full_batches_are_sent_in_order():
+    atlan_client = RecordingAtlanClient()
+    writer = AssetBatchWriter(atlan_client, batch_size=2)
+    objects = [s3_object(f"{number}.csv") for number in range(5)]
+    for s3_object_ in objects:
+        writer.add(s3_object_)
+    assert atlan_client.asset.batches == [
+        qualified_names(*objects[:2]),
+        qualified_names(*objects[2:4]),
+    ]
+    writer.wait()
+    assert atlan_client.asset.batches[-1] == qualified_names(objects[4])
+    assert len(writer.guid_assignments) == 5
+
+
+def test_dependent_batches_wait_for_the_assets_they_reference():
+    atlan_client = RecordingAtlanClient()
+    objects_writer = AssetBatchWriter(atlan_client, batch_size=3)
+    processes_writer = AssetBatchWriter(
+        atlan_client, batch_size=2, flush_first=objects_writer
+    )
+    first_object = s3_object("a.csv")
+    objects_writer.add(first_object)
+    processes = [process(f"p{number}", first_object) for number in range(2)]
+    for process_ in processes:
+        processes_writer.add(process_)
+    # the full batch of processes is held back until its s3 object is sent
+    assert atlan_client.asset.batches == []
+
+    other_objects = [s3_object("b.csv"), s3_object("c.csv")]
+    for s3_object_ in other_objects:
+        objects_writer.add(s3_object_)
+    assert atlan_client.asset.batches == [
+        qualified_names(first_object, *other_objects),
+        qualified_names(*processes),
+    ]
+
+
+def test_flush_sends_the_referenced_assets_first():
+    atlan_client = RecordingAtlanClient()
+    objects_writer = AssetBatchWriter(atlan_client, batch_size=10)
+    processes_writer = AssetBatchWriter(
+        atlan_client, batch_size=10, flush_first=objects_writer
+    )
+    s3_object_ = s3_object("a.csv")
+    objects_writer.add(s3_object_)
+    process_ = process("p", s3_object_)
+    processes_writer.add(process_)
+    processes_writer.wait()
+    assert atlan_client.asset.batches == [
+        qualified_names(s3_object_),
+        qualified_names(process_),
+    ]
+
+
+def test_failed_batch_is_saved_again_asset_by_asset():
+    bad_object = s3_object("bad.csv")
+    good_object = s3_object("good.csv")
+    atlan_client = RecordingAtlanClient([bad_object.qualified_name])
+    writer = AssetBatchWriter(atlan_client, batch_size=2)
+    writer.add(good_object)
+    writer.add(bad_object)
+    writer.wait()
+    assert atlan_client.asset.batches == [
+        qualified_names(good_object, bad_object),
+        qualified_names(good_object),
+        qualified_names(bad_object),
+    ]
+    assert [failure["qualified_name"] for failure in writer.failures] == qualified_names(bad_object)
+    assert writer.is_saved_or_failed(good_object.guid)
+    assert writer.is_saved_or_failed(bad_object.guid)
+    assert writer.resolve_guids([good_object.guid, bad_object.guid]) == ["guid-good.csv"]
+
+
+def test_assets_referencing_a_failed_asset_are_not_sent():
+    bad_object = s3_object("bad.csv")
+    good_object = s3_object("good.csv")
+    atlan_client = RecordingAtlanClient([bad_object.qualified_name])
+    objects_writer = AssetBatchWriter(atlan_client, batch_size=1)
+    processes_writer = AssetBatchWriter(
+        atlan_client, batch_size=10, flush_first=objects_writer
+    )
+    for s3_object_ in (bad_object, good_object):
+        objects_writer.add(s3_object_)
+    bad_process = process("bad", bad_object)
+    good_process = process("good", good_object)
+    processes_writer.add(bad_process)
+    processes_writer.add(good_process)
+    processes_writer.wait()
+    assert atlan_client.asset.batches[-1] == qualified_names(good_process)
+    assert [failure["qualified_name"] for failure in processes_writer.failures] == (
+        qualified_names(bad_process)
+    )
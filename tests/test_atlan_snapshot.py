@@ -0,0 +1,63 @@
+import datetime
+
+from pyatlan.model.assets import S3Object, Table
+
+from atlan_operations import SchemaTableIndex, s3_object_has_changed
+from atlan_snapshot import (
+    S3_OBJECT_ENTRY_FIELDS,
+    TABLE_ENTRY_FIELDS,
+    SnapshotAssets,
+    asset_entry,
+    asset_from_entry,
+)
+
+
+def s3_object():
+    s3_object_ = S3Object.creator(
+        name="exports/orders.csv",
+        connection_qualified_name="default/s3/1700000000",
+        aws_arn="arn:aws:s3:::bucket/exports/orders.csv",
+        s3_bucket_qualified_name="default/s3/1700000000/arn:aws:s3:::bucket",
+    )
+    s3_object_.guid = "s3-object-guid"
+    s3_object_.owner_users = {"owner"}
+    s3_object_.s3_object_key = "exports/orders.csv"
+    s3_object_.s3_object_size = 10
+    s3_object_.s3_object_last_modified_time = datetime.datetime(
+        2024, 1, 1, tzinfo=datetime.timezone.utc
+    )
+    s3_object_.s3_e_tag = '"abc"'
+    return s3_object_
+
+
+def test_s3_object_entry_round_trip():
+    entry = asset_entry(s3_object(), S3_OBJECT_ENTRY_FIELDS)
+    assert entry[S3_OBJECT_ENTRY_FIELDS.index("owner_users")] == ["owner"]
+    assert entry[S3_OBJECT_ENTRY_FIELDS.index("s3_object_last_modified_time")] == 1704067200000
+    rebuilt = asset_from_entry(S3Object, S3_OBJECT_ENTRY_FIELDS, entry)
+    assert rebuilt.guid == "s3-object-guid"
+    assert not s3_object_has_changed(rebuilt, s3_object())
+
+
+def test_snapshot_assets_are_built_when_looked_up():
+    entry = asset_entry(s3_object(), S3_OBJECT_ENTRY_FIELDS)
+    assets = SnapshotAssets({"qualified-name": entry}, S3Object, S3_OBJECT_ENTRY_FIELDS)
+    assert list(assets) == ["qualified-name"]
+    assert assets.get("other") is None
+    assert assets["qualified-name"].s3_e_tag == '"abc"'
+
+
+def test_table_index_of_snapshot_entries():
+    entries = [
+        ["guid-1", "default/postgres/1/DB/SCHEMA/ORDERS", "ORDERS"],
+        ["guid-2", "default/postgres/1/DB/SCHEMA/ORDER_ITEMS", "ORDER_ITEMS"],
+    ]
+    index = SchemaTableIndex(
+        [(entry[TABLE_ENTRY_FIELDS.index("name")], entry) for entry in entries],
+        build_table=lambda entry: asset_from_entry(Table, TABLE_ENTRY_FIELDS, entry),
+    )
+    (table,) = index.search("orders")
+    assert isinstance(table, Table)
+    assert (table.guid, table.qualified_name) == ("guid-1", entries[0][1])
+    assert [table.name for table in index.search("order.*")] == ["ORDERS", "ORDER_ITEMS"]
+    assert index.search("customers") == []
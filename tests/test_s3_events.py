@@ -0,0 +1,71 @@
+import json
+
+from s3_events import latest_event_by_key, parse_s3_event_records
+
+
+def s3_record(event_name, key, sequencer, bucket_name="bucket"):
+    return {
+        "eventSource": "aws:s3",
+        "eventName": event_name,
+        "eventTime": "2024-01-01T00:00:00.000Z",
+        "s3": {
+            "bucket": {"name": bucket_name},
+            "object": {"key": key, "size": 10, "eTag": "abc", "sequencer": sequencer},
+        },
+    }
+
+
+def sqs_record(message_id, *s3_records):
+    return {
+        "eventSource": "aws:sqs",
+        "messageId": message_id,
+        "body": json.dumps({"Records": list(s3_records)}),
+    }
+
+
+def test_parse_sqs_messages():
+    records, invalid_message_ids = parse_s3_event_records(
+        {
+            "Records": [
+                sqs_record("m1", s3_record("ObjectCreated:Put", "a+b%2Fc.csv", "0A")),
+                {"eventSource": "aws:sqs", "messageId": "m2", "body": "not json"},
+                # the test event of a new notification has no records
+                {"eventSource": "aws:sqs", "messageId": "m3", "body": json.dumps({"Event": "s3:TestEvent"})},
+            ]
+        }
+    )
+    assert invalid_message_ids == ["m2"]
+    (record,) = records
+    assert record.message_id == "m1"
+    assert record.key == "a b/c.csv"
+    assert record.e_tag == '"abc"'
+    assert not record.removed
+
+
+def test_latest_event_wins_whatever_the_delivery_order():
+    records, _ = parse_s3_event_records(
+        {
+            "Records": [
+                sqs_record("m1", s3_record("ObjectRemoved:Delete", "a.csv", "0000000000000000B0")),
+                sqs_record("m2", s3_record("ObjectCreated:Put", "a.csv", "00000000000000000A")),
+                sqs_record("m3", s3_record("ObjectCreated:Put", "b.csv", "0C")),
+                sqs_record("m4", s3_record("ObjectCreated:Put", "a.csv", "0C", bucket_name="other")),
+            ]
+        }
+    )
+    latest_records = latest_event_by_key(records)
+    assert set(latest_records) == {("bucket", "a.csv"), ("bucket", "b.csv"), ("other", "a.csv")}
+    assert latest_records[("bucket", "a.csv")].message_id == "m1"
+    assert latest_records[("bucket", "a.csv")].removed
+
+
+def test_event_without_sequencer_is_superseded():
+    records, _ = parse_s3_event_records(
+        {
+            "Records": [
+                s3_record("ObjectCreated:Put", "a.csv", "01"),
+                s3_record("ObjectRemoved:Delete", "a.csv", None),
+            ]
+        }
+    )
+    assert not latest_event_by_key(records)[("bucket", "a.csv")].removed
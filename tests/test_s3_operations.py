@@ -0,0 +1,51 @@
+from s3_operations import build_listing_scope, build_s3_key_router
+
+
+def test_router_without_patterns_uses_the_file_name():
+    route = build_s3_key_router()
+    assert route("exports/2024/orders.csv.gz") == ("orders", 0)
+
+
+def test_router_captures_the_table_name():
+    route = build_s3_key_router(r"exports/\d+/{table_name}\.csv")
+    assert route("exports/2024/orders.csv") == ("orders", 0)
+    assert route("exports/2024/orders.json") is None
+    assert route("EXPORTS/2024/Orders.CSV") == ("Orders", 0)
+
+
+def test_router_routes_a_key_to_the_first_matching_pattern():
+    route = build_s3_key_router(
+        [r"raw/{table_name}/.*\.json", r".*\.json", r"curated/.*\.parquet"]
+    )
+    assert route("raw/orders/part-0.json") == ("orders", 0)
+    assert route("other/customers.json") == ("customers", 1)
+    assert route("curated/2024/items.parquet") == ("items", 2)
+    assert route("curated/2024/items.csv") is None
+
+
+def test_single_regex_string_is_a_single_pattern():
+    route = build_s3_key_router(r".*\.csv")
+    assert route("a/b.csv") == ("b", 0)
+    assert route("a/b.tsv") is None
+
+
+def test_listing_scope_of_a_prefix():
+    in_scope = build_listing_scope("exports/", r".*\.csv")
+    assert in_scope("exports/2024/orders.csv")
+    assert not in_scope("imports/2024/orders.csv")
+    assert not in_scope("exports/2024/orders.json")
+
+
+def test_listing_scope_of_shards():
+    in_scope = build_listing_scope(
+        "exports/", shard_prefixes=["exports/2023/", "exports/2024/"]
+    )
+    assert in_scope("exports/2024/orders.csv")
+    # outside of the shards, a key missing from the listing is not archived
+    assert not in_scope("exports/2022/orders.csv")
+
+
+def test_listing_scope_of_the_whole_bucket():
+    in_scope = build_listing_scope()
+    assert in_scope("orders.csv")
+    assert in_scope("exports/2024/orders.csv")
@@ -0,0 +1,43 @@
+from s3_operations import S3ListedObject
+from state_manifest import manifest_entry, manifest_status
+
+
+def listed_object(**fields):
+    return S3ListedObject(
+        **{
+            "key": "exports/orders.csv",
+            "table_name": "orders",
+            "e_tag": '"abc"',
+            "last_modified": "2024-01-01T00:00:00+00:00",
+            "size": 10,
+            **fields,
+        }
+    )
+
+
+def test_new_key_is_added():
+    assert manifest_status(listed_object(), None) == "added"
+
+
+def test_same_object_is_unchanged():
+    entry = manifest_entry(listed_object(), "guid", ["process-guid"])
+    assert manifest_status(listed_object(), entry) == "unchanged"
+
+
+def test_entry_without_pattern_index_matches_the_first_pattern():
+    entry = manifest_entry(listed_object(), "guid", [])
+    del entry["pattern_index"]
+    assert manifest_status(listed_object(), entry) == "unchanged"
+    assert manifest_status(listed_object(pattern_index=1), entry) == "changed"
+
+
+def test_changed_fields():
+    entry = manifest_entry(listed_object(), "guid", [])
+    for fields in (
+        {"e_tag": '"def"'},
+        {"last_modified": "2024-01-02T00:00:00+00:00"},
+        {"size": 11},
+        {"table_name": "customers"},
+        {"pattern_index": 2},
+    ):
+        assert manifest_status(listed_object(**fields), entry) == "changed", fields